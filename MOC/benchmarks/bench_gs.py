@@ -0,0 +1,171 @@
+ ##############################################################################
+ # @file           : bench_gs.py
+ # @brief          : End to end benchmarks of the websocket paths (radio
+ #                   configuration, send_command, file downloads and beacon
+ #                   listening) against the local GS service simulator, with
+ #                   the same regression tracking as bench_parsing.
+ #
+ #                   Run from the MOC directory:
+ #                   python3 -m benchmarks.bench_gs
+ ##############################################################################
+
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+from benchmarks.bench_parsing import measure, git_revision, load_previous, find_regressions, REGRESSION_THRESHOLD
+from layer_1.beacon_listener import BeaconListener
+from layer_1.client_apps.OBCClientApp import FP_API_OBC
+from layer_1.parsing.beacon_parser.realtime_beacon_parser import BeaconQuarantine
+from layer_1.web_socket_api.CommandProtocol import send_command
+from layer_1.web_socket_api.constants import SatelliteId, CommandType, TripType, ModuleMac, RadioConfiguration, EncyptionKey
+from layer_1.web_socket_api.RadioConfiguration import set_radio_address, update_frequency, update_aes_key
+from layer_1.web_socket_client.WebSocketClient import DEFAULT_CODEC
+from layer_1.metrics import MetricsRegistry
+from simulator.gs_service import GsServiceSimulator, Impairments, ObcFiles, BeaconSource
+
+# @var RESULTS_FILE Default file the results are appended to, one JSON object per run.
+
+RESULTS_FILE = os.path.join(os.path.dirname(__file__), "results_gs.jsonl")
+
+obc_api = FP_API_OBC()
+
+
+def fetch_file(name: str) -> bytes:
+    request = bytes(5) + f"{name}\0".encode("utf-8")
+    return send_command(SatelliteId.DEFAULT_ID, CommandType.OBC_FILE_DOWNLOAD, TripType.WAIT_FOR_RESPONSE,
+                        ModuleMac.OBC_MAC_ADDRESS, payload=request, add_payload_length=False)
+
+
+# @brief Listens until num_beacons beacons went through the parser.
+
+def listen_for(num_beacons: int):
+    running = threading.Event()
+    received = []
+
+    def on_message(labeled_data, received_at):
+        received.append(received_at)
+
+    listener = BeaconListener(running, on_message, metrics=MetricsRegistry(), quarantine=BeaconQuarantine(os.devnull))
+    original = listener.handle_frame
+
+    def handle_frame(decoded_frame, received_at):
+        original(decoded_frame, received_at)
+        if listener.stats.beacons_received >= num_beacons:
+            running.clear()
+
+    listener.handle_frame = handle_frame
+    running.set()
+    listener.run()
+    return listener.stats
+
+
+def build_benchmarks(simulator, num_uptime: int, num_beacons: int) -> list:
+    tlm_names = [name for name in simulator.files.files if name.endswith(".TLM")]
+    tlm_bytes = sum(len(simulator.files.files[name]) for name in tlm_names)
+
+    def radio_config():
+        set_radio_address(ModuleMac.UHF_MAC_ADDRESS)
+        update_frequency(RadioConfiguration.UHF_UPLINK_FREQUENCY, RadioConfiguration.UHF_DOWNLINK_FREQUENCY)
+        update_aes_key(EncyptionKey.AES_IV, EncyptionKey.AES_KEY)
+
+    def uptime():
+        response = send_command(SatelliteId.DEFAULT_ID, CommandType.OBC_FP_GATEWAY, TripType.WAIT_FOR_RESPONSE,
+                                ModuleMac.OBC_MAC_ADDRESS, payload=bytes(obc_api.req_getUptime()))
+        obc_api.resp_getUptime(response)
+
+    def download_dirlist():
+        fetch_file("DIRLIST.TXT")
+
+    def download_tlm_files():
+        for name in tlm_names:
+            if fetch_file(name) is None:
+                raise RuntimeError(f"Download of {name} failed")
+
+    def beacon_listen():
+        listen_for(num_beacons)
+
+    return [
+        ("gs_radio_config", radio_config, 5, "3 radio messages"),
+        ("gs_uptime", uptime, num_uptime, "round trip"),
+        ("gs_download_dirlist", download_dirlist, 5, "download"),
+        ("gs_download_tlm", download_tlm_files, 1, f"{len(tlm_names)} files, {tlm_bytes} bytes"),
+        ("gs_beacon_listen", beacon_listen, 1, f"{num_beacons} beacons"),
+    ]
+
+
+def run(simulator, num_uptime: int, num_beacons: int, repeat: int, only=None) -> dict:
+    results = {}
+    for name, func, number, unit in build_benchmarks(simulator, num_uptime, num_beacons):
+        if only and name not in only:
+            continue
+        timings = measure(func, number, repeat)
+        results[name] = {
+            "median_us": statistics.median(timings),
+            "min_us": min(timings),
+            "unit": unit,
+        }
+        print(f"{name:<28} median {results[name]['median_us']:>12.1f} us | min {results[name]['min_us']:>12.1f} us | per {unit}")
+    return results
+
+
+def main(argv=None) -> int:
+    arg_parser = argparse.ArgumentParser(description="Benchmark the websocket paths against the GS service simulator")
+    arg_parser.add_argument("--rtt", type=float, default=0.0, help="simulated round trip time in seconds")
+    arg_parser.add_argument("--bandwidth", type=float, help="simulated link bandwidth in bytes per second")
+    arg_parser.add_argument("--tlm-files", type=int, default=5, help="synthetic .TLM files to download")
+    arg_parser.add_argument("--tlm-messages", type=int, default=500, help="messages per synthetic .TLM file")
+    arg_parser.add_argument("--uptime", type=int, default=20, help="uptime round trips per repeat")
+    arg_parser.add_argument("--beacons", type=int, default=2000, help="beacons per listening run")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="timed repeats per benchmark")
+    arg_parser.add_argument("--only", nargs="*", help="only run the named benchmarks")
+    arg_parser.add_argument("--output", default=RESULTS_FILE, help="file results are appended to")
+    arg_parser.add_argument("--no-record", action="store_true", help="do not append the results")
+    arg_parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                            help="relative slowdown reported as a regression")
+    arg_parser.add_argument("--fail-on-regression", action="store_true", help="exit with 1 if anything regressed")
+    args = arg_parser.parse_args(argv)
+
+    params = {"rtt": args.rtt, "bandwidth": args.bandwidth, "tlm_files": args.tlm_files,
+              "tlm_messages": args.tlm_messages, "uptime": args.uptime, "beacons": args.beacons}
+    simulator = GsServiceSimulator(files=ObcFiles.synthetic(args.tlm_files, args.tlm_messages),
+                                   beacons=BeaconSource.synthetic(), beacon_interval=0,
+                                   impairments=Impairments(rtt=args.rtt, bandwidth=args.bandwidth))
+    with simulator:
+        results = run(simulator, args.uptime, args.beacons, args.repeat, args.only)
+    print(simulator.stats)
+
+    record = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "git_rev": git_revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "codec": DEFAULT_CODEC.name,
+        "params": params,
+        "results": results,
+    }
+
+    regressions = []
+    previous = load_previous(args.output, params)
+    if previous is not None:
+        regressions = find_regressions(previous, results, args.threshold)
+        print(f"\nCompared with {previous['git_rev']} ({previous['date']}):")
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before:.1f} us -> {after:.1f} us ({(after / before - 1) * 100:+.0f}%)")
+        if not regressions:
+            print("no regressions")
+
+    if not args.no_record:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,332 @@
+ ##############################################################################
+ # @file           : bench_parsing.py
+ # @brief          : Benchmarks the telemetry and beacon parsing hot paths on
+ #                   synthetic data and records the results to track
+ #                   regressions between revisions.
+ #
+ #                   Run from the MOC directory:
+ #                   python3 -m benchmarks.bench_parsing
+ ##############################################################################
+
+
+import argparse
+import base64
+import contextlib
+import datetime
+import gc
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from queue import Queue
+from benchmarks import synthetic
+from layer_1.parsing.telemetry_parser.dependencies import es_crc, cobs, datacache
+from layer_1.parsing.telemetry_parser.telemetry_parser import NUM_TASKS, TelemetryFile, TelemetryMsg, Unpacker
+from layer_1.parsing.dc_schema import DC_SCHEMAS
+from layer_1.parsing.beacon_parser.realtime_beacon_parser import (Beacon, BeaconMsg, BeaconMsgHeader, Beacon_Parser,
+                                                                   BinaryFrameReader, encode_frames, FRAMING_LENGTH,
+                                                                   FRAMING_COBS)
+from layer_1.web_socket_client.WebSocketClient import DEFAULT_CODEC
+
+# @var RESULTS_FILE Default file the results are appended to, one JSON object per run.
+
+RESULTS_FILE = os.path.join(os.path.dirname(__file__), "results.jsonl")
+
+# @var REGRESSION_THRESHOLD Relative slowdown of the fastest repeat that is reported as a regression.
+
+REGRESSION_THRESHOLD = 0.10
+
+
+# @brief Times a callable.
+#
+# @details Runs func number times per repeat and returns the per call time of
+#          every repeat in microseconds. The first run is a warm up and is dropped.
+
+def measure(func, number: int, repeat: int) -> list:
+    func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number * 1e6)
+    return timings
+
+
+# @brief Measures the memory a callable allocates.
+#
+# @details Traced with tracemalloc, after measure() so that caches are already warm.
+#          What func returns is kept alive until the end, so a benchmark returning
+#          its parsed objects (e.g. tlm_file_parse) shows what they hold.
+#
+# @return (peak KiB, KiB still allocated at the end, number of blocks still allocated).
+
+def measure_memory(func) -> tuple:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func()
+        current, peak = tracemalloc.get_traced_memory()
+        blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak / 1024, current / 1024, blocks
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# @brief Returns the dc_ids whose beacon messages can be labeled without raising.
+
+def labelable_dc_ids(rng: random.Random) -> list:
+    dc_ids = []
+    for dc_id in synthetic.DC_IDS:
+        msg = BeaconMsg()
+        msg.header.dc_id = BeaconMsgHeader.dc_entries_dict[dc_id]
+        msg.data = synthetic.random_payload(rng, dc_id)
+        try:
+            msg.label()
+        except Exception as exc:
+            print(f"Skipping beacon label for {msg.header.dc_id}: {exc!r}")
+            continue
+        dc_ids.append(dc_id)
+    return dc_ids
+
+
+# @brief Builds every benchmark.
+#
+# @return A list of (name, func, number, unit) tuples. unit says what one call of
+#         func processes, so results can be compared per message or per file.
+
+def build_benchmarks(tlm_path: str, num_messages: int, num_beacon_messages: int) -> list:
+    rng = random.Random(0)
+
+    # Telemetry building blocks, one message per datacache id
+    payloads = {dc_id: synthetic.random_payload(rng, dc_id) for dc_id in synthetic.DC_IDS}
+    framed = [synthetic.tlm_message(1735689600, 1, dc_id, data) for dc_id, data in payloads.items()]
+    decoded = [cobs.decode(list(frame)) for frame in framed]
+    parser = datacache.dc_parser(NUM_TASKS)
+
+    def crc():
+        for frame in decoded:
+            es_crc.crc_util.crc16(frame[:-TelemetryMsg.CRC_SIZE])
+
+    def cobs_decode():
+        for frame in framed:
+            cobs.decode(list(frame))
+
+    def datacache_decode():
+        for dc_id, data in payloads.items():
+            parser.parse_by_id(dc_id, data)
+
+    def dc_schema_decode():
+        for dc_id, data in payloads.items():
+            DC_SCHEMAS[dc_id].decode_tlm(data, NUM_TASKS)
+
+    def tlm_msg_parse():
+        for frame in decoded:
+            TelemetryMsg(0).parse(frame)
+
+    # Whole files
+    def parse_file():
+        with contextlib.redirect_stdout(io.StringIO()):
+            tlm_file = TelemetryFile(tlm_path)
+            tlm_file.parse_file()
+        return tlm_file
+
+    msglist = parse_file().msglist
+
+    def unpacker():
+        Unpacker(msglist, tlm_path).generate_json_data()
+
+    def tlm_end_to_end():
+        tlm_file = parse_file()
+        Unpacker(tlm_file.msglist, tlm_file.fname).generate_json_data()
+
+    def tlm_stream_batches():
+        with contextlib.redirect_stdout(io.StringIO()):
+            tlm_file = TelemetryFile(tlm_path)
+            for _ in Unpacker(tlm_file.iter_messages(), tlm_file.fname).iter_json_batches():
+                pass
+
+    # Beacons
+    beacons = synthetic.beacon_stream(num_beacon_messages, seed=1, dc_ids=labelable_dc_ids(rng))
+    reassembled = Beacon_Parser(Queue())
+    for data in beacons:
+        reassembled.parse_beacon(data)
+    beacon_msgs = reassembled.cmplt_msg_list
+
+    def beacon_parse():
+        parsed = []
+        for data in beacons:
+            beacon = Beacon(data)
+            beacon.parse()
+            parsed.append(beacon)
+        return parsed
+
+    def beacon_label():
+        for msg in beacon_msgs:
+            msg.label()
+
+    def beacon_end_to_end():
+        beacon_queue = Queue()
+        beacon_parser = Beacon_Parser(beacon_queue)
+        for data in beacons:
+            beacon_parser.parse_beacon(data)
+            while not beacon_queue.empty():
+                beacon_queue.get()
+
+    # Binary beacon captures, as read from a subprocess pipe by execute_binary()
+    framed_streams = {framing: encode_frames(beacons, framing) for framing in (FRAMING_LENGTH, FRAMING_COBS)}
+
+    def frame_read(framing):
+        def read():
+            for _ in BinaryFrameReader(io.BytesIO(framed_streams[framing]), framing).frames():
+                pass
+        return read
+
+    # JSON codec on a Beacon response as sent by GSService
+    response = DEFAULT_CODEC.dumps({"type": "Beacon", "requestId": 1234,
+                                    "ax25Frame": base64.b64encode(beacons[0]).decode("ascii")})
+
+    def codec_decode():
+        DEFAULT_CODEC.loads(response)
+
+    def beacon_frame_decode():
+        base64.b64decode(DEFAULT_CODEC.loads(response)["ax25Frame"])
+
+    n_dc = len(synthetic.DC_IDS)
+    return [
+        ("crc16", crc, 20, f"{n_dc} messages"),
+        ("cobs_decode", cobs_decode, 20, f"{n_dc} messages"),
+        ("tlm_msg_parse", tlm_msg_parse, 20, f"{n_dc} messages"),
+        ("datacache_decode", datacache_decode, 50, f"{n_dc} messages"),
+        ("dc_schema_decode", dc_schema_decode, 50, f"{n_dc} messages"),
+        ("tlm_file_parse", parse_file, 1, f"file of {num_messages} messages"),
+        ("unpacker", unpacker, 1, f"{num_messages} messages"),
+        ("tlm_end_to_end", tlm_end_to_end, 1, f"file of {num_messages} messages"),
+        ("tlm_stream_batches", tlm_stream_batches, 1, f"file of {num_messages} messages"),
+        ("beacon_parse", beacon_parse, 5, f"{len(beacons)} beacons"),
+        ("beacon_label", beacon_label, 5, f"{len(beacon_msgs)} messages"),
+        ("beacon_end_to_end", beacon_end_to_end, 5, f"{len(beacons)} beacons"),
+        ("beacon_read_length_framed", frame_read(FRAMING_LENGTH), 5, f"{len(beacons)} beacons"),
+        ("beacon_read_cobs_framed", frame_read(FRAMING_COBS), 5, f"{len(beacons)} beacons"),
+        (f"codec_decode_{DEFAULT_CODEC.name}", codec_decode, 10000, "beacon response"),
+        ("beacon_frame_decode", beacon_frame_decode, 10000, "beacon response"),
+    ]
+
+
+def run(num_messages: int, num_beacon_messages: int, repeat: int, only=None) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tlm_path = synthetic.write_tlm_file(os.path.join(tmp_dir, "BENCH.TLM"), num_messages)
+        for name, func, number, unit in build_benchmarks(tlm_path, num_messages, num_beacon_messages):
+            if only and name not in only:
+                continue
+            timings = measure(func, number, repeat)
+            peak_kib, retained_kib, blocks = measure_memory(func)
+            results[name] = {
+                "median_us": statistics.median(timings),
+                "min_us": min(timings),
+                "peak_kib": peak_kib,
+                "retained_kib": retained_kib,
+                "blocks": blocks,
+                "unit": unit,
+            }
+            print(f"{name:<28} median {results[name]['median_us']:>12.1f} us | min {results[name]['min_us']:>12.1f} us | "
+                  f"peak {peak_kib:>9.1f} KiB | kept {retained_kib:>9.1f} KiB in {blocks:>7} blocks | per {unit}")
+    return results
+
+
+# @brief Reads the last recorded run made with the same parameters.
+
+def load_previous(path: str, params: dict):
+    if not os.path.exists(path):
+        return None
+
+    previous = None
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("params") == params:
+                previous = record
+    return previous
+
+
+# @brief Compares the medians with a previous run.
+#
+# @details The fastest repeat is compared rather than the median, it is the least
+#          affected by other load on the machine.
+#
+# @return A list of (name, previous_us, current_us) for every benchmark slower than threshold.
+
+def find_regressions(previous: dict, results: dict, threshold: float) -> list:
+    regressions = []
+    for name, result in results.items():
+        before = previous["results"].get(name)
+        if before and result["min_us"] > before["min_us"] * (1 + threshold):
+            regressions.append((name, before["min_us"], result["min_us"]))
+    return regressions
+
+
+def main(argv=None) -> int:
+    arg_parser = argparse.ArgumentParser(description="Benchmark the telemetry and beacon parsers on synthetic data")
+    arg_parser.add_argument("--messages", type=int, default=2000, help="messages in the synthetic .TLM file")
+    arg_parser.add_argument("--beacon-messages", type=int, default=2000, help="messages in the synthetic beacon stream")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="timed repeats per benchmark")
+    arg_parser.add_argument("--only", nargs="*", help="only run the named benchmarks")
+    arg_parser.add_argument("--output", default=RESULTS_FILE, help="file results are appended to")
+    arg_parser.add_argument("--no-record", action="store_true", help="do not append the results")
+    arg_parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                            help="relative slowdown reported as a regression")
+    arg_parser.add_argument("--fail-on-regression", action="store_true", help="exit with 1 if anything regressed")
+    args = arg_parser.parse_args(argv)
+
+    params = {"messages": args.messages, "beacon_messages": args.beacon_messages, "num_tasks": NUM_TASKS}
+    results = run(args.messages, args.beacon_messages, args.repeat, args.only)
+
+    record = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "git_rev": git_revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "codec": DEFAULT_CODEC.name,
+        "params": params,
+        "results": results,
+    }
+
+    regressions = []
+    previous = load_previous(args.output, params)
+    if previous is not None:
+        regressions = find_regressions(previous, results, args.threshold)
+        print(f"\nCompared with {previous['git_rev']} ({previous['date']}):")
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before:.1f} us -> {after:.1f} us ({(after / before - 1) * 100:+.0f}%)")
+        if not regressions:
+            print("no regressions")
+
+    if not args.no_record:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
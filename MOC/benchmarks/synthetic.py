@@ -0,0 +1,148 @@
+ ##############################################################################
+ # @file           : synthetic.py
+ # @brief          : Generates synthetic .TLM files and 77 byte beacons that
+ #                   the telemetry and beacon parsers accept, for benchmarks.
+ ##############################################################################
+
+
+import random
+import struct
+from layer_1.parsing.telemetry_parser.dependencies import es_crc, cobs
+from layer_1.parsing.telemetry_parser.telemetry_parser import NUM_TASKS, TelemetryFileHdr, TelemetryMsg
+from layer_1.parsing.dc_schema import DC_NAMES, DC_SCHEMAS
+from layer_1.parsing.beacon_parser.realtime_beacon_parser import Beacon, BeaconHeader, BeaconMsgHeader
+
+# @var TLM_SIGNATURE Signature written to the header of generated .TLM files.
+
+TLM_SIGNATURE = b"ESTLM\x00"
+
+# @var BEACON_PADDING dc_id the beacon parser treats as "Unknown", ends the beacon.
+
+BEACON_PADDING = 0xFF
+
+# @var DC_IDS Every datacache id known to both parsers.
+
+DC_IDS = tuple(DC_NAMES.keys())
+
+
+# @brief Returns the serialized size of a datacache entry.
+#
+# @param dc_id The datacache id.
+# @param num_tasks Number of TaskStats entries, as configured on the OBC.
+
+def dc_size(dc_id: int, num_tasks: int = NUM_TASKS) -> int:
+    return DC_SCHEMAS[dc_id].size(num_tasks)
+
+
+def random_payload(rng: random.Random, dc_id: int, num_tasks: int = NUM_TASKS) -> bytes:
+    return bytes(rng.getrandbits(8) for _ in range(dc_size(dc_id, num_tasks)))
+
+
+# @brief Builds one framed telemetry message: COBS(header + data + CRC16) + delimiter.
+
+def tlm_message(timestamp: int, rolling_cntr: int, msg_type: int, data: bytes,
+                obc_opmode: int = 1, tlm_data_status: int = 1) -> bytes:
+    body = struct.pack("<LBBHBH", timestamp, rolling_cntr % TelemetryMsg.MAX_TLM_ROLL_FRAME_CNT,
+                       obc_opmode, msg_type, tlm_data_status, len(data)) + data
+    body += struct.pack("<H", es_crc.crc_util.crc16(body))
+    return cobs.encode(body) + b"\0"
+
+
+def tlm_file_header(last_timestamp: int, next_write_offset: int, file_complete: bool = True, version: int = 1) -> bytes:
+    header = struct.pack("<6sLLL?", TLM_SIGNATURE, version, next_write_offset, last_timestamp, file_complete)
+    return header + struct.pack("<H", es_crc.crc_util.crc16(header))
+
+
+# @brief Generates the contents of a .TLM file.
+#
+# @details Messages cycle through dc_ids so every datacache id is covered as soon
+#          as num_messages >= len(dc_ids). Timestamps increase by one second per
+#          message starting at start_time.
+#
+# @param num_messages Number of telemetry messages in the file.
+# @param seed Seed for the payload bytes, the same seed always gives the same file.
+# @return The raw file contents.
+
+def tlm_file(num_messages: int, seed: int = 0, dc_ids=DC_IDS, start_time: int = 1735689600,
+             num_tasks: int = NUM_TASKS) -> bytes:
+    rng = random.Random(seed)
+    messages = bytearray()
+    for i in range(num_messages):
+        dc_id = dc_ids[i % len(dc_ids)]
+        messages += tlm_message(start_time + i, i + 1, dc_id, random_payload(rng, dc_id, num_tasks))
+
+    header = tlm_file_header(start_time + num_messages, TelemetryFileHdr.HDR_SIZE + len(messages))
+    return header + bytes(messages)
+
+
+def write_tlm_file(path: str, num_messages: int, seed: int = 0, **kwargs) -> str:
+    with open(path, "wb") as f:
+        f.write(tlm_file(num_messages, seed, **kwargs))
+    return path
+
+
+# @brief Packs (dc_id, data) messages into 77 byte beacons.
+#
+# @details Messages are laid out back to back. A message that does not fit the rest
+#          of a beacon is split: the beacon ends with its header and first part and
+#          every following beacon starts with a header for the same dc_id, whose
+#          msg_length is what is left of the message, carrying the next part. This
+#          is how Beacon_Parser expects split messages, which may span any number of
+#          beacons. Unused space is padded with 0xFF.
+#
+# @param messages Iterable of (dc_id, data) tuples, data at most 255 bytes.
+# @param first_number Consecutive number of the first beacon.
+# @return A list of 77 byte beacons.
+
+def pack_beacons(messages, first_number: int = 0) -> list:
+    hdr_size = BeaconMsgHeader.MSG_HEADER_SIZE
+    room = Beacon.BEACON_SIZE - BeaconHeader.HEADER_SIZE
+    beacons = []
+    body = bytearray()
+
+    def finish():
+        number = (first_number + len(beacons)) % BeaconHeader.CONSECUTIVE_NUMBER_MODULO
+        header = struct.pack("<BBBBBBB", number, 0x10, 0, 0x20, 1, 0, 0)
+        padding = bytes([BEACON_PADDING]) * (room - len(body))
+        beacons.append(header + bytes(body) + padding)
+        body.clear()
+
+    for dc_id, data in messages:
+        # The parser only looks for another header while more than a header is left
+        free = room - len(body) - hdr_size
+        if free <= 0:
+            finish()
+            free = room - hdr_size
+
+        if len(data) <= free:
+            body += struct.pack("<BBBB", dc_id, 0, 0, len(data)) + data
+            continue
+
+        body += struct.pack("<BBBB", dc_id, 0, 0, len(data)) + data[:free]
+        rest = data[free:]
+        while rest:
+            finish()
+            body += struct.pack("<BBBB", dc_id, 0, 0, len(rest)) + rest[:room - hdr_size]
+            rest = rest[room - hdr_size:]
+
+    if body:
+        finish()
+
+    return beacons
+
+
+# @brief Generates a stream of beacons carrying random datacache messages.
+#
+# @param num_messages Number of beacon messages to generate.
+# @param dc_ids The datacache ids to cycle through. Entries too large for a beacon are skipped.
+# @return A list of 77 byte beacons.
+
+def beacon_stream(num_messages: int, seed: int = 0, dc_ids=DC_IDS, num_tasks: int = NUM_TASKS) -> list:
+    rng = random.Random(seed)
+    max_len = Beacon.BEACON_SIZE - BeaconHeader.HEADER_SIZE - BeaconMsgHeader.MSG_HEADER_SIZE
+    dc_ids = [dc_id for dc_id in dc_ids if dc_size(dc_id, num_tasks) <= max_len]
+    messages = []
+    for i in range(num_messages):
+        dc_id = dc_ids[i % len(dc_ids)]
+        messages.append((dc_id, random_payload(rng, dc_id, num_tasks)))
+    return pack_beacons(messages)
@@ -0,0 +1,218 @@
+ ##############################################################################
+ # @file           : beacon_listener.py
+ # @brief          : Supervised beacon listener. Keeps a BeaconListen
+ #                   subscription open with SpaceComms, reconnecting with
+ #                   backoff when the socket drops, and tracks beacon gaps.
+ ##############################################################################
+
+import base64
+import logging
+import time
+from queue import Queue
+from layer_1.web_socket_api.CommandProtocol import next_message_id
+from layer_1.web_socket_client import WebSocketClient
+from layer_1.web_socket_client.WebSocketClient import WebSocketConnectionError, WebSocketTimeout
+from layer_1.parsing.beacon_parser.realtime_beacon_parser import Beacon_Parser, BeaconHeader, BeaconQuarantine
+from layer_1.metrics import REGISTRY
+
+# JSON Message BeaconListen
+BEACON_LISTEN = {
+    "id": 0,
+    "type": "BeaconListen"
+}
+
+
+# @brief Counters describing the health of a beacon listening session.
+#
+# @details beacon_gaps counts how many times the consecutive number jumped,
+#          beacons_missed how many beacons were skipped in total, duplicate_beacons
+#          how many repeated the number of the one before. malformed_frames
+#          counts frames that could not be decoded and were dropped. Latencies are
+#          measured from the frame coming off the socket until its parsed
+#          messages have been handed off, in seconds.
+
+class BeaconListenerStats:
+    def __init__(self):
+        self.beacons_received = 0
+        self.beacon_gaps = 0
+        self.beacons_missed = 0
+        self.duplicate_beacons = 0
+        self.reconnects = 0
+        self.error_responses = 0
+        self.malformed_frames = 0
+        self.disconnected_time = 0.0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+
+    def average_latency(self) -> float:
+        if self.beacons_received == 0:
+            return 0.0
+        return self.total_latency / self.beacons_received
+
+    def __str__(self):
+        return (f'BeaconListenerStats> received: {self.beacons_received} | gaps: {self.beacon_gaps} | '
+                f'missed: {self.beacons_missed} | duplicates: {self.duplicate_beacons} | reconnects: {self.reconnects} | errors: {self.error_responses} | '
+                f'malformed: {self.malformed_frames} | '
+                f'disconnected: {self.disconnected_time:.1f} s | latency avg/max: '
+                f'{self.average_latency() * 1000:.2f}/{self.max_latency * 1000:.2f} ms')
+
+
+# @brief Listens for beacons until told to stop, surviving dropped connections.
+#
+# @details While the running event is set, the listener opens a WebSocketClient,
+#          sends BeaconListen and parses every Beacon it receives. A lost socket or
+#          an Error response closes the client and reconnects after an exponential
+#          backoff, which is reset as soon as beacons flow again. Gaps in the beacon
+#          consecutive number are detected across reconnects as well. Every stage
+#          a frame goes through is timed into the metrics registry.
+#
+# @param running Event that is set while the listener should keep going.
+# @param on_message Called with the labeled data of every parsed beacon message and
+#                   the monotonic time its frame was received.
+# @param quarantine BeaconQuarantine that beacons with invalid message headers are
+#                   written to, defaults to the parser's side log.
+
+class BeaconListener:
+    def __init__(self, running, on_message, recv_timeout: float = 1.0,
+                 initial_backoff: float = 0.5, max_backoff: float = 10.0, metrics=REGISTRY, quarantine=None):
+        self.running = running
+        self.on_message = on_message
+        self.recv_timeout = recv_timeout
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.metrics = metrics
+        self.stats = BeaconListenerStats()
+        self.beacon_queue = Queue()
+        self.quarantine = quarantine if quarantine is not None else BeaconQuarantine()
+        self.beacon_parser = Beacon_Parser(self.beacon_queue, metrics=metrics, quarantine=self.quarantine)
+        self.last_consecutive_number = None
+        self.metrics.set_gauge("beacon_queue_depth", self.beacon_queue.qsize)
+
+    def run(self):
+        try:
+            self._run()
+        finally:
+            self.quarantine.close()
+
+    def _run(self):
+        backoff = self.initial_backoff
+        disconnected_since = None
+
+        while self.running.is_set():
+            try:
+                client = WebSocketClient.WebSocketClient(enableSSL=False, timeout=self.recv_timeout)
+            except WebSocketConnectionError as exc:
+                logging.warning("Beacon listener could not connect, retrying in %.1f s: %s", backoff, exc)
+                if disconnected_since is None:
+                    disconnected_since = time.monotonic()
+                self._sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            if disconnected_since is not None:
+                self.stats.disconnected_time += time.monotonic() - disconnected_since
+                self.stats.reconnects += 1
+                self.metrics.increment("beacon_reconnects")
+                disconnected_since = None
+
+            try:
+                listen_id = next_message_id()
+                client.send(payload_dict={**BEACON_LISTEN, "id": listen_id})
+                if self._listen(client, listen_id):
+                    backoff = self.initial_backoff
+            except WebSocketConnectionError as exc:
+                logging.warning("Beacon listener lost its connection: %s", exc)
+            finally:
+                client.close()
+
+            if self.running.is_set():
+                disconnected_since = time.monotonic()
+                self._sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    # Reads beacons from one connection. Returns True if any beacon was received,
+    # raises WebSocketConnectionError when the connection has to be reopened.
+    def _listen(self, client, listen_id) -> bool:
+        received_any = False
+
+        while self.running.is_set():
+            try:
+                frame = client.recvFrame()
+            except WebSocketTimeout:
+                continue
+            received_at = time.monotonic()
+
+            # A frame that does not decode is dropped, the connection is fine
+            try:
+                response = client.decode(frame)
+                if not isinstance(response, dict):
+                    raise TypeError(f"expected a JSON object, got {type(response).__name__}")
+                decoded_at = self.metrics.observe_since("json_decode", received_at)
+                if response.get("type") == "Beacon":
+                    decoded_frame = base64.b64decode(response["ax25Frame"])
+                    self.metrics.observe_since("base64", decoded_at)
+            except (ValueError, KeyError, TypeError) as exc:
+                self.stats.malformed_frames += 1
+                self.metrics.increment("beacon_malformed_frames")
+                logging.warning("Dropping malformed frame from SpaceComms: %r", exc)
+                continue
+
+            if response.get("type") == "Beacon":
+                if listen_id != response.get("requestId"):
+                    print("Mismatched ID's for beacon request")
+                self.handle_frame(decoded_frame, received_at)
+                received_any = True
+
+            elif response.get("type") == "Error":
+                self.stats.error_responses += 1
+                self.metrics.increment("beacon_error_responses")
+                logging.error("%s", response)
+                raise WebSocketConnectionError(f"Error response to BeaconListen: {response}")
+
+        return received_any
+
+    # Parses a single decoded beacon, hands its messages off and updates the stats
+    def handle_frame(self, decoded_frame: bytes, received_at: float):
+        beacon = self.beacon_parser.parse_beacon(decoded_frame)
+        while not self.beacon_queue.empty():
+            start = time.monotonic()
+            self.on_message(self.beacon_queue.get(), received_at)
+            self.metrics.observe_since("handoff", start)
+            self.metrics.increment("beacon_messages")
+
+        self.track_consecutive_number(beacon.beacon_header.beacon_consecutive_number)
+
+        latency = self.metrics.observe_since("socket_to_handoff", received_at) - received_at
+        self.metrics.increment("beacons_received")
+        self.stats.beacons_received += 1
+        self.stats.last_latency = latency
+        self.stats.total_latency += latency
+        self.stats.max_latency = max(self.stats.max_latency, latency)
+
+    # A repeated number (a retransmit, or the last beacon again after a reconnect) is a
+    # duplicate, not a gap of a whole counter cycle
+    def track_consecutive_number(self, number: int):
+        if number == self.last_consecutive_number:
+            self.stats.duplicate_beacons += 1
+            self.metrics.increment("beacon_duplicates")
+        elif self.last_consecutive_number is not None:
+            expected = (self.last_consecutive_number + 1) % BeaconHeader.CONSECUTIVE_NUMBER_MODULO
+            if number != expected:
+                missed = (number - expected) % BeaconHeader.CONSECUTIVE_NUMBER_MODULO
+                self.stats.beacon_gaps += 1
+                self.stats.beacons_missed += missed
+                self.metrics.increment("beacon_gaps")
+                self.metrics.increment("beacons_missed", missed)
+                logging.warning("Beacon gap: expected #%d, got #%d (%d missed)", expected, number, missed)
+
+        self.last_consecutive_number = number
+
+    # Sleeps for the given time, waking up early if the listener is stopped
+    def _sleep(self, seconds: float):
+        deadline = time.monotonic() + seconds
+        while self.running.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(0.1, remaining))
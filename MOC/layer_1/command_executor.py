@@ -0,0 +1,311 @@
+ ##############################################################################
+ # @file           : command_executor.py
+ # @brief          : Bounded worker pool for SpaceComms commands. Commands run
+ #                   as futures with progress and cancellation, limited per
+ #                   command type, and cancelling a command aborts the
+ #                   websocket it is waiting on.
+ ##############################################################################
+
+import logging
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import Future
+
+# @var CommandLimit How many commands of one type may run at once, and how many
+#      more may wait for a slot before new ones are rejected.
+
+CommandLimit = namedtuple("CommandLimit", ["concurrency", "queued"])
+
+DEFAULT_LIMIT = CommandLimit(1, 4)
+
+_current = threading.local()
+
+
+class CommandCancelled(Exception):
+    """The command was cancelled before or while it ran"""
+
+
+class CommandRejected(Exception):
+    """The command was not accepted, its queue is full or the executor is shut down"""
+
+
+# @brief Cancellation state of one command, shared with the websockets it opens.
+#
+# @details WebSocketClients opened while a command runs attach themselves to its
+#          token. cancel() aborts them, which wakes up a thread blocked in recv with
+#          a WebSocketConnectionError, and runs the registered callbacks, so the
+#          command stops at its next socket wait instead of its next timeout.
+
+class CancellationToken:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        self.clients = set()
+        self.callbacks = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self.event.is_set()
+
+    def cancel(self):
+        with self.lock:
+            if self.event.is_set():
+                return
+            self.event.set()
+            clients = list(self.clients)
+            callbacks = list(self.callbacks)
+
+        for client in clients:
+            try:
+                client.abort()
+            except Exception as exc:
+                logging.debug("Could not abort websocket: %s", exc)
+        for callback in callbacks:
+            callback()
+
+    # Runs callback on cancellation, right away if the token is already cancelled
+    def add_callback(self, callback):
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(callback)
+                return
+        callback()
+
+    def attach(self, client):
+        with self.lock:
+            if not self.event.is_set():
+                self.clients.add(client)
+                return
+        client.close()
+        raise CommandCancelled("Command cancelled")
+
+    def detach(self, client):
+        with self.lock:
+            self.clients.discard(client)
+
+    def check(self):
+        if self.event.is_set():
+            raise CommandCancelled("Command cancelled")
+
+    # Sleeps for the given time, raises CommandCancelled as soon as the token is cancelled
+    def sleep(self, seconds: float):
+        if self.event.wait(seconds):
+            raise CommandCancelled("Command cancelled")
+
+
+# @brief Future of a command submitted to a CommandExecutor.
+#
+# @details Behaves like a concurrent.futures.Future, except that cancel() also
+#          cancels a command that is already running. progress holds the last
+#          (done, total, message) reported by the command with report_progress().
+
+class CommandFuture(Future):
+    def __init__(self, command: str):
+        super().__init__()
+        self.command = command
+        self.token = CancellationToken()
+        self.progress = None
+        self.progress_callbacks = []
+
+    def cancel(self) -> bool:
+        if super().cancel():
+            return True
+        if self.done():
+            return False
+        self.token.cancel()
+        return True
+
+    def set_progress(self, done: int, total: int = None, message: str = ""):
+        self.progress = (done, total, message)
+        for callback in list(self.progress_callbacks):
+            try:
+                callback(self)
+            except Exception:
+                logging.exception("Progress callback of %s failed", self.command)
+
+    def add_progress_callback(self, callback):
+        self.progress_callbacks.append(callback)
+
+    def __repr__(self):
+        return f"<CommandFuture {self.command} {self._state.lower()} progress={self.progress}>"
+
+
+# @brief Returns the token of the command running on this thread, None outside of a command.
+
+def current_token():
+    future = getattr(_current, "future", None)
+    return future.token if future is not None else None
+
+
+# @brief Reports the progress of the command running on this thread, if any.
+
+def report_progress(done: int, total: int = None, message: str = ""):
+    future = getattr(_current, "future", None)
+    if future is not None:
+        future.set_progress(done, total, message)
+
+
+# @brief Sleeps for the given time, cut short with CommandCancelled if the current command is cancelled.
+
+def cancellable_sleep(seconds: float):
+    token = current_token()
+    if token is None:
+        time.sleep(seconds)
+    else:
+        token.sleep(seconds)
+
+
+# @brief Runs commands on a fixed number of reused worker threads.
+#
+# @details At most max_workers commands run at once, and at most limits[command]
+#          .concurrency of each type. A command over its type's limit waits in that
+#          type's queue, one over limits[command].queued is rejected: its future
+#          fails with CommandRejected. Worker threads are daemons started on demand
+#          and reused, so repeated commands never add threads, and shutdown() gives
+#          up on a stuck command after its timeout instead of hanging.
+#
+# @param max_workers Number of worker threads.
+# @param limits Dict of command name to CommandLimit, DEFAULT_LIMIT for the others.
+
+class CommandExecutor:
+    def __init__(self, max_workers: int = 4, limits: dict = None, default_limit: CommandLimit = DEFAULT_LIMIT):
+        self.max_workers = max_workers
+        self.limits = dict(limits or {})
+        self.default_limit = default_limit
+        self.lock = threading.Lock()
+        self.work_available = threading.Condition(self.lock)
+        self.ready = deque()
+        self.idle = 0
+        self.workers = []
+        self.active = {}
+        self.waiting = {}
+        self.futures = set()
+        self.closed = False
+
+    def limit(self, command: str) -> CommandLimit:
+        return self.limits.get(command, self.default_limit)
+
+    # @brief Submits a command, returns its CommandFuture.
+    #
+    # @param command Name of the command, the key of its limits.
+    # @param fn Callable running the command, its return value is the future's result.
+
+    def submit(self, command: str, fn, *args, **kwargs) -> CommandFuture:
+        future = CommandFuture(command)
+        work = (future, fn, args, kwargs)
+        limit = self.limit(command)
+
+        with self.lock:
+            if self.closed:
+                future.set_exception(CommandRejected("Executor is shut down"))
+                return future
+
+            waiting = self.waiting.setdefault(command, deque())
+            if self.active.get(command, 0) < limit.concurrency:
+                self.active[command] = self.active.get(command, 0) + 1
+                self._start(work)
+            elif sum(not queued[0].cancelled() for queued in waiting) < limit.queued:
+                waiting.append(work)
+            else:
+                future.set_exception(CommandRejected(f"{command} already running with "
+                                                     f"{len(waiting)} queued"))
+                return future
+
+            self.futures.add(future)
+
+        future.add_done_callback(self._forget)
+        return future
+
+    # Hands work to an idle worker, or to a new one while under max_workers. Called with the lock held.
+    def _start(self, work):
+        self.ready.append(work)
+        if self.idle >= len(self.ready):
+            self.work_available.notify()
+        elif len(self.workers) < self.max_workers:
+            worker = threading.Thread(target=self._work, name=f"command-worker-{len(self.workers)}", daemon=True)
+            self.workers.append(worker)
+            worker.start()
+
+    def _forget(self, future):
+        with self.lock:
+            self.futures.discard(future)
+
+    def _work(self):
+        while True:
+            with self.lock:
+                while not self.ready:
+                    if self.closed:
+                        return
+                    self.idle += 1
+                    self.work_available.wait()
+                    self.idle -= 1
+                future, fn, args, kwargs = self.ready.popleft()
+
+            if future.set_running_or_notify_cancel():
+                self._run(future, fn, args, kwargs)
+            self._finished(future.command)
+
+    def _run(self, future, fn, args, kwargs):
+        _current.future = future
+        try:
+            future.token.check()
+            result = fn(*args, **kwargs)
+        except Exception as exc:
+            if future.token.cancelled and not isinstance(exc, CommandCancelled):
+                cancelled = CommandCancelled(f"{future.command} cancelled")
+                cancelled.__cause__ = exc
+                exc = cancelled
+            future.set_exception(exc)
+        else:
+            if future.token.cancelled:
+                future.set_exception(CommandCancelled(f"{future.command} cancelled"))
+            else:
+                future.set_result(result)
+        finally:
+            _current.future = None
+
+    # Starts the next queued command of the same type, or frees its slot
+    def _finished(self, command: str):
+        with self.lock:
+            waiting = self.waiting.get(command)
+            while waiting:
+                work = waiting.popleft()
+                if not work[0].cancelled():
+                    self._start(work)
+                    return
+            self.active[command] -= 1
+
+    def running_count(self) -> int:
+        return sum(future.running() for future in self.pending())
+
+    def queued_count(self) -> int:
+        return sum(not future.running() for future in self.pending())
+
+    def pending(self) -> list:
+        with self.lock:
+            return list(self.futures)
+
+    # @brief Cancels every command and stops the workers.
+    #
+    # @details Queued commands are cancelled, running ones have their websockets
+    #          aborted. Waits at most timeout seconds in total for the workers.
+    #
+    # @return The futures of the commands still running after the timeout.
+
+    def shutdown(self, timeout: float = 10.0) -> list:
+        with self.lock:
+            self.closed = True
+            futures = list(self.futures)
+            for waiting in self.waiting.values():
+                waiting.clear()
+            workers = list(self.workers)
+            self.work_available.notify_all()
+
+        for future in futures:
+            future.cancel()
+
+        deadline = time.monotonic() + timeout
+        for worker in workers:
+            worker.join(max(0.0, deadline - time.monotonic()))
+        return [future for future in futures if not future.done()]
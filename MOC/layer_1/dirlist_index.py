@@ -0,0 +1,196 @@
+ ##############################################################################
+ # @file           : dirlist_index.py
+ # @brief          : Structured index of the OBC's DIRLIST.TXT. Every listing
+ #                   is parsed once into name, size, kind and number, diffed
+ #                   against the previous one (new, grown, shrunk and removed
+ #                   files) and persisted between passes. Files are selected
+ #                   with DirlistIndex.files() instead of regexes.
+ ##############################################################################
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+
+# @var DEFAULT_INDEX_PATH Where the index is kept between passes.
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(__file__), "downloaded_files", "dirlist_index.json")
+
+KIND_TLM = "TLM"
+KIND_INSTRUMENT = "instrument"
+KIND_OTHER = "other"
+
+INSTRUMENT_EXTENSIONS = ("IHK", "PMT", "ERP")
+
+SIZE_UNITS = {"B": 1, "KB": 1 << 10, "MB": 1 << 20, "GB": 1 << 30}
+DIRLIST_ENTRY = re.compile(r"^\s*(\S+)\s+(\d+)\s*(B|KB|MB|GB)\s*$")
+
+# @var DirEntry A listed file.
+#      size is in bytes, rounded down to the unit of the listing for files listed in KB or MB.
+#      number is the numeric stem (00012.IHK -> 12), None for other names.
+#      The listing has no dates: first_seen is the Unix time the file first appeared in a
+#      listing, changed the time its size last changed.
+#      position is its line in the latest listing, later lines being newer files.
+
+DirEntry = namedtuple("DirEntry", ["name", "size", "kind", "number", "first_seen", "changed", "position"])
+
+
+def file_kind(name: str) -> str:
+    stem, _, extension = name.upper().rpartition(".")
+    if extension == "TLM" and stem.isdigit():
+        return KIND_TLM
+    if extension in INSTRUMENT_EXTENSIONS and stem.isdigit():
+        return KIND_INSTRUMENT
+    return KIND_OTHER
+
+
+def file_number(name: str):
+    stem = name.rpartition(".")[0]
+    return int(stem) if stem.isdigit() else None
+
+
+# @brief Reads the (name, size in bytes) of every file in a DIRLIST.TXT listing.
+#
+# @param lines Lines of the listing, e.g. an open file.
+
+def parse_dirlist(lines):
+    for line in lines:
+        match = DIRLIST_ENTRY.match(line)
+        if match and match.group(1) != "DIRLIST.TXT":
+            name, size, unit = match.groups()
+            yield name, int(size) * SIZE_UNITS[unit]
+
+
+# @brief Difference between two listings.
+
+class DirlistDiff:
+    def __init__(self, new=(), grown=(), shrunk=(), removed=()):
+        self.new = list(new)
+        self.grown = list(grown)
+        self.shrunk = list(shrunk)
+        self.removed = list(removed)
+
+    # @brief Files that have data not seen in the previous listing.
+    @property
+    def changed(self) -> list:
+        return self.new + self.grown + self.shrunk
+
+    def __bool__(self):
+        return bool(self.new or self.grown or self.shrunk or self.removed)
+
+    def __str__(self):
+        return (f'DirlistDiff> new: {len(self.new)} | grown: {len(self.grown)} | shrunk: {len(self.shrunk)} | '
+                f'removed: {len(self.removed)}')
+
+
+# @brief Persisted index of the files on the OBC.
+#
+# @details update() replaces the index with a new listing and returns how it differs
+#          from the previous one. Entries keep their first_seen time across updates.
+#          The index is saved as JSON after every update.
+#
+# @param path File the index is loaded from and saved to, None to keep it in memory.
+
+class DirlistIndex:
+    def __init__(self, path: str = DEFAULT_INDEX_PATH):
+        self.path = path
+        self.entries = {}
+        self.updated = None
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (OSError, ValueError) as exc:
+            logging.warning("Could not read DIRLIST index %s: %s", self.path, exc)
+            return
+        self.updated = state.get("updated")
+        self.entries = {entry[0]: DirEntry(*entry) for entry in state.get("entries", [])}
+
+    def save(self):
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"updated": self.updated, "entries": [list(entry) for entry in self.entries.values()]}, f)
+        os.replace(temp_path, self.path)
+
+    # @brief Indexes a new listing.
+    #
+    # @param lines Lines of DIRLIST.TXT.
+    # @param now Unix time of the listing, defaults to the current time.
+    # @return The DirlistDiff against the previous listing.
+
+    def update(self, lines, now: float = None) -> DirlistDiff:
+        now = time.time() if now is None else now
+        with self.lock:
+            previous = self.entries
+            entries = {}
+            diff = DirlistDiff()
+            for position, (name, size) in enumerate(parse_dirlist(lines)):
+                old = previous.get(name)
+                if old is None:
+                    entry = DirEntry(name, size, file_kind(name), file_number(name), now, now, position)
+                    diff.new.append(entry)
+                elif old.size != size:
+                    entry = old._replace(size=size, changed=now, position=position)
+                    (diff.grown if size > old.size else diff.shrunk).append(entry)
+                else:
+                    entry = old._replace(position=position)
+                entries[name] = entry
+            diff.removed = [entry for name, entry in previous.items() if name not in entries]
+
+            self.entries = entries
+            self.updated = now
+            self.save()
+        return diff
+
+    # @brief Indexes a downloaded DIRLIST.TXT.
+    def update_from_file(self, path: str, now: float = None) -> DirlistDiff:
+        with open(path, "r", encoding="ISO-8859-1") as file:
+            return self.update(file, now)
+
+    def get(self, name: str):
+        return self.entries.get(name)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries.values())
+
+    # @brief Selects files, in listing order.
+    #
+    # @param kind KIND_TLM, KIND_INSTRUMENT, KIND_OTHER or None for any.
+    # @param extensions Iterable of extensions to keep (e.g. ("IHK", "PMT")), None for any.
+    # @param numbers Container of file numbers to keep (e.g. range(0, 49)), None for any.
+    # @param min_size Smallest size in bytes to keep.
+    # @param changed_since Only files that appeared or changed size at or after this Unix time.
+    # @return A list of DirEntry.
+
+    def files(self, kind: str = None, extensions=None, numbers=None, min_size: int = 0,
+              changed_since: float = None) -> list:
+        extensions = {extension.upper() for extension in extensions} if extensions is not None else None
+        selected = []
+        for entry in self.entries.values():
+            if kind is not None and entry.kind != kind:
+                continue
+            if extensions is not None and entry.name.rpartition(".")[2].upper() not in extensions:
+                continue
+            if numbers is not None and entry.number not in numbers:
+                continue
+            if entry.size < min_size:
+                continue
+            if changed_since is not None and entry.changed < changed_since:
+                continue
+            selected.append(entry)
+        selected.sort(key=lambda entry: entry.position)
+        return selected
@@ -0,0 +1,235 @@
+ ##############################################################################
+ # @file           : download_planner.py
+ # @brief          : Plans which OBC files to download in the time left in a
+ #                   pass. Transfer times are estimated from the DIRLIST sizes
+ #                   and the measured throughput of recent downloads, files
+ #                   are ordered by priority and whatever does not fit is kept
+ #                   in a persisted backlog for the next pass.
+ ##############################################################################
+
+import json
+import logging
+import os
+import threading
+from layer_1.dirlist_index import DirEntry, KIND_TLM, KIND_INSTRUMENT
+from layer_1.parsing.dc_schema import DC_NAMES
+
+# @var DEFAULT_STATE_PATH Where the throughput estimate, backlog and file history are kept between passes.
+
+DEFAULT_STATE_PATH = os.path.join(os.path.dirname(__file__), "downloaded_files", "download_planner.json")
+
+# @var DEFAULT_THROUGHPUT Bytes per second assumed before any download was measured.
+# @var DEFAULT_OVERHEAD Seconds per file on top of the transfer itself (command round trip).
+# @var TRANSFER_WINDOW Number of most recent downloads the estimate is fitted to.
+
+DEFAULT_THROUGHPUT = 1000.0
+DEFAULT_OVERHEAD = 2.0
+TRANSFER_WINDOW = 32
+
+
+# @brief What to download first.
+#
+# @param kinds File kinds in order of preference, kinds not listed are not downloaded.
+# @param newest_first Prefer higher file numbers (later in the listing for other names).
+# @param dc_ids Prefer files known to hold many messages of these datacache entries, given
+#        by id or name, see DownloadPlanner.record_contents().
+# @param backlog_first Prefer files deferred from earlier passes.
+
+class Priority:
+    def __init__(self, kinds=(KIND_TLM, KIND_INSTRUMENT), newest_first: bool = True, dc_ids=(),
+                 backlog_first: bool = True):
+        self.kinds = tuple(kinds)
+        self.newest_first = newest_first
+        self.dc_ids = frozenset(DC_NAMES.get(dc_id, dc_id) for dc_id in dc_ids)
+        self.backlog_first = backlog_first
+
+
+# @brief Files chosen for a pass, in download order, and the ones deferred.
+
+class DownloadPlan:
+    def __init__(self, budget, selected, deferred, estimates):
+        self.budget = budget
+        self.selected = selected
+        self.deferred = deferred
+        self.estimates = estimates
+
+    @property
+    def estimated_time(self) -> float:
+        return sum(self.estimates[entry.name] for entry in self.selected)
+
+    @property
+    def estimated_bytes(self) -> int:
+        return sum(entry.size for entry in self.selected)
+
+    def __str__(self):
+        budget = f"{self.budget:.0f} s" if self.budget is not None else "unlimited"
+        return (f'DownloadPlan> budget: {budget} | selected: {len(self.selected)} files, {self.estimated_bytes} B, '
+                f'~{self.estimated_time:.0f} s | deferred: {len(self.deferred)} files, '
+                f'{sum(entry.size for entry in self.deferred)} B')
+
+
+# @brief Plans downloads and learns the link throughput across passes.
+#
+# @details Transfer time is estimated as overhead + size / throughput, fitted by
+#          least squares to the last TRANSFER_WINDOW downloads recorded with
+#          record_transfer(), so it follows the link of the current passes. plan() walks
+#          the files in priority order and takes every one that still fits in the
+#          budget, so a large file that does not fit does not stop smaller ones
+#          behind it. Files already downloaded at their listed size are skipped,
+#          grown ones are downloaded again. The state is saved as JSON.
+#
+# @param state_path File the state is loaded from and saved to, None to keep it in memory.
+
+class DownloadPlanner:
+    def __init__(self, state_path: str = DEFAULT_STATE_PATH):
+        self.state_path = state_path
+        self.throughput = DEFAULT_THROUGHPUT
+        self.overhead = DEFAULT_OVERHEAD
+        self.samples = []
+        self.backlog = []
+        self.downloaded = {}
+        self.contents = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if self.state_path is None or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError) as exc:
+            logging.warning("Could not read download planner state %s: %s", self.state_path, exc)
+            return
+
+        self.samples = state.get("samples", [])
+        self.fit()
+        self.backlog = state.get("backlog", [])
+        self.downloaded = state.get("downloaded", {})
+        self.contents = state.get("contents", {})
+
+    def save(self):
+        if self.state_path is None:
+            return
+        state = {
+            "throughput": self.throughput,
+            "overhead": self.overhead,
+            "samples": self.samples,
+            "backlog": self.backlog,
+            "downloaded": self.downloaded,
+            "contents": self.contents,
+        }
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        temp_path = self.state_path + ".tmp"
+        with self.lock:
+            with open(temp_path, "w") as f:
+                json.dump(state, f, indent=1)
+            os.replace(temp_path, self.state_path)
+
+    def estimate(self, size: int) -> float:
+        return self.overhead + size / self.throughput
+
+    # @brief Updates the throughput estimate with a finished download.
+    #
+    # @param seconds Time the successful attempt took.
+    # @param ok False if the download failed, the file stays in the backlog.
+
+    def record_transfer(self, name: str, size: int, seconds: float, ok: bool = True):
+        if not ok:
+            return
+        self.downloaded[name] = size
+        if name in self.backlog:
+            self.backlog.remove(name)
+        self.record_sample(size, seconds)
+
+    # @brief Adds a timed transfer that is not a planned file, e.g. DIRLIST.TXT.
+    def record_sample(self, size: int, seconds: float):
+        self.samples.append([size, seconds])
+        del self.samples[:-TRANSFER_WINDOW]
+        self.fit()
+
+    # Fits seconds = overhead + size / throughput to the samples
+    def fit(self):
+        self.throughput = DEFAULT_THROUGHPUT
+        self.overhead = DEFAULT_OVERHEAD
+        if not self.samples:
+            return
+
+        count = len(self.samples)
+        mean_size = sum(size for size, _ in self.samples) / count
+        mean_time = sum(seconds for _, seconds in self.samples) / count
+        variance = sum((size - mean_size) ** 2 for size, _ in self.samples)
+        covariance = sum((size - mean_size) * (seconds - mean_time) for size, seconds in self.samples)
+
+        if variance > 0 and covariance > 0:
+            slope = covariance / variance
+            self.overhead = max(0.0, mean_time - slope * mean_size)
+            self.throughput = 1 / slope
+        else:
+            # Too few distinct sizes to tell overhead from transfer time, keep the overhead
+            self.overhead = min(self.overhead, mean_time)
+            if mean_size > 0 and mean_time > self.overhead:
+                self.throughput = mean_size / (mean_time - self.overhead)
+
+    # @brief Remembers how many messages of each datacache entry (by name) a downloaded .TLM file held.
+    def record_contents(self, name: str, dc_counts: dict):
+        with self.lock:
+            self.contents[name] = dict(dc_counts)
+
+    # Share of a file's messages that are of the preferred dc_ids, the average over known files if unknown
+    def dc_share(self, name: str, dc_ids) -> float:
+        def share(counts):
+            total = sum(counts.values())
+            return sum(counts.get(dc_id, 0) for dc_id in dc_ids) / total if total else 0.0
+
+        if name in self.contents:
+            return share(self.contents[name])
+        if not self.contents:
+            return 0.0
+        return sum(share(counts) for counts in self.contents.values()) / len(self.contents)
+
+    def sort_key(self, entry: DirEntry, priority: Priority):
+        age = -entry.number if entry.number is not None else -entry.position
+        return (
+            priority.kinds.index(entry.kind),
+            -(priority.backlog_first and entry.name in self.backlog),
+            -self.dc_share(entry.name, priority.dc_ids) if priority.dc_ids else 0.0,
+            age if priority.newest_first else -age,
+        )
+
+    # @brief Chooses the files to download in the given time.
+    #
+    # @param entries DirEntry list, e.g. from DirlistIndex.files().
+    # @param budget Seconds left in the pass, None for no limit.
+    # @param priority Priority, newest TLM files first by default.
+    # @return A DownloadPlan. The deferred files become the backlog, call save() to persist it.
+
+    def plan(self, entries, budget: float = None, priority: Priority = None) -> DownloadPlan:
+        priority = priority if priority is not None else Priority()
+        listed = {entry.name for entry in entries}
+        self.backlog = [name for name in self.backlog if name in listed]
+        wanted = [entry for entry in entries
+                  if entry.kind in priority.kinds and self.downloaded.get(entry.name) != entry.size]
+        wanted.sort(key=lambda entry: self.sort_key(entry, priority))
+
+        estimates = {entry.name: self.estimate(entry.size) for entry in wanted}
+        selected = []
+        deferred = []
+        remaining = budget
+        for entry in wanted:
+            if remaining is None or estimates[entry.name] <= remaining:
+                selected.append(entry)
+                if remaining is not None:
+                    remaining -= estimates[entry.name]
+            else:
+                deferred.append(entry)
+
+        self.defer(deferred)
+        return DownloadPlan(budget, selected, deferred, estimates)
+
+    # @brief Adds files to the backlog of the next pass.
+    def defer(self, entries):
+        for entry in entries:
+            name = entry if isinstance(entry, str) else entry.name
+            if name not in self.backlog:
+                self.backlog.append(name)
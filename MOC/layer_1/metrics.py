@@ -0,0 +1,180 @@
+ ##############################################################################
+ # @file           : metrics.py
+ # @brief          : In-process metrics for the MOC pipelines. Per-stage
+ #                   latency histograms, counters and gauges, exported as
+ #                   Prometheus text and as a periodic log line.
+ ##############################################################################
+
+import logging
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# @var METRICS_PORT Default port of the Prometheus text endpoint.
+
+METRICS_PORT = 9108
+
+# @var HISTOGRAM_WINDOW Number of most recent samples each histogram keeps for its percentiles.
+
+HISTOGRAM_WINDOW = 4096
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+# @brief Latency histogram over a sliding window of recent samples.
+#
+# @details Count and sum cover every sample ever observed, percentiles are taken
+#          over the last HISTOGRAM_WINDOW samples so they follow the current pass.
+
+class Histogram:
+    def __init__(self, window: int = HISTOGRAM_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.samples.append(value)
+        self.count += 1
+        self.sum += value
+
+    def percentiles(self, quantiles=QUANTILES) -> dict:
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {q: 0.0 for q in quantiles}
+        last = len(ordered) - 1
+        return {q: ordered[min(last, int(round(q * last)))] for q in quantiles}
+
+
+# @brief Registry holding every stage histogram, counter and gauge.
+#
+# @details Stages are timed in seconds using time.monotonic(). Gauges are
+#          callables sampled at export time, e.g. Queue.qsize, so they cost
+#          nothing on the hot path.
+
+class MetricsRegistry:
+    def __init__(self, prefix: str = "moc"):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.http_server = None
+        self.log_thread = None
+
+    def observe(self, stage: str, seconds: float):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    # Records the time elapsed since the monotonic timestamp start, returns now
+    def observe_since(self, stage: str, start: float) -> float:
+        now = time.monotonic()
+        self.observe(stage, now - start)
+        return now
+
+    def increment(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name: str, sample):
+        with self.lock:
+            self.gauges[name] = sample
+
+    def remove_gauge(self, name: str):
+        with self.lock:
+            self.gauges.pop(name, None)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            stages = {stage: (h.count, h.sum, h.percentiles()) for stage, h in self.histograms.items()}
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+
+        gauge_values = {}
+        for name, sample in gauges.items():
+            try:
+                gauge_values[name] = sample()
+            except Exception as exc:
+                logging.debug("Gauge %s could not be sampled: %s", name, exc)
+        return {"stages": stages, "counters": counters, "gauges": gauge_values}
+
+    def render_prometheus(self) -> str:
+        snapshot = self.snapshot()
+        lines = []
+
+        stage_metric = f"{self.prefix}_stage_seconds"
+        lines.append(f"# HELP {stage_metric} Time spent in each pipeline stage.")
+        lines.append(f"# TYPE {stage_metric} summary")
+        for stage, (count, total, percentiles) in sorted(snapshot["stages"].items()):
+            for quantile, value in percentiles.items():
+                lines.append(f'{stage_metric}{{stage="{stage}",quantile="{quantile}"}} {value:.9f}')
+            lines.append(f'{stage_metric}_sum{{stage="{stage}"}} {total:.9f}')
+            lines.append(f'{stage_metric}_count{{stage="{stage}"}} {count}')
+
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"# TYPE {self.prefix}_{name}_total counter")
+            lines.append(f"{self.prefix}_{name}_total {value}")
+
+        for name, value in sorted(snapshot["gauges"].items()):
+            lines.append(f"# TYPE {self.prefix}_{name} gauge")
+            lines.append(f"{self.prefix}_{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def summary_line(self) -> str:
+        snapshot = self.snapshot()
+        parts = []
+        for stage, (count, total, percentiles) in sorted(snapshot["stages"].items()):
+            p50, p95, p99 = (percentiles[q] * 1000 for q in QUANTILES)
+            parts.append(f"{stage} n={count} p50/p95/p99={p50:.2f}/{p95:.2f}/{p99:.2f}ms")
+        parts += [f"{name}={value}" for name, value in sorted(snapshot["counters"].items())]
+        parts += [f"{name}={value}" for name, value in sorted(snapshot["gauges"].items())]
+        return "metrics> " + " | ".join(parts)
+
+    # Logs summary_line() every interval seconds from a daemon thread
+    def start_periodic_log(self, interval: float = 60.0, level: int = logging.INFO):
+        if self.log_thread is not None:
+            return self.log_thread
+
+        def log_forever():
+            while True:
+                time.sleep(interval)
+                logging.log(level, "%s", self.summary_line())
+
+        self.log_thread = threading.Thread(target=log_forever, name="metrics-log", daemon=True)
+        self.log_thread.start()
+        return self.log_thread
+
+    # Serves render_prometheus() on http://host:port/metrics from a daemon thread
+    def start_http_server(self, port: int = METRICS_PORT, host: str = "127.0.0.1"):
+        if self.http_server is not None:
+            return self.http_server
+
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.http_server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self.http_server.serve_forever, name="metrics-http", daemon=True).start()
+        return self.http_server
+
+
+# @var REGISTRY Process wide registry used by the beacon and telemetry pipelines.
+
+REGISTRY = MetricsRegistry()
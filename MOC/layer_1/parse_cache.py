@@ -0,0 +1,233 @@
+ ##############################################################################
+ # @file           : parse_cache.py
+ # @brief          : Content addressed cache of decoded .TLM files and the
+ #                   manifest of the files already ingested. A file is keyed
+ #                   by the hash of its bytes and the decoder version, so an
+ #                   unchanged file is never decoded or inserted twice, and a
+ #                   decoder change invalidates every entry at once.
+ ##############################################################################
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import zlib
+from layer_1.parsing.dc_schema import decoder_version
+from layer_1.parsing.telemetry_parser.telemetry_parser import NUM_TASKS
+
+# @var DEFAULT_CACHE_DIR Where the decoded files are kept.
+# @var DEFAULT_MAX_BYTES Size of the cache on disk above which the least recently used entries go.
+# @var DEFAULT_MANIFEST_PATH Where the ingested files are recorded.
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(__file__), "downloaded_files", "parse_cache")
+DEFAULT_MAX_BYTES = 256 << 20
+DEFAULT_MANIFEST_PATH = os.path.join(os.path.dirname(__file__), "downloaded_files", "ingested.json")
+
+CACHE_EXTENSION = ".tlmc"
+HASH_CHUNK_SIZE = 1 << 20
+
+
+# @brief Hex digest of the contents of a file.
+
+def file_hash(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# @brief Records packed into columns as they come, one table per dc_id and order of keys,
+#        plus the order of the rows.
+
+class ColumnTable:
+    def __init__(self):
+        self.dc_ids = []
+        self.index = {}
+        self.order = []
+        self.keys = []
+        self.columns = []
+
+    def append(self, record: dict):
+        layout = (record["dc_id"], *record)
+        position = self.index.get(layout)
+        if position is None:
+            position = self.index[layout] = len(self.dc_ids)
+            self.dc_ids.append(record["dc_id"])
+            self.keys.append(list(record))
+            self.columns.append({key: [] for key in record if key != "dc_id"})
+        self.order.append(position)
+        for key, column in self.columns[position].items():
+            column.append(record[key])
+
+    # @return {"dc_ids": [name per table], "order": [table of each record], "keys": [record keys per table],
+    #          "columns": [{column: [values]} per table]}
+    def table(self) -> dict:
+        return {"dc_ids": self.dc_ids, "order": self.order, "keys": self.keys, "columns": self.columns}
+
+
+def to_columns(records) -> dict:
+    columns = ColumnTable()
+    for record in records:
+        columns.append(record)
+    return columns.table()
+
+
+# @brief Unpacks the output of to_columns() into records, in their original order and
+#        with their keys in their original order.
+
+def from_columns(table: dict):
+    rows = [0] * len(table["dc_ids"])
+    for position in table["order"]:
+        row = rows[position]
+        rows[position] += 1
+        columns = table["columns"][position]
+        yield {key: columns[key][row] if key != "dc_id" else table["dc_ids"][position]
+               for key in table["keys"][position]}
+
+
+# @brief Decoded .TLM files on disk, least recently used first out.
+#
+# @details Entries are zlib compressed JSON of the columns of a file (see to_columns()),
+#          named after the file hash and the decoder version. A hit touches the entry,
+#          so its modification time orders the entries for eviction once the cache
+#          grows past max_bytes.
+#
+# @param directory Where the entries are kept.
+# @param max_bytes Size above which entries are evicted.
+# @param version Decoder version, decoder_version(NUM_TASKS) by default.
+
+class ParseCache:
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES, version: str = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = version if version is not None else decoder_version(NUM_TASKS)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def key(self, digest: str) -> str:
+        return f"{digest}-{self.version}"
+
+    def key_for(self, path: str) -> str:
+        return self.key(file_hash(path))
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + CACHE_EXTENSION)
+
+    # @brief Returns the records cached under key, None if there are none.
+    def get(self, key: str):
+        path = self.entry_path(key)
+        try:
+            with open(path, "rb") as f:
+                table = json.loads(zlib.decompress(f.read()))
+            if "keys" not in table:
+                raise ValueError("written without the key order")
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, zlib.error) as exc:
+            logging.warning("Dropping unreadable parse cache entry %s: %s", path, exc)
+            self.remove(key)
+            return None
+        return from_columns(table)
+
+    # @param records Records, or a ColumnTable of them.
+    def put(self, key: str, records):
+        table = records.table() if isinstance(records, ColumnTable) else to_columns(records)
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.entry_path(key)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(zlib.compress(json.dumps(table, separators=(",", ":")).encode("utf-8")))
+        os.replace(temp_path, path)
+        self.evict()
+
+    def remove(self, key: str):
+        try:
+            os.remove(self.entry_path(key))
+        except OSError:
+            pass
+
+    # @brief Removes the least recently used entries until the cache fits in max_bytes.
+    def evict(self):
+        with self.lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(CACHE_EXTENSION):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        # Evicted by another process
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.name))
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self.remove(name[:-len(CACHE_EXTENSION)])
+                total -= size
+
+    # @brief Streams the records of a file, from the cache if it was decoded before.
+    #
+    # @details On a miss the records of parse(path) are passed through and cached once
+    #          the file is exhausted. Meanwhile only their values are kept, in columns.
+    #          A file that fails to parse is not cached.
+    #
+    # @param parse Callable returning the records of a file path.
+    # @param key Cache key of the file if already known, see key_for().
+
+    def records(self, path: str, parse, key: str = None):
+        key = key if key is not None else self.key_for(path)
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            yield from cached
+            return
+
+        self.misses += 1
+        columns = ColumnTable()
+        for record in parse(path):
+            columns.append(record)
+            yield record
+        self.put(key, columns)
+
+
+# @brief Files whose records are all in the database, by name and cache key.
+#
+# @param path JSON file the manifest is loaded from and saved to, None to keep it in memory.
+
+class IngestManifest:
+    def __init__(self, path: str = DEFAULT_MANIFEST_PATH):
+        self.path = path
+        self.files = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                self.files = json.load(f)
+        except (OSError, ValueError) as exc:
+            logging.warning("Could not read ingest manifest %s: %s", self.path, exc)
+
+    def save(self):
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.files, f, indent=1)
+        os.replace(temp_path, self.path)
+
+    def is_ingested(self, name: str, key: str) -> bool:
+        return self.files.get(name) == key
+
+    # @brief Records that every record of a file is stored, saving the manifest.
+    def mark(self, name: str, key: str):
+        with self.lock:
+            self.files[name] = key
+            self.save()
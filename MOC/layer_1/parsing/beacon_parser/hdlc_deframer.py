@@ -0,0 +1,273 @@
+ ##############################################################################
+ # @file           : hdlc_deframer.py
+ # @brief          : Deframes AX.25/HDLC frames from raw demodulated bit
+ #                   streams (e.g. SDR recordings) with NumPy and hands the
+ #                   beacons to Beacon_Parser, without the GS service.
+ #
+ #                   Run from the MOC directory:
+ #                   python3 -m layer_1.parsing.beacon_parser.hdlc_deframer FILE
+ ##############################################################################
+
+
+import argparse
+import binascii
+import sys
+import time
+from queue import Queue
+import numpy as np
+from layer_1.parsing.beacon_parser.realtime_beacon_parser import Beacon, Beacon_Parser
+
+# @var MIN_FRAME_BITS Shortest frame accepted: one byte of data and the 16 bit FCS.
+# @var MAX_FRAME_BITS Longest stuffed frame looked for, longer runs between flags are dropped.
+
+MIN_FRAME_BITS = 24
+MAX_FRAME_BITS = 8 * 1024
+
+# Reverses the bit order of every byte, HDLC sends the least significant bit first
+BIT_REVERSE = bytes(int(f"{i:08b}"[::-1], 2) for i in range(256))
+
+
+# @brief Returns the length of the run of 1 bits ending at every position.
+
+def ones_run_lengths(bits: np.ndarray) -> np.ndarray:
+    index = np.arange(len(bits))
+    last_zero = np.maximum.accumulate(np.where(bits == 0, index, -1))
+    return index - last_zero
+
+
+# @brief Checks the FCS of an HDLC frame.
+#
+# @details The FCS is CRC-16/X.25 (reflected CCITT polynomial, init and final XOR
+#          0xFFFF). binascii.crc_hqx computes the unreflected CRC, so it is fed
+#          the bytes with their bit order reversed, which is how the bits came off
+#          the air, and its result is reversed back.
+#
+# @param reversed_frame Frame including the FCS, every byte bit reversed.
+
+def fcs_valid(reversed_frame: bytes) -> bool:
+    crc = binascii.crc_hqx(reversed_frame[:-2], 0xFFFF) ^ 0xFFFF
+    return reversed_frame[-2:] == bytes([crc >> 8, crc & 0xFF])
+
+
+def fcs(frame: bytes) -> bytes:
+    crc = binascii.crc_hqx(frame.translate(BIT_REVERSE), 0xFFFF) ^ 0xFFFF
+    return bytes([BIT_REVERSE[crc >> 8], BIT_REVERSE[crc & 0xFF]])
+
+
+# @brief Strips the AX.25 address, control and PID fields of a UI frame.
+#
+# @return The information field, None if the frame is not a UI frame.
+
+def ax25_info(frame: bytes):
+    # The address field ends with the byte whose extension (lowest) bit is set
+    for end in range(13, min(len(frame), 70), 7):
+        if frame[end] & 1:
+            break
+    else:
+        return None
+
+    control = end + 1
+    if len(frame) < control + 2 or frame[control] & 0xEF != 0x03:
+        return None
+    return frame[control + 2:]
+
+
+# @brief Counters describing a deframing run.
+
+class DeframerStats:
+    def __init__(self):
+        self.bits = 0
+        self.frames = 0
+        self.fcs_errors = 0
+        self.invalid_frames = 0
+
+    def __str__(self):
+        return (f'DeframerStats> bits: {self.bits} | frames: {self.frames} | '
+                f'fcs errors: {self.fcs_errors} | invalid: {self.invalid_frames}')
+
+
+# @brief Streaming HDLC deframer.
+#
+# @details feed() takes any amount of demodulated bits and returns the frames
+#          completed by them, so a recording can be processed in chunks of any
+#          size and a live stream as it arrives. Per chunk, the NRZI decoding,
+#          the flag search and the unstuffing of every frame are NumPy array
+#          operations. Bits after the last flag are kept for the next chunk.
+#          Frames with a run of six 1s (aborts), a length that is not a whole
+#          number of bytes or a bad FCS are dropped and counted in stats.
+#
+# @param nrzi Decode NRZI first (a 0 is a level change), as used by AX.25.
+
+class HdlcDeframer:
+    def __init__(self, nrzi: bool = True):
+        self.nrzi = nrzi
+        self.last_level = 0
+        self.pending = np.zeros(0, dtype=np.uint8)
+        self.stats = DeframerStats()
+
+    # @brief Decodes bits and returns the frames, without their FCS, completed by them.
+    #
+    # @param bits uint8 array of 0/1 values in the order they were received.
+
+    def feed(self, bits) -> list:
+        bits = np.asarray(bits, dtype=np.uint8)
+        if len(bits) == 0:
+            return []
+        self.stats.bits += len(bits)
+
+        if self.nrzi:
+            previous = np.empty_like(bits)
+            previous[0] = self.last_level
+            previous[1:] = bits[:-1]
+            self.last_level = bits[-1]
+            bits = (bits == previous).astype(np.uint8)
+
+        bits = np.concatenate((self.pending, bits))
+        runs = ones_run_lengths(bits)
+
+        # A flag is 01111110: a 0, six 1s and a 0
+        if len(bits) >= 8:
+            flags = np.flatnonzero((bits[:-7] == 0) & (runs[6:-1] == 6) & (bits[7:] == 0))
+        else:
+            flags = np.zeros(0, dtype=np.int64)
+
+        frames = []
+        for start, end in zip(flags[:-1] + 8, flags[1:]):
+            if MIN_FRAME_BITS <= end - start <= MAX_FRAME_BITS:
+                frame = self.unstuff(bits[start:end], runs[start:end], start)
+                if frame is not None:
+                    frames.append(frame)
+
+        if len(flags):
+            self.pending = bits[flags[-1]:]
+        else:
+            self.pending = bits[-(MAX_FRAME_BITS + 8):]
+        if len(self.pending) > MAX_FRAME_BITS + 8:
+            self.pending = self.pending[-(MAX_FRAME_BITS + 8):]
+
+        return frames
+
+    # Removes the 0 inserted after every five 1s and checks the FCS
+    def unstuff(self, frame_bits, runs, offset: int):
+        # Runs are counted over the whole buffer, a frame starts right after a flag's closing 0
+        if runs.max(initial=0) >= 6:
+            self.stats.invalid_frames += 1
+            return None
+
+        stuffed = np.zeros(len(frame_bits), dtype=bool)
+        stuffed[1:] = (frame_bits[1:] == 0) & (runs[:-1] == 5)
+        data_bits = frame_bits[~stuffed]
+        if len(data_bits) % 8:
+            self.stats.invalid_frames += 1
+            return None
+
+        # Packing the LSB first bits as MSB first gives the bit reversed bytes crc_hqx needs
+        reversed_frame = np.packbits(data_bits, bitorder="big").tobytes()
+        if not fcs_valid(reversed_frame):
+            self.stats.fcs_errors += 1
+            return None
+
+        self.stats.frames += 1
+        return reversed_frame[:-2].translate(BIT_REVERSE)
+
+
+# @brief Returns a recording chunk as one uint8 per bit.
+#
+# @param packed True if every byte holds eight bits (MSB first), False if every
+#        byte holds a single bit in its lowest bit, as written by bit slicers.
+
+def chunk_to_bits(data: bytes, packed: bool = True) -> np.ndarray:
+    raw = np.frombuffer(data, dtype=np.uint8)
+    if packed:
+        return np.unpackbits(raw)
+    return raw & 1
+
+
+# @brief Encodes frames into an NRZI HDLC bit stream, for tests and benchmarks.
+#
+# @param frames Frames without FCS.
+# @param flags Number of flags between frames.
+# @return uint8 array of 0/1 levels.
+
+def encode_hdlc(frames, flags: int = 2, nrzi: bool = True) -> np.ndarray:
+    flag = [0, 1, 1, 1, 1, 1, 1, 0]
+    bits = flag * flags
+    for frame in frames:
+        ones = 0
+        for byte in bytes(frame) + fcs(bytes(frame)):
+            for i in range(8):
+                bit = (byte >> i) & 1
+                bits.append(bit)
+                ones = ones + 1 if bit else 0
+                if ones == 5:
+                    bits.append(0)
+                    ones = 0
+        bits += flag * flags
+
+    bits = np.array(bits, dtype=np.uint8)
+    if nrzi:
+        # A 0 toggles the level, a 1 keeps it
+        bits = (np.cumsum(bits == 0) % 2).astype(np.uint8)
+    return bits
+
+
+# @brief Deframes a recording and feeds its beacons to a Beacon_Parser.
+#
+# @param path Recording of demodulated bits.
+# @param beacon_parser Beacon_Parser the beacons are handed to.
+# @param packed See chunk_to_bits().
+# @param ax25 Strip the AX.25 header of every frame before parsing it.
+# @param chunk_size Bytes read from the file at a time.
+# @return The HdlcDeframer, holding the stats of the run.
+
+def deframe_file(path: str, beacon_parser, packed: bool = True, nrzi: bool = True, ax25: bool = False,
+                 chunk_size: int = 1 << 20) -> HdlcDeframer:
+    deframer = HdlcDeframer(nrzi=nrzi)
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            for frame in deframer.feed(chunk_to_bits(data, packed)):
+                if ax25:
+                    frame = ax25_info(frame)
+                    if frame is None:
+                        deframer.stats.invalid_frames += 1
+                        continue
+                if len(frame) == Beacon.BEACON_SIZE:
+                    beacon_parser.parse_beacon(frame)
+    return deframer
+
+
+def main(argv=None) -> int:
+    arg_parser = argparse.ArgumentParser(description="Deframe beacons from a demodulated bit stream recording")
+    arg_parser.add_argument("file", help="recording of demodulated bits")
+    arg_parser.add_argument("--unpacked", action="store_true", help="one bit per byte instead of eight")
+    arg_parser.add_argument("--no-nrzi", action="store_true", help="the bits are not NRZI encoded")
+    arg_parser.add_argument("--ax25", action="store_true", help="frames carry an AX.25 UI header to strip")
+    arg_parser.add_argument("--baud", type=int, default=9600, help="bit rate of the recording, for the speed-up")
+    arg_parser.add_argument("--print", action="store_true", help="print every labeled message")
+    args = arg_parser.parse_args(argv)
+
+    beacon_queue = Queue()
+    beacon_parser = Beacon_Parser(beacon_queue)
+    start = time.perf_counter()
+    deframer = deframe_file(args.file, beacon_parser, packed=not args.unpacked, nrzi=not args.no_nrzi, ax25=args.ax25)
+    elapsed = time.perf_counter() - start
+
+    messages = 0
+    while not beacon_queue.empty():
+        labeled_data = beacon_queue.get()
+        messages += 1
+        if args.print:
+            print(labeled_data)
+
+    recorded = deframer.stats.bits / args.baud
+    print(deframer.stats)
+    print(f"{messages} beacon messages | {recorded:.1f} s of recording in {elapsed:.2f} s "
+          f"({recorded / elapsed if elapsed else 0:.0f}x real time)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
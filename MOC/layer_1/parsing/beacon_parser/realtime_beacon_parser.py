@@ -8,8 +8,12 @@
 
 import subprocess
 import os
+import json
+import time
+import struct
 from struct import unpack_from
-from itertools import islice
+from layer_1.parsing.dc_schema import DC_NAMES, SCHEMAS_BY_NAME
+from layer_1.parsing.telemetry_parser.dependencies import cobs
 
 
 # @brief Executes a command and yields its output line by line.
@@ -34,6 +38,160 @@ def execute(cmd):
         popen.wait()
 
 
+# @var FRAMING_LENGTH Binary framing: every frame is preceded by its length, a little endian uint16.
+# @var FRAMING_COBS Binary framing: every frame is COBS encoded and followed by a 0 byte.
+
+FRAMING_LENGTH = "length"
+FRAMING_COBS = "cobs"
+
+LENGTH_PREFIX = struct.Struct("<H")
+
+
+# @brief Frames a sequence of frames for a binary stream, e.g. to record or replay a capture.
+
+def encode_frames(frames, framing: str = FRAMING_LENGTH) -> bytes:
+    if framing == FRAMING_LENGTH:
+        return b"".join(LENGTH_PREFIX.pack(len(frame)) + bytes(frame) for frame in frames)
+    if framing == FRAMING_COBS:
+        return b"".join(cobs.encode(frame) + b"\x00" for frame in frames)
+    raise ValueError(f"Unknown framing {framing!r}")
+
+
+# @brief Splits a binary stream into frames.
+#
+# @details The stream is read with readinto() into one reusable buffer of
+#          buffer_size bytes, and every complete frame in it is yielded before
+#          the next read, so a single read usually delivers many beacons. Frames
+#          are yielded as bytes, they stay valid after the buffer is reused.
+#          Data that cannot be a frame (a COBS frame larger than the buffer or
+#          failing to decode) is skipped up to the next delimiter and counted in
+#          discarded. A length prefixed stream cannot resynchronize, a frame
+#          larger than the buffer raises ValueError.
+#
+# @param stream Binary file object with readinto(), e.g. a subprocess pipe.
+# @param framing FRAMING_LENGTH or FRAMING_COBS.
+# @param buffer_size Size of the read buffer, also the largest frame accepted.
+
+class BinaryFrameReader:
+    def __init__(self, stream, framing: str = FRAMING_LENGTH, buffer_size: int = 1 << 16):
+        if framing not in (FRAMING_LENGTH, FRAMING_COBS):
+            raise ValueError(f"Unknown framing {framing!r}")
+        self.stream = stream
+        self.framing = framing
+        self.buffer = bytearray(buffer_size)
+        self.frames_read = 0
+        self.discarded = 0
+
+    def frames(self):
+        buffer = self.buffer
+        view = memoryview(buffer)
+        start = 0
+        end = 0
+        skipping = False
+
+        while True:
+            # Move the incomplete tail to the front so the next read can complete it
+            if start:
+                buffer[:end - start] = buffer[start:end]
+                end -= start
+                start = 0
+
+            if end == len(buffer):
+                if self.framing == FRAMING_LENGTH:
+                    raise ValueError("Frame larger than the read buffer")
+                self.discarded += 1
+                end = 0
+                skipping = True
+
+            count = self.stream.readinto(view[end:])
+            if not count:
+                return
+            end += count
+
+            if self.framing == FRAMING_LENGTH:
+                while end - start >= LENGTH_PREFIX.size:
+                    (length,) = LENGTH_PREFIX.unpack_from(buffer, start)
+                    if length > len(buffer) - LENGTH_PREFIX.size:
+                        raise ValueError(f"Frame of {length} bytes is larger than the read buffer")
+                    frame_end = start + LENGTH_PREFIX.size + length
+                    if frame_end > end:
+                        break
+                    self.frames_read += 1
+                    yield bytes(view[start + LENGTH_PREFIX.size:frame_end])
+                    start = frame_end
+            else:
+                while True:
+                    zero = buffer.find(0, start, end)
+                    if zero == -1:
+                        break
+                    if skipping:
+                        skipping = False
+                    elif zero > start:
+                        try:
+                            frame = cobs.decode_strict(view[start:zero])
+                        except ValueError:
+                            self.discarded += 1
+                        else:
+                            self.frames_read += 1
+                            yield frame
+                    start = zero + 1
+                if skipping:
+                    start = end
+
+
+# @brief Stops a subprocess and closes its output, killing it if it does not exit in time.
+
+def stop_process(popen, timeout: float = 2.0):
+    if popen.poll() is None:
+        popen.terminate()
+        try:
+            popen.wait(timeout)
+        except subprocess.TimeoutExpired:
+            popen.kill()
+            popen.wait()
+    popen.stdout.close()
+
+
+# @brief Executes a command and yields the binary frames it writes to stdout.
+#
+# @details Binary counterpart of execute(), nothing is decoded as text. stdout is
+#          read unbuffered by BinaryFrameReader, which does its own large reads.
+#          The process is stopped when the output ends, on a keyboard interrupt,
+#          or when the generator is closed.
+#
+# @param cmd The command to execute, provided as a list of strings.
+# @param framing FRAMING_LENGTH or FRAMING_COBS.
+# @yield One beacon frame at a time, as bytes.
+
+def execute_binary(cmd, framing: str = FRAMING_LENGTH, buffer_size: int = 1 << 16):
+    popen = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=0)
+    try:
+        yield from BinaryFrameReader(popen.stdout, framing, buffer_size).frames()
+    except KeyboardInterrupt:
+        print("Keyboard interrupt...")
+    finally:
+        stop_process(popen)
+
+
+# @brief Feeds every frame from a binary source into a Beacon_Parser.
+#
+# @param frames Iterable of beacon frames, e.g. execute_binary(cmd).
+# @param beacon_parser Beacon_Parser putting the labeled messages on its queue.
+# @param running Optional event, feeding stops once it is cleared.
+# @return The number of beacons parsed.
+
+def feed_beacon_parser(frames, beacon_parser, running=None) -> int:
+    count = 0
+    for frame in frames:
+        beacon_parser.parse_beacon(frame)
+        count += 1
+        if running is not None and not running.is_set():
+            break
+    if hasattr(frames, "close"):
+        frames.close()
+    return count
+
+
 # @brief Represents the header of a beacon message.
 # 
 # @details Private class used by BeaconMsg to parse out a message header
@@ -42,40 +200,12 @@ class BeaconMsgHeader:
     MSG_HEADER_SIZE = 4
 
     # Used for translating the dc_id hex value to the actual DC attribute name
-    dc_entries_dict = {
-        0x00000010: "OBC_0",
-        0x00000011: "ADCS_0",
-        0x00000012: "ADCS_1",
-        0x00000013: "ADCS_2",
-        0x00000014: "EPS_0",
-        0x00000015: "SSP_0",
-        0x00000016: "SSP_1",
-        0x00000017: "SSP_2",
-        0x00000019: "AOCS_CNTRL_TLM",
-        0x0000001A: "EPS_1",
-        0x0000001B: "EPS_2",
-        0x0000001C: "EPS_3",
-        0x0000001D: "EPS_4",
-        0x0000001E: "EPS_5",
-        0x0000001F: "EPS_6",
-        0x00000020: "TaskStats",
-        0x00000021: "SSP_3",
-        0x00000022: "SENSOR_MAG_PRIMARY",
-        0x00000023: "SENSOR_MAG_SECONDARY",
-        0x00000024: "SENSOR_GYRO",
-        0x00000025: "SENSOR_COARSE_SUN",
-        0x00000026: "ES_ADCS_SENSOR_MAG_PRIMARY",
-        0x00000027: "ES_ADCS_SENSOR_MAG_SECONDARY",
-        0x00000028: "ES_ADCS_SENSOR_GYRO",
-        0x00000029: "ES_ADCS_SENSOR_CSS",
-        0x00000030: "ES_ADCS_ESTIMATES_BDOT",
-        0x00000031: "ES_ADCS_CONTROL_VALUES_MTQ",
-        0x00000032: "ConOpsFlags",
-        0x00000033: "AOCS_CNTRL_SYS_STATE",
-        0x00000034: "ADCS_3",
-        0x00000035: "ADCS_4",
-        0x000000FF: "Unknown"
-    }
+    dc_entries_dict = {**DC_NAMES, 0x000000FF: "Unknown"}
+
+    # Largest msg_length a message of each DC can have
+    max_msg_length = {schema.name: schema.max_size() for schema in SCHEMAS_BY_NAME.values()}
+
+    __slots__ = ("dc_id", "flag_d", "flag_e", "msg_length")
     
     def __init__(self):
         self.dc_id = 0
@@ -83,6 +213,7 @@ class BeaconMsgHeader:
         self.flag_e = 0
         self.msg_length = 0
     
+    # Unknown dc_ids are kept as their number, see validate()
     def parse(self, data: bytes):
         if len(data) >= BeaconMsgHeader.MSG_HEADER_SIZE:
             (
@@ -91,83 +222,49 @@ class BeaconMsgHeader:
                 self.flag_e,
                 self.msg_length
             ) = unpack_from("<BBBB", data)
-            self.dc_id = BeaconMsgHeader.dc_entries_dict[self.dc_id]
+            self.dc_id = BeaconMsgHeader.dc_entries_dict.get(self.dc_id, self.dc_id)
             return BeaconMsgHeader.MSG_HEADER_SIZE
         else:
             return 0
 
+    # Returns why the header cannot start a message ("unknown_dc_id", "empty" or
+    # "oversized"), None if it is plausible
+    def validate(self):
+        max_length = BeaconMsgHeader.max_msg_length.get(self.dc_id)
+        if max_length is None:
+            return "unknown_dc_id"
+        if self.msg_length == 0:
+            return "empty"
+        if self.msg_length > max_length:
+            return "oversized"
+        return None
+
 
 # @brief Represents a beacon message.
 # 
 # @details Private class used by the Beacon class. For each message within a beacon,
-#          the Beacon class creates a new instance of BeaconMsg.
+#          the Beacon class creates a new instance of BeaconMsg. Messages are labeled
+#          with the decoders compiled from the dc_schema registry. data is a view
+#          of the beacon, or bytes once a message is reassembled from two beacons.
 
 class BeaconMsg:
+    __slots__ = ("header", "data", "labeled_data", "partial")
+
     def __init__(self):
         self.header = BeaconMsgHeader()
-        self.data = []
+        self.data = b""
         self.labeled_data = {}
         self.partial = False
 
-    def parse(self, data: bytes):
-            
-        for byte in data:
-            self.data.append(byte)
-        
+    # Keeps a view of the message bytes, nothing is copied out of the beacon
+    def parse(self, data: memoryview):
+        self.data = data
+
     def label(self):
         self.labeled_data = {"dc_id": self.header.dc_id}
-        if self.header.dc_id == "OBC_0":
-            self.labeled_data.update(BeaconMsg.parse_obc_0(self.data))
-        elif self.header.dc_id == "ADCS_0":
-            self.labeled_data.update(BeaconMsg.parse_adcs_0(self.data))
-        elif self.header.dc_id == "ADCS_1":
-            self.labeled_data.update(BeaconMsg.parse_adcs_1(self.data))
-        elif self.header.dc_id == "ADCS_2":
-            self.labeled_data.update(BeaconMsg.parse_adcs_2(self.data))
-        elif self.header.dc_id == "EPS_0":
-            self.labeled_data.update(BeaconMsg.parse_eps_0(self.data))
-        elif self.header.dc_id == "SSP_0" or self.header.dc_id == "SSP_1" or self.header.dc_id == "SSP_2" or self.header.dc_id == "SSP_3":
-            self.labeled_data.update(BeaconMsg.parse_ssp(self.data))
-        elif self.header.dc_id == "AOCS_CNTRL_TLM":
-            self.labeled_data.update(BeaconMsg.parse_aocs_cntrl_tlm(self.data))
-        elif self.header.dc_id == "EPS_1":
-            self.labeled_data.update(BeaconMsg.parse_eps_1(self.data))
-        elif self.header.dc_id == "EPS_2":
-            self.labeled_data.update(BeaconMsg.parse_eps_2(self.data))
-        elif self.header.dc_id == "EPS_3":
-            self.labeled_data.update(BeaconMsg.parse_eps_3(self.data))
-        elif self.header.dc_id == "EPS_4":
-            self.labeled_data.update(BeaconMsg.parse_eps_4(self.data))
-        elif self.header.dc_id == "EPS_5":
-            self.labeled_data.update(BeaconMsg.parse_eps_5(self.data))
-        elif self.header.dc_id == "EPS_6":
-            self.labeled_data.update(BeaconMsg.parse_eps_6(self.data))
-        elif self.header.dc_id == "TaskStats":
-            self.labeled_data.update(BeaconMsg.parse_taskstats(self.data))
-        elif self.header.dc_id == "SENSOR_MAG_PRIMARY" or self.header.dc_id == 'SENSOR_MAG_SECONDARY':
-            self.labeled_data.update(BeaconMsg.parse_sensor_mag(self.data))
-        elif self.header.dc_id == "SENSOR_GYRO":
-            self.labeled_data.update(BeaconMsg.parse_sensor_gyro(self.data))
-        elif self.header.dc_id == "SENSOR_COARSE_SUN":
-            self.labeled_data.update(BeaconMsg.parse_sensor_coarse_sun(self.data))
-        elif self.header.dc_id == "ES_ADCS_SENSOR_MAG_PRIMARY" or self.header.dc_id == "ES_ADCS_SENSOR_MAG_SECONDARY":
-            self.labeled_data.update(BeaconMsg.parse_es_adcs_sensor_mag(self.data))
-        elif self.header.dc_id == "ES_ADCS_SENSOR_GYRO":
-            self.labeled_data.update(BeaconMsg.parse_es_adcs_sensor_gyro(self.data))
-        elif self.header.dc_id == "ES_ADCS_SENSOR_CSS":
-            self.labeled_data.update(BeaconMsg.parse_es_adcs_sensor_css(self.data))
-        elif self.header.dc_id == "ES_ADCS_ESTIMATES_BDOT":
-            self.labeled_data.update(BeaconMsg.parse_es_adcs_estimates_bdot(self.data))
-        elif self.header.dc_id == "ES_ADCS_CONTROL_VALUES_MTQ":
-            self.labeled_data.update(BeaconMsg.parse_es_adcs_control_values_mtq(self.data))
-        elif self.header.dc_id == "ConOpsFlags":
-            self.labeled_data.update(BeaconMsg.parse_conops_flags(self.data))
-        elif self.header.dc_id == "AOCS_CNTRL_SYS_STATE":
-            self.labeled_data.update(BeaconMsg.parse_aocs_cntrl_sys_state(self.data))
-        elif self.header.dc_id == "ADCS_3":
-            self.labeled_data.update(BeaconMsg.parse_adcs_3(self.data))
-        elif self.header.dc_id == "ADCS_4":
-            self.labeled_data.update(BeaconMsg.parse_adcs_4(self.data))
+        schema = SCHEMAS_BY_NAME.get(self.header.dc_id)
+        if schema is not None:
+            self.labeled_data.update(schema.decode_beacon(self.data))
         else:
             self.labeled_data.update(BeaconMsg.parse_other(self.data))
     
@@ -178,672 +275,6 @@ class BeaconMsg:
             labeled_data[f"{key}"] = value
         return labeled_data
 
-    @staticmethod
-    def parse_obc_0(data: bytes):
-        labeled_data = {}
-
-        labeled_data['opMode'] = data[0]
-        labeled_data['upTime'] = int.from_bytes(data[1:5], byteorder='little', signed=False)
-        labeled_data['totalResetCount'] = int.from_bytes(data[5:7], byteorder='little', signed=False)
-        labeled_data['resetReasonBitField'] = int.from_bytes(data[7:9], byteorder='little', signed=False)
-        labeled_data['payloadModesStatus'] = int.from_bytes(data[9:11], byteorder='little', signed=False)
-
-        return labeled_data
-
-    @staticmethod
-    def parse_adcs_0(data: bytes):
-        labeled_data = {}
-        shifted_data = []
-        data_keys = [
-            'magFieldVec_X', 'magFieldVec_Y', 'magFieldVec_Z',
-            'coarseSunVec_X', 'coarseSunVec_Y', 'coarseSunVec_Z',
-            'fineSunVec_X', 'fineSunVec_Y', 'fineSunVec_Z',
-            'nadirVec_X', 'nadirVec_Y', 'nadirVec_Z',
-            'angRateVec_X', 'angRateVec_Y', 'angRateVec_Z',
-            'wheelSpeedArr_X', 'wheelSpeedArr_Y', 'wheelSpeedArr_Z'
-        ]
-
-        for i in range(0, len(data), 2):
-            shifted_data.append(int.from_bytes(data[i:i+2], byteorder='little', signed=True))
-
-        for key, value in zip(data_keys, shifted_data):
-            labeled_data[key] = value
-        
-        return labeled_data
-    
-    @staticmethod
-    def parse_adcs_1(data: bytes):
-        labeled_data = {}
-        shifted_data = []
-        data_keys = [
-            'estQSet_Q1', 'estQSet_Q2', 'estQSet_Q3',
-            'estQSet_X', 'estQSet_Y', 'estQSet_Z'
-        ]
-
-        for i in range(0, len(data), 2):
-            shifted_data.append(int.from_bytes(data[i:i+2], byteorder='little', signed=True))
-
-        for key, value in zip(data_keys, shifted_data):
-            labeled_data[key] = value
-        
-        return labeled_data
-    
-    @staticmethod
-    def parse_adcs_2(data: bytes):
-        labeled_data = {}
-        byte_0 = data[0]
-        byte_1 = data[1]
-        byte_2 = data[2]
-        byte_3 = data[3]
-        byte_4 = data[4]
-        byte_5 = data[5]
-
-        labeled_data['Attitude_Estimation_Mode'] = byte_0 & 0b1111  
-        labeled_data['Control_Mode'] = (byte_0 >> 4) & 0b1111           
-        
-        labeled_data['ADCS_Run_Mode'] = byte_1 & 0b1                      
-        labeled_data['ASGP4_Mode'] = (byte_1 >> 1) & 0b1                   
-        labeled_data['CubeControl_Signal_Enabled'] = (byte_1 >> 2) & 0b1    
-        labeled_data['CubeControl_Motor_Enabled'] = (byte_1 >> 3) & 0b1    
-        labeled_data['CubeSense1_Enabled'] = (byte_1 >> 4) & 0b11       
-        labeled_data['CubeSense2_Enabled'] = (byte_1 >> 6) & 0b11         
-
-        labeled_data['CubeWheel1_Enabled'] = byte_2 & 0b1                  
-        labeled_data['CubeWheel2_Enabled'] = (byte_2 >> 1) & 0b1           
-        labeled_data['CubeWheel3_Enabled'] = (byte_2 >> 2) & 0b1           
-        labeled_data['CubeStar_Enabled'] = (byte_2 >> 3) & 0b1            
-        labeled_data['GPS_Receiver_Enabled'] = (byte_2 >> 4) & 0b1          
-        labeled_data['GPS_LNA_Power_Enabled'] = (byte_2 >> 5) & 0b1         
-        labeled_data['Motor_Driver_Enabled'] = (byte_2 >> 6) & 0b1          
-        labeled_data['Sun_is_Above_Local_Horizon'] = (byte_2 >> 7) & 0b1    
-
-        labeled_data['CubeSense1_Communications_Error'] = byte_3 & 0b1                 
-        labeled_data['CubeSense2_Communications_Error'] = (byte_3 >> 1) & 0b1       
-        labeled_data['CubeControl_Signal_Communications_Error'] = (byte_3 >> 2) & 0b1  
-        labeled_data['CubeControl_Motor_Communications_Error'] = (byte_3 >> 3) & 0b1    
-        labeled_data['CubeWheel1_Communications_Error'] = (byte_3 >> 4) & 0b1          
-        labeled_data['CubeWheel2_Communications_Error'] = (byte_3 >> 5) & 0b1        
-        labeled_data['CubeWheel3_Communications_Error'] = (byte_3 >> 6) & 0b1        
-        labeled_data['CubeStar_Communications_Error'] = (byte_3 >> 7) & 0b1            
-
-        labeled_data['Magnetometer_Range_Error'] = byte_4 & 0b1                 
-        labeled_data['Cam1_SRAM_Overcurrent_Detected'] = (byte_4 >> 1) & 0b1    
-        labeled_data['Cam1_3V3_Overcurrent_Detected'] = (byte_4 >> 2) & 0b1     
-        labeled_data['Cam1_Sensor_Busy_Error'] = (byte_4 >> 3) & 0b1          
-        labeled_data['Cam1_Sensor_Detection_Error'] = (byte_4 >> 4) & 0b1     
-        labeled_data['Sun_Sensor_Range_Error'] = (byte_4 >> 5) & 0b1           
-        labeled_data['Cam2_SRAM_Overcurrent_Detected'] = (byte_4 >> 6) & 0b1   
-        labeled_data['Cam2_3V3_Overcurrent_Detected'] = (byte_4 >> 7) & 0b1     
-
-        labeled_data['Cam2_Sensor_Busy_Error'] = byte_5 & 0b1                   
-        labeled_data['Cam2_Sensor_Detection_Error'] = (byte_5 >> 1) & 0b1       
-        labeled_data['Nadir_Sensor_Range_Error'] = (byte_5 >> 2) & 0b1          
-        labeled_data['Rate_Sensor_Range_Error'] = (byte_5 >> 3) & 0b1           
-        labeled_data['Wheel_Speed_Range_Error'] = (byte_5 >> 4) & 0b1           
-        labeled_data['Coarse_Sun_Sensor_Error'] = (byte_5 >> 5) & 0b1           
-        labeled_data['StarTracker_Match_Error'] = (byte_5 >> 6) & 0b1           
-        labeled_data['StarTracker_Overcurrent_Detected'] = (byte_5 >> 7) & 0b1  
-
-        return labeled_data
-
-    @staticmethod
-    def parse_eps_0(data: bytes):
-        labeled_data = {}
-
-        labeled_data['battEnergy'] = int.from_bytes(data[0:8], byteorder='little', signed=True)
-        labeled_data['battCharge'] = int.from_bytes(data[8:16], byteorder='little', signed=True)
-        labeled_data['battChargeCapacity'] = int.from_bytes(data[16:24], byteorder='little', signed=True)
-        labeled_data['battPercent'] = int.from_bytes(data[24:32], byteorder='little', signed=True)
-        labeled_data['battVoltage'] = int.from_bytes(data[32:36], byteorder='little', signed=True)
-        labeled_data['battCurrent'] = int.from_bytes(data[36:40], byteorder='little', signed=True)
-        labeled_data['battTemperature'] = int.from_bytes(data[40:44], byteorder='little', signed=True)
-
-        return labeled_data
-
-    @staticmethod
-    def parse_ssp(data: bytes):
-        # All SSP's can be parsed exactly the same way
-        labeled_data = {}
-        shifted_data = []
-        new_labels = ['sunDataMain', 'sunDataExt', 'tempMCU', 'tempMain', 'tempExt1', 'temptExt2']
-
-        for i in range(0, 4, 2):
-            shifted_data.append(int.from_bytes(data[i:i+2], byteorder='little', signed=False))
-        
-        for i in range(4, len(data), 2):
-            shifted_data.append(int.from_bytes(data[i:i+2], byteorder='little', signed=True))
-
-        for key, value in zip(new_labels, shifted_data):
-            labeled_data[key] = value
-        
-        return labeled_data
-    
-    @staticmethod
-    def parse_aocs_cntrl_tlm(data: bytes):
-        labeled_data = {}
-
-        labeled_data['adcsErrFlags'] = int.from_bytes(data[0:2], byteorder='little', signed=False)
-        labeled_data['estAngRateNorm'] = int.from_bytes(data[2:6], byteorder='little', signed=True)
-        labeled_data['estAngRateVec_X'] = int.from_bytes(data[6:10], byteorder='little', signed=True)
-        labeled_data['estAngRateVec_Y'] = int.from_bytes(data[10:14], byteorder='little', signed=True)
-        labeled_data['estAngRateVec_Z'] = int.from_bytes(data[14:18], byteorder='little', signed=True)
-        labeled_data['estAttAngles_Roll'] = int.from_bytes(data[18:22], byteorder='little', signed=True)
-        labeled_data['estAttAngles_Pitch'] = int.from_bytes(data[22:26], byteorder='little', signed=True)
-        labeled_data['estAttAngles_Yaw'] = int.from_bytes(data[26:30], byteorder='little', signed=True)
-        labeled_data['measWheelSpeed_X'] = int.from_bytes(data[30:32], byteorder='little', signed=True)
-        labeled_data['measWheelSpeed_Y'] = int.from_bytes(data[32:34], byteorder='little', signed=True)
-        labeled_data['measWheelSpeed_Z'] = int.from_bytes(data[34:36], byteorder='little', signed=True)
-
-        return labeled_data
-    
-    @staticmethod
-    def parse_eps_1(data: bytes):
-        labeled_data = {}
-
-        labeled_data['battCapacity'] = int.from_bytes(data[0:4], byteorder='little', signed=True)
-        labeled_data['battVoltage'] = int.from_bytes(data[4:8], byteorder='little', signed=True)
-        labeled_data['battCurrent'] = int.from_bytes(data[8:12], byteorder='little', signed=True)
-        labeled_data['battTemperature'] = int.from_bytes(data[12:16], byteorder='little', signed=True)
-
-        return labeled_data
-    
-    @staticmethod
-    def parse_eps_2(data: bytes):
-        labeled_data = {}
-        shifted_data = []
-        new_labels = [
-            'VOLT_BRDSUP',
-            'TEMP_MCU',
-            'VIP_INPUT_Voltage',
-            'VIP_INPUT_Current',
-            'VIP_INPUT_Power',
-            'STAT_CH_ON',
-            'STAT_CH_OCF',
-            'VIP_Voltage_VD0',
-            'VIP_Current_VD0',
-            'VIP_Voltage_VD4',
-            'VIP_Current_VD4',
-            'VIP_Voltage_VD6',
-            'VIP_Current_VD6',
-            'VIP_Voltage_VD7',
-            'VIP_Current_VD7',
-            'VIP_Voltage_VD8',
-            'VIP_Current_VD8',
-            'VIP_Voltage_VD9',
-            'VIP_Current_VD9',
-            'VIP_Voltage_VD10',
-            'VIP_Current_VD10',
-            'VIP_Voltage_VD11',
-            'VIP_Current_VD11'
-        ]
-
-        for i in range(0, 10, 2):
-            shifted_data.append(int.from_bytes(data[i:i+2], byteorder='little', signed=True))
-
-        for i in range(10, 14, 2):
-            shifted_data.append(int.from_bytes(data[i:i+2], byteorder='little', signed=False))
-
-        for i in range(14, len(data), 2):
-            shifted_data.append(int.from_bytes(data[i:i+2], byteorder='little', signed=True))
-
-        for key, value in zip(new_labels, shifted_data):
-            labeled_data[key] = value
-        
-        return labeled_data
-    
-    @staticmethod
-    def parse_eps_3(data: bytes):
-        labeled_data = {}
-        shifted_data = []
-        new_labels = [
-            'VOLT_BRDSUP',
-            'TEMP_MCU',
-            'VIP_INPUT_Voltage',
-            'VIP_INPUT_Current',
-            'VIP_INPUT_Power',
-            'STAT_BU',
-            'VIP_BP_INPUT_Voltage_1',
-            'VIP_BP_INPUT_Voltage_2',
-            'VIP_BP_INPUT_Current_1',
-            'VIP_BP_INPUT_Current_2',
-            'VIP_BP_INPUT_Power_1',
-            'VIP_BP_INPUT_Power_2',
-            'STAT_BP_1',
-            'STAT_BP_2',
-            'VOLT_CELL1_1',
-            'VOLT_CELL1_2',
-            'VOLT_CELL2_1',
-            'VOLT_CELL2_2',
-            'VOLT_CELL3_1',
-            'VOLT_CELL3_2',
-            'VOLT_CELL4_1',
-            'VOLT_CELL4_2',
-            'BAT_TEMP1_1',
-            'BAT_TEMP1_2',
-            'BAT_TEMP2_1',
-            'BAT_TEMP2_2',
-            'BAT_TEMP3_1',
-            'BAT_TEMP3_2',
-        ]
-
-        for i in range(0, 10, 2):
-            shifted_data.append(int.from_bytes(data[i:i+2], byteorder='little', signed=True))
-        
-        shifted_data.append(int.from_bytes(data[10:12], byteorder='little', signed=False))
-
-        for i in range(12, len(data), 2):
-            shifted_data.append(int.from_bytes(data[i:i+2], byteorder='little', signed=True))
-
-        for key, value in zip(new_labels, shifted_data):
-            labeled_data[key] = value 
-        
-        return labeled_data
-    
-    @staticmethod
-    def parse_eps_4(data: bytes):
-        labeled_data = {}
-        shifted_data = []
-        new_labels = [
-            'VOLT_BRDSUP',
-            'TEMP_MCU',
-            'VIP_OUTPUT_Voltage',
-            'VIP_OUTPUT_Current',
-            'VIP_OUTPUT_Power',
-            'VIP_CC_OUTPUT_Voltage_1',
-            'VIP_CC_OUTPUT_Voltage_2',
-            'VIP_CC_OUTPUT_Voltage_3',
-            'VIP_CC_OUTPUT_Voltage_4',
-            'VIP_CC_OUTPUT_Current_1',
-            'VIP_CC_OUTPUT_Current_2',
-            'VIP_CC_OUTPUT_Current_3',
-            'VIP_CC_OUTPUT_Current_4',
-            'VIP_CC_OUTPUT_Power_1',
-            'VIP_CC_OUTPUT_Power_2',
-            'VIP_CC_OUTPUT_Power_3',
-            'VIP_CC_OUTPUT_Power_4',
-            'CCx_VOLT_IN_MPPT_1',
-            'CCx_VOLT_IN_MPPT_2',
-            'CCx_VOLT_IN_MPPT_3',
-            'CCx_VOLT_IN_MPPT_4',
-            'CCx_CURR_IN_MPPT_1',
-            'CCx_CURR_IN_MPPT_2',
-            'CCx_CURR_IN_MPPT_3',
-            'CCx_CURR_IN_MPPT_4',
-            'CCx_VOLT_OU_MPPT_1',
-            'CCx_VOLT_OU_MPPT_2',
-            'CCx_VOLT_OU_MPPT_3',
-            'CCx_VOLT_OU_MPPT_4',
-            'CCx_CURR_OU_MPPT_1',
-            'CCx_CURR_OU_MPPT_2',
-            'CCx_CURR_OU_MPPT_3',
-            'CCx_CURR_OU_MPPT_4'
-        ]
-
-        for i in range(0, len(data), 2):
-            shifted_data.append(int.from_bytes(data[i:i+2], byteorder='little', signed=True))
-
-        for key, value in zip(new_labels, shifted_data):
-            labeled_data[key] = value 
-        
-        return labeled_data
-
-    @staticmethod
-    def parse_eps_5(data: bytes):
-        labeled_data = {}
-
-        labeled_data['MODE'] = data[0]
-        labeled_data['RESET_CAUSE'] = data[1]
-        labeled_data['UPTIME'] = int.from_bytes(data[2:6], byteorder='little', signed=False)
-        labeled_data['ERROR'] = int.from_bytes(data[6:8], byteorder='little', signed=False)
-        labeled_data['RC_CNT_PWRON'] = int.from_bytes(data[8:10], byteorder='little', signed=False)
-        labeled_data['RC_CNT_WDG'] = int.from_bytes(data[10:12], byteorder='little', signed=False)
-        labeled_data['RC_CNT_CMD'] = int.from_bytes(data[12:14], byteorder='little', signed=False)
-        labeled_data['RC_CNT_MCU'] = int.from_bytes(data[14:16], byteorder='little', signed=False)
-        labeled_data['RC_CNT_EMLOPO'] = int.from_bytes(data[16:18], byteorder='little', signed=False)
-        labeled_data['UNIX_TIME'] = int.from_bytes(data[18:22], byteorder='little', signed=False)
-        labeled_data['UNIX_YEAR'] = int.from_bytes(data[22:26], byteorder='little', signed=False)
-        labeled_data['UNIX_MONTH'] = int.from_bytes(data[26:30], byteorder='little', signed=False)
-        labeled_data['UNIX_DAY'] = int.from_bytes(data[30:34], byteorder='little', signed=False)
-        labeled_data['UNIX_HOUR'] = int.from_bytes(data[34:38], byteorder='little', signed=False)
-        labeled_data['UNIX_MINUTE'] = int.from_bytes(data[38:42], byteorder='little', signed=False)
-        labeled_data['UNIX_SECOND'] = int.from_bytes(data[42:46], byteorder='little', signed=False)
-
-        return labeled_data
-    
-    @staticmethod
-    def parse_eps_6(data: bytes):
-        labeled_data = {}
-        shifted_data = []
-        new_labels = [
-            'STAT_CH_ON',
-            'STAT_CH_OCF',
-            'OCF_CNT_CH00',
-            'OCF_CNT_CH04',
-            'OCF_CNT_CH06',
-            'OCF_CNT_CH07',
-            'OCF_CNT_CH08',
-            'OCF_CNT_CH09',
-            'OCF_CNT_CH10',
-            'OCF_CNT_CH11'
-        ]
-
-        for i in range(0, len(data), 2):
-            shifted_data.append(int.from_bytes(data[i:i+2], byteorder='little', signed=False))
-
-        for key, value in zip(new_labels, shifted_data):
-            labeled_data[key] = value 
-        
-        return labeled_data
-    
-    @staticmethod
-    def parse_taskstats(data: bytes):
-        labeled_data = {}
-        shifted_data = []
-        new_labels = [
-            'TASK_MONITOR_TASK',
-            'TASK_MONITOR_EXEH_PERSISTOR',
-            'TASK_MONITOR_APP_TASK',
-            'TASK_MONITOR_SERVICES',
-            'TASK_MONITOR_SD_MANAGER',
-            'TASK_INSTRUMENTS',
-            'TASK_MONITOR_S_X_BAND',
-            'TASK_MONITOR_CUBEADCS',
-            'TASK_MONITOR_CUBEADCS_FHANDL',
-            'TASK_MONITOR_GNSS',
-            'TASK_PAYLOAD_SCHEDULER',
-            'TASK_TELEMETRY',
-            'TASK_TELEMETRY_FILE_SINK',
-            'TASK_MONITOR_SP',
-            'TASK_MACDRV_DISPATCHER',
-            'TASK_MACTL_DISPATCHER',
-            'TASK_FWUPD_HANDLER',
-            'TASK_ESSA_SP_HANDLER',
-            'TASK_NVM',
-            'TASK_DATACACHE',
-            'TASK_ADCS_TLM',
-            'TASK_CONOPS_PERIODIC_EV',
-            'TASK_MONITOR_PAYLOAD_CTRL',
-            'TASK_BEACONS',
-            'TASK_EPS_CTRL',
-            'TASK_EPS_I',
-            'TASK_EPS_II',
-            'TASK_EPS_M',
-            'TASK_SYS_CLOCK',
-            'TASK_MONITOR_ES_ADCS',
-            'TASK_ACTUATOR_CONTROL_SERVICE',
-            'TASK_SDS',
-            'TASK_AOCS_CNTRL',
-            'TASK_SXBAND_SCHED',
-            'TASK_CRYPTO_SRV',
-            'TASK_MONITOR_TASKS_NUMBER'
-        ]
-
-        for i in range(0, len(data), 2):
-            shifted_data.append(int.from_bytes(data[i:i+2], byteorder='little', signed=True))
-
-        for key, value in zip(islice(new_labels, len(shifted_data)), shifted_data):
-            labeled_data[key] = value
-
-        return labeled_data
-
-    @staticmethod
-    def parse_sensor_mag(data: bytes):
-        labeled_data = {}
-        shifted_data = []
-        new_labels = [
-            'int32__MAG_X',
-            'int32__MAG_Y',
-            'int32__MAG_Z'
-        ]
-
-        for i in range(0, len(data), 4):
-            shifted_data.append(int.from_bytes(data[i:i+4], byteorder='little', signed=True))
-
-        for key, value in zip(new_labels, shifted_data):
-            labeled_data[key] = value 
-        
-        return labeled_data
-
-    @staticmethod
-    def parse_sensor_gyro(data: bytes):
-        labeled_data = {}
-        shifted_data = []
-        new_labels = [
-            'int32__GYRO_1',
-            'int32__GYRO_2',
-            'int32__GYRO_3'
-        ]
-
-        for i in range(0, len(data), 4):
-            shifted_data.append(int.from_bytes(data[i:i+4], byteorder='little', signed=True))
-
-        for key, value in zip(new_labels, shifted_data):
-            labeled_data[key] = value 
-        
-        return labeled_data
-
-    @staticmethod
-    def parse_sensor_coarse_sun(data: bytes):
-        labeled_data = {}
-        shifted_data = []
-        new_labels = [
-            'CSS_PANEL_1',
-            'CSS_PANEL_2',
-            'CSS_PANEL_3',
-            'CSS_PANEL_4',
-            'CSS_PANEL_5',
-            'CSS_PANEL_6'
-        ]
-
-        for i in range(0, len(data), 4):
-            shifted_data.append(int.from_bytes(data[i:i+4], byteorder='little', signed=True))
-
-        for key, value in zip(new_labels, shifted_data):
-            labeled_data[key] = value 
-        
-        return labeled_data
-
-    @staticmethod
-    def parse_es_adcs_sensor_mag(data: bytes):
-        labeled_data = {}
-        shifted_data = []
-        new_labels = [
-            'MAG_X_CURRENT',
-            'MAG_Y_CURRENT',
-            'MAG_Z_CURRENT',
-            'MAG_X_PREVIOUS',
-            'MAG_Y_PREVIOUS',
-            'MAG_Z_PREVIOUS'
-        ]
-
-        for i in range(0, len(data), 4):
-            shifted_data.append(int.from_bytes(data[i:i+4], byteorder='little', signed=True))
-
-        for key, value in zip(new_labels, shifted_data):
-            labeled_data[key] = value 
-        
-        return labeled_data
-    
-    @staticmethod
-    def parse_es_adcs_sensor_gyro(data: bytes):
-        labeled_data = {}
-        shifted_data = []
-        new_labels = [
-            'GYRO_X',
-            'GYRO_Y',
-            'GYRO_Z'
-        ]
-
-        for i in range(0, len(data), 4):
-            shifted_data.append(int.from_bytes(data[i:i+4], byteorder='little', signed=True))
-
-        for key, value in zip(new_labels, shifted_data):
-            labeled_data[key] = value 
-        
-        return labeled_data
-    
-    @staticmethod
-    def parse_es_adcs_sensor_css(data: bytes):
-        labeled_data = {}
-        shifted_data = []
-        new_labels = [
-            'CSS_AXIS_X_PLUS',
-            'CSS_AXIS_Y_PLUS',
-            'CSS_AXIS_Z_PLUS',
-            'CSS_AXIS_X_MINUS',
-            'CSS_AXIS_Y_MINUS',
-            'CSS_AXIS_Z_MINUS'
-        ]
-
-        for i in range(0, len(data), 4):
-            shifted_data.append(int.from_bytes(data[i:i+4], byteorder='little', signed=True))
-
-        for key, value in zip(new_labels, shifted_data):
-            labeled_data[key] = value 
-        
-        return labeled_data
-    
-    @staticmethod
-    def parse_es_adcs_estimates_bdot(data: bytes):
-        labeled_data = {}
-        shifted_data = []
-        new_labels = [
-            'MAG_FIELD_DERIV_X',
-            'MAG_FIELD_DERIV_Y',
-            'MAG_FIELD_DERIV_Z'
-        ]
-
-        for i in range(0, len(data), 4):
-            shifted_data.append(int.from_bytes(data[i:i+4], byteorder='little', signed=True))
-
-        for key, value in zip(new_labels, shifted_data):
-            labeled_data[key] = value 
-        
-        return labeled_data
-    
-    @staticmethod
-    def parse_es_adcs_control_values_mtq(data: bytes):
-        labeled_data = {}
-        new_labels = [
-            'MAGTORQUE_VALUE_X',
-            'MAGTORQUE_VALUE_Y',
-            'MAGTORQUE_VALUE_Z'
-        ]
-
-        for key, value in zip(new_labels, data):
-            labeled_data[key] = int.from_bytes(value, byteorder='little', signed=True) 
-        
-        return labeled_data
-    
-    @staticmethod
-    def parse_conops_flags(data: bytes):
-        labeled_data = {}
-        new_labels = [
-            'PAY_ERR',
-            'ADCS_ERR',
-            'DETUMB_COMPLETED'
-        ]
-
-        for key, value in zip(new_labels, data):
-            labeled_data[key] = int.from_bytes(value, byteorder='little', signed=False)  
-        
-        return labeled_data
-    
-    @staticmethod
-    def parse_aocs_cntrl_sys_state(data: bytes):
-        labeled_data = {}
-        new_labels = [
-            'adcsSysState',
-            'adcsSysStateStatus',
-        ]
-
-        for key, value in zip(new_labels, data):
-            labeled_data[key] = labeled_data[key] = int.from_bytes(value, byteorder='little', signed=False) 
-        
-        return labeled_data
-    
-    @staticmethod
-    def parse_adcs_3(data: bytes):
-        labeled_data = {}
-        shifted_data = []
-        new_labels = [
-            'est_roll_angle',
-            'est_pitch_angle',
-            'est_yaw_angle',
-            'IGRF_MagField_X',
-            'IGRF_MagField_Y',
-            'IGRF_MagField_Z',
-            'Modelled_Sun_V_X',
-            'Modelled_Sun_V_Y',
-            'Modelled_Sun_V_Z',
-            'EstGyroBias_X',
-            'EstGyroBias_Y',
-            'EstGyroBias_Z',
-            'Innovation_Vec_X',
-            'Innovation_Vec_Y',
-            'Innovation_Vec_Z',
-            'Err_Q1',
-            'Err_Q2',
-            'Err_Q3',
-            'RMS_Q1',
-            'RMS_Q2',
-            'RMS_Q3',
-            'X_AngRate_Cov',
-            'Y_AngRate_Cov',
-            'Z_AngRate_Cov',
-            'X_Rate',
-            'Y_Rate',
-            'Z_Rate',
-            'Q0',
-            'Q1',
-            'Q2'
-        ]
-
-        for i in range(0, len(data), 2):
-            shifted_data.append(int.from_bytes(data[i:i+2], byteorder='little', signed=True))
-
-        for key, value in zip(new_labels, shifted_data):
-            labeled_data[key] = value 
-        
-        return labeled_data
-    
-    @staticmethod
-    def parse_adcs_4(data: bytes):
-        labeled_data = {}
-        shifted_data = []
-        new_labels = [
-            'Cubesense1_3V3_Current'
-            'Cubesense1_SRAM_Current'
-            'Cubesense2_3V3_Current'
-            'Cubesense2_SRAM_Current'
-            'CubeControl_3V3_Current'
-            'CubeControl_5V_Current'
-            'CubeControl_Vbat_Current'
-            'Wheel_1_Current'
-            'Wheel_2_Current'
-            'Wheel_3_Current'
-            'CubeStar_Current'
-            'MTQ_Current'
-            'CubeStar_MCU_Temp'
-            'ADCS_MCU_Temp'
-            'MTM_Temp'
-            'RMTM_Temp'
-            'X_Rate_Sensor_Temp'
-            'Y_Rate_Sensor_Temp'
-            'Z_Rate_Sensor_Temp'
-        ]
-
-        for i in range(0, 24, 2):
-            shifted_data.append(int.from_bytes(data[i:i+2], byteorder='little', signed=False))
-
-        for i in range(24, len(data), 2):
-            shifted_data.append(int.from_bytes(data[i:i+2], byteorder='little', signed=True))
-
-        for key, value in zip(new_labels, shifted_data):
-            labeled_data[key] = value 
-        
-        return labeled_data
-
     def __str__(self):
         str_repr = f"\nBeaconMsgHeader> DC ID: {self.header.dc_id} | Flag D: {hex(self.header.flag_d)} | Flag E: {hex(self.header.flag_e)} | MSG Length: {hex(self.header.msg_length)}\n"
         str_repr += "BeaconMsgData>\n" + "\n".join(f"{str(key) + ':':<40} {value}" for key, value in self.labeled_data.items())
@@ -857,6 +288,9 @@ class BeaconMsg:
 
 class BeaconHeader:
     HEADER_SIZE = 7
+    CONSECUTIVE_NUMBER_MODULO = 256
+
+    __slots__ = ("beacon_consecutive_number", "uhf_address", "flag_a", "obc_address", "data_id", "flag_b", "flag_c")
    
     def __init__(self):
         self.beacon_consecutive_number = 0
@@ -895,89 +329,274 @@ class BeaconHeader:
 
 class Beacon:
     BEACON_SIZE = 77
+    __slots__ = ("beacon_header", "msg_list", "data", "current_pos", "errors")
+
     def __init__(self, data: bytes):
         self.beacon_header = BeaconHeader()
         self.msg_list = []
         self.data = data
         self.current_pos = 0
 
+        # (reason, offset, skipped bytes) of every problem found while parsing
+        self.errors = []
+
+    # @brief Parses the beacon header and its messages.
+    #
+    # @details Message headers are validated before their data is taken. After
+    #          an invalid header the parser skips ahead to the next plausible
+    #          header, or to the end of the beacon, and records the problem in
+    #          errors instead of raising. Frames shorter than BEACON_SIZE are
+    #          recorded as "truncated" and parsed as far as they go.
+
     def parse(self):
-        header_data = self.data[:BeaconHeader.HEADER_SIZE]
-        self.beacon_header.parse(header_data)
+        view = memoryview(self.data)
+        if len(view) < BeaconHeader.HEADER_SIZE:
+            self.errors.append(("truncated", 0, len(view)))
+            return
+        if len(view) < Beacon.BEACON_SIZE:
+            self.errors.append(("truncated", len(view), 0))
+
+        self.beacon_header.parse(view[:BeaconHeader.HEADER_SIZE])
         self.current_pos = BeaconHeader.HEADER_SIZE
+        end = min(len(view), Beacon.BEACON_SIZE)
 
         while self.current_pos < Beacon.BEACON_SIZE - BeaconMsgHeader.MSG_HEADER_SIZE:
+            if self.current_pos + BeaconMsgHeader.MSG_HEADER_SIZE > end:
+                break
+
             msg = BeaconMsg()
-            msg_header_data = self.data[self.current_pos:self.current_pos + BeaconMsgHeader.MSG_HEADER_SIZE]
-            msg.header.parse(msg_header_data)
-            self.current_pos += BeaconMsgHeader.MSG_HEADER_SIZE
+            msg.header.parse(view[self.current_pos:self.current_pos + BeaconMsgHeader.MSG_HEADER_SIZE])
 
             if msg.header.dc_id == 'Unknown':
                 break
 
+            problem = msg.header.validate()
+            if problem is not None:
+                resync_pos = Beacon.next_plausible_header(view, self.current_pos + 1, end)
+                self.errors.append((problem, self.current_pos, resync_pos - self.current_pos))
+                self.current_pos = resync_pos
+                continue
+
+            self.current_pos += BeaconMsgHeader.MSG_HEADER_SIZE
+
+            # A message running past the end of the beacon continues in the next one
             if self.current_pos + msg.header.msg_length > Beacon.BEACON_SIZE:
-                msg_data = self.data[self.current_pos:Beacon.BEACON_SIZE]
-                msg.parse(msg_data)
+                msg.parse(view[self.current_pos:Beacon.BEACON_SIZE])
                 msg.partial = True
             else:
-                msg_data = self.data[self.current_pos:self.current_pos + msg.header.msg_length]
-                msg.parse(msg_data)
+                msg.parse(view[self.current_pos:self.current_pos + msg.header.msg_length])
 
             self.current_pos += msg.header.msg_length
             
             self.msg_list.append(msg)  
 
+    # Returns the first position from pos that holds a valid message header or the
+    # padding that ends a beacon, end if there is none
+    @staticmethod
+    def next_plausible_header(view, pos: int, end: int) -> int:
+        header = BeaconMsgHeader()
+        while pos + BeaconMsgHeader.MSG_HEADER_SIZE <= end and pos < Beacon.BEACON_SIZE - BeaconMsgHeader.MSG_HEADER_SIZE:
+            header.parse(view[pos:pos + BeaconMsgHeader.MSG_HEADER_SIZE])
+            if header.dc_id == 'Unknown' or header.validate() is None:
+                return pos
+            pos += 1
+        return end
+
+
+# @brief Appends the raw bytes of beacons that could not be fully parsed to a side
+#        log, one JSON object per line, for later analysis.
+#
+# @param path File the beacons are appended to, its folder is created on first use.
+
+class BeaconQuarantine:
+    DEFAULT_PATH = os.path.join(os.path.dirname(__file__), "quarantine", "beacons.jsonl")
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        self.file = None
+
+    def write(self, beacon):
+        if self.file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self.file = open(self.path, "a")
+
+        record = {
+            "time": time.time(),
+            "beacon_consecutive_number": beacon.beacon_header.beacon_consecutive_number,
+            "errors": [{"reason": reason, "offset": offset, "skipped": skipped} for reason, offset, skipped in beacon.errors],
+            "raw": bytes(beacon.data).hex(),
+        }
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+# @brief Parses consecutive beacons and reassembles messages split across them.
+#
+# @details The beginning of a message that runs past the end of a beacon is kept
+#          in a carry buffer. Every following beacon must carry the next part as
+#          its first message: same dc_id, a msg_length equal to what is still
+#          missing, and the next consecutive number. Messages may span any number
+#          of beacons. If a beacon is lost or the next part does not match, the
+#          carried bytes are dropped rather than stitched to unrelated data, and a
+#          later part of the same message is dropped instead of being labeled as a
+#          message of its own. A part arriving when nothing is carried, because
+#          the beacon with its beginning was lost, cannot be told apart from a new
+#          message and is labeled as one.
+#          Complete messages whose data is shorter than their msg_length are
+#          dropped too. Both cases are counted in the metrics registry, if any.
+#          Invalid message headers never raise: every problem Beacon.parse finds
+#          is counted as beacon_<reason> and the beacon is quarantined.
+#
+# @param beacon_queue Queue the labeled data of every complete message is put on.
+# @param metrics Optional MetricsRegistry timing the parser stages.
+# @param quarantine Optional BeaconQuarantine receiving beacons with errors.
 
 class Beacon_Parser:
-    def __init__(self, beacon_queue):
+    def __init__(self, beacon_queue, metrics=None, quarantine=None):
         self.beacon_queue = beacon_queue
+        self.metrics = metrics
+        self.quarantine = quarantine
         self.cmplt_msg_list = []
-        self.partial_msg = None
         self.complete_msg = None
-    
+
+        # Message being reassembled, its bytes so far and the beacon expected next.
+        # A broken carry is the rest of a message that lost a part, it is read
+        # to its end so none of it is mistaken for a message, then dropped.
+        self.partial_msg = None
+        self.carry = bytearray()
+        self.carry_next_number = None
+        self.carry_broken = False
+
+        # Number of the last beacon parsed, a gap after it may have lost the start of
+        # the first message of the next one
+        self.last_number = None
+
+    def _count(self, name: str):
+        if self.metrics is not None:
+            self.metrics.increment(name)
+
+    # Labels a complete message and puts its labeled data on the beacon queue
+    def complete(self, msg):
+        if len(msg.data) != msg.header.msg_length:
+            self._count("beacon_msg_length_errors")
+            return
+
+        start = time.monotonic()
+        msg.label()
+        if self.metrics is not None:
+            self.metrics.observe_since("label", start)
+        if len(msg.labeled_data) <= 1:
+            self._count("beacon_empty_records")
+            return
+
+        self.complete_msg = msg
+        self.cmplt_msg_list.append(self.complete_msg)
+        self.beacon_queue.put(self.complete_msg.labeled_data)
+
+    # @brief Tells whether a message is as long as its DC entry, the length of a start
+    #        fragment being the length of the whole message.
+    #
+    # @details A shorter one is the end of a message whose start was lost. Entries
+    #          with no schema cannot be told apart and are taken as full length.
+
+    @staticmethod
+    def is_full_length(msg) -> bool:
+        schema = SCHEMAS_BY_NAME.get(msg.header.dc_id)
+        if schema is None:
+            return True
+        length = msg.header.msg_length
+        if schema.has_variable_count():
+            return schema.variable_count_for(length) is not None and length <= schema.max_size()
+        return length >= schema.size()
+
+    def drop_carry(self):
+        if self.partial_msg is not None and not self.carry_broken:
+            self._count("beacon_fragments_dropped")
+        self.partial_msg = None
+        self.carry.clear()
+        self.carry_next_number = None
+        self.carry_broken = False
+
+    # Starts carrying a message that continues in the next beacon
+    def start_carry(self, msg, beacon_number: int, broken: bool = False):
+        self.partial_msg = msg
+        self.carry[:] = msg.data
+        self.carry_next_number = (beacon_number + 1) % BeaconHeader.CONSECUTIVE_NUMBER_MODULO
+        self.carry_broken = broken
+
+    # Adds the first message of a beacon to the carried message. Returns True if
+    # the message was consumed, either as the next part or as a later part whose
+    # predecessor was lost, and False if it is unrelated to the carried message.
+    def continue_carry(self, msg, beacon_number: int) -> bool:
+        missing = self.partial_msg.header.msg_length - len(self.carry)
+        if msg.header.dc_id != self.partial_msg.header.dc_id or msg.header.msg_length > missing:
+            self.drop_carry()
+            return False
+
+        if beacon_number != self.carry_next_number or msg.header.msg_length != missing:
+            self.drop_carry()
+            if msg.partial:
+                self.start_carry(msg, beacon_number, broken=True)
+            return True
+
+        self.carry += msg.data
+        if msg.partial:
+            self.carry_next_number = (beacon_number + 1) % BeaconHeader.CONSECUTIVE_NUMBER_MODULO
+            return True
+
+        carried = self.partial_msg
+        broken = self.carry_broken
+        carried.data = bytes(self.carry)
+        carried.partial = False
+        self.partial_msg = None
+        self.drop_carry()
+        if not broken:
+            self.complete(carried)
+        return True
+
     def parse_beacon(self, data):
         # Create and parse new beacon
+        start = time.monotonic()
         new_beacon = Beacon(data)
         new_beacon.parse()
-
-        # Check if the previous message was partial
+        if self.metrics is not None:
+            self.metrics.observe_since("beacon_parse", start)
+
+        if new_beacon.errors:
+            for reason, offset, skipped in new_beacon.errors:
+                self._count(f"beacon_{reason}")
+            if self.quarantine is not None:
+                self.quarantine.write(new_beacon)
+
+        number = new_beacon.beacon_header.beacon_consecutive_number
+        msgs = new_beacon.msg_list
+        gap = self.last_number is None or number != (self.last_number + 1) % BeaconHeader.CONSECUTIVE_NUMBER_MODULO
+        self.last_number = number
+
+        # The first message continues the carried one, unless the chain was broken
+        first = 0
         if self.partial_msg is not None:
-            # If so, set complete message to partial message and add the data of the new message
-            self.complete_msg = self.partial_msg
-            self.complete_msg.data += new_beacon.msg_list[0].data
-
-            # Add the newly completed message to the message list
-            self.complete_msg.label()
-            self.cmplt_msg_list.append(self.complete_msg)
-            self.beacon_queue.put(self.cmplt_msg_list[-1].labeled_data)
-
-            # Add all other complete messages to the message list
-            for i in range(1, len(new_beacon.msg_list)):
-                if new_beacon.msg_list[i].partial == False:
-                    self.complete_msg = new_beacon.msg_list[i]
-                    self.complete_msg.label()
-                    self.cmplt_msg_list.append(self.complete_msg)
-                    self.beacon_queue.put(self.cmplt_msg_list[-1].labeled_data)
-
-
-        # If previous message wasn't partial...
-        else:
-            # Add all complete messages to the list
-            for i in range(0, len(new_beacon.msg_list)):
-                if new_beacon.msg_list[i].partial == False:
-                    self.complete_msg = new_beacon.msg_list[i]
-                    self.complete_msg.label()
-                    self.cmplt_msg_list.append(self.complete_msg)
-                    self.beacon_queue.put(self.cmplt_msg_list[-1].labeled_data)
-
-        if len(new_beacon.msg_list) > 0:
-            # If the final message in the beacon message list is partial...
-            if new_beacon.msg_list[-1].partial == True:
-                # Set partial_msg to the final message in the beacon message list
-                self.partial_msg = new_beacon.msg_list[-1]
-
-            # Otherwise, set partial_message to none
+            if not msgs:
+                self.drop_carry()
+            elif self.continue_carry(msgs[0], number):
+                first = 1
+
+        # After a gap the first message may be the rest of one that was never carried
+        if first == 0 and gap and self.partial_msg is None and msgs and not Beacon_Parser.is_full_length(msgs[0]):
+            self._count("beacon_fragments_dropped")
+            if msgs[0].partial:
+                self.start_carry(msgs[0], number, broken=True)
+            first = 1
+
+        for msg in msgs[first:]:
+            if msg.partial:
+                self.start_carry(msg, number)
             else:
-                self.partial_msg = None
+                self.complete(msg)
 
-        
\ No newline at end of file
+        return new_beacon
@@ -0,0 +1,143 @@
+ ##############################################################################
+ # @file           : bitfields.py
+ # @brief          : Declarative bitfield specs compiled into fast decoders.
+ #                   Shared by the telemetry and beacon parsers for state and
+ #                   flag words such as the ADCS_2 state.
+ ##############################################################################
+
+
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# @brief One field of a bitfield spec.
+#
+# @param name Output key of the field.
+# @param byte Index of the byte holding the field's least significant bit.
+# @param shift Position of that bit within the byte, 0 is the least significant bit.
+# @param width Number of bits, fields may run into the following bytes (little endian).
+
+BitField = namedtuple("BitField", ["name", "byte", "shift", "width"])
+
+
+# @brief A set of bitfields packed into size bytes.
+#
+# @details The spec is compiled once into a Python function that reads every
+#          byte it needs a single time and returns the fields as a dict, in the
+#          order they are declared. decode_batch() decodes many rows at once with
+#          numpy.unpackbits.
+#
+# @param name Name of the spec, used for the generated function.
+# @param fields List of BitField.
+# @param size Number of bytes, defaults to the last byte used by a field.
+
+class BitFieldSpec:
+    def __init__(self, name: str, fields, size: int = None):
+        self.name = name
+        self.fields = tuple(fields)
+        self.size = size if size is not None else max((f.byte * 8 + f.shift + f.width + 7) // 8 for f in self.fields)
+        self.decode = self._compile_bytes_decoder()
+
+    def _compile_bytes_decoder(self):
+        used_bytes = sorted({byte for f in self.fields for byte in range(f.byte, (f.byte * 8 + f.shift + f.width + 7) // 8)})
+        lines = [f"def decode_{self.name}(data):"]
+        lines += [f"    b{byte} = data[{byte}]" for byte in used_bytes]
+        lines.append("    return {")
+        for f in self.fields:
+            # Combine the bytes the field spans into one little endian word first
+            last = (f.byte * 8 + f.shift + f.width - 1) // 8
+            word = " | ".join(f"(b{byte} << {(byte - f.byte) * 8})" if byte != f.byte else f"b{byte}"
+                              for byte in range(f.byte, last + 1))
+            if last != f.byte:
+                word = f"({word})"
+            value = f"({word} >> {f.shift})" if f.shift else word
+            lines.append(f"        {f.name!r}: {value} & {(1 << f.width) - 1:#x},")
+        lines.append("    }")
+        return self._exec("\n".join(lines), f"decode_{self.name}")
+
+    @staticmethod
+    def _exec(source: str, function_name: str):
+        namespace = {}
+        exec(compile(source, f"<bitfield {function_name}>", "exec"), namespace)
+        return namespace[function_name]
+
+    # @brief Decodes many rows of size bytes at once.
+    #
+    # @param rows Sequence of byte strings or lists of ints, or an (n, size) uint8 array.
+    # @return {name: values} with one NumPy array per field, lists without NumPy.
+
+    def decode_batch(self, rows) -> dict:
+        if np is None:
+            decoded = [self.decode(row) for row in rows]
+            return {f.name: [d[f.name] for d in decoded] for f in self.fields}
+
+        if not isinstance(rows, np.ndarray):
+            rows = np.frombuffer(b"".join(bytes(row[:self.size]) for row in rows), dtype=np.uint8)
+        rows = rows.reshape(-1, self.size)
+        bits = np.unpackbits(rows, axis=1, bitorder="little")
+
+        columns = {}
+        for f in self.fields:
+            offset = f.byte * 8 + f.shift
+            if f.width == 1:
+                columns[f.name] = bits[:, offset].astype(np.int64)
+            else:
+                weights = np.left_shift(1, np.arange(f.width, dtype=np.int64))
+                columns[f.name] = bits[:, offset:offset + f.width].astype(np.int64) @ weights
+        return columns
+
+
+# @var ADCS_2_STATE The six byte adcsState of ADCS_2 (CubeADCS state telemetry).
+
+ADCS_2_STATE = BitFieldSpec("ADCS_2_STATE", [
+    BitField('Attitude_Estimation_Mode', 0, 0, 4),
+    BitField('Control_Mode', 0, 4, 4),
+
+    BitField('ADCS_Run_Mode', 1, 0, 1),
+    BitField('ASGP4_Mode', 1, 1, 1),
+    BitField('CubeControl_Signal_Enabled', 1, 2, 1),
+    BitField('CubeControl_Motor_Enabled', 1, 3, 1),
+    BitField('CubeSense1_Enabled', 1, 4, 2),
+    BitField('CubeSense2_Enabled', 1, 6, 2),
+
+    BitField('CubeWheel1_Enabled', 2, 0, 1),
+    BitField('CubeWheel2_Enabled', 2, 1, 1),
+    BitField('CubeWheel3_Enabled', 2, 2, 1),
+    BitField('CubeStar_Enabled', 2, 3, 1),
+    BitField('GPS_Receiver_Enabled', 2, 4, 1),
+    BitField('GPS_LNA_Power_Enabled', 2, 5, 1),
+    BitField('Motor_Driver_Enabled', 2, 6, 1),
+    BitField('Sun_is_Above_Local_Horizon', 2, 7, 1),
+
+    BitField('CubeSense1_Communications_Error', 3, 0, 1),
+    BitField('CubeSense2_Communications_Error', 3, 1, 1),
+    BitField('CubeControl_Signal_Communications_Error', 3, 2, 1),
+    BitField('CubeControl_Motor_Communications_Error', 3, 3, 1),
+    BitField('CubeWheel1_Communications_Error', 3, 4, 1),
+    BitField('CubeWheel2_Communications_Error', 3, 5, 1),
+    BitField('CubeWheel3_Communications_Error', 3, 6, 1),
+    BitField('CubeStar_Communications_Error', 3, 7, 1),
+
+    BitField('Magnetometer_Range_Error', 4, 0, 1),
+    BitField('Cam1_SRAM_Overcurrent_Detected', 4, 1, 1),
+    BitField('Cam1_3V3_Overcurrent_Detected', 4, 2, 1),
+    BitField('Cam1_Sensor_Busy_Error', 4, 3, 1),
+    BitField('Cam1_Sensor_Detection_Error', 4, 4, 1),
+    BitField('Sun_Sensor_Range_Error', 4, 5, 1),
+    BitField('Cam2_SRAM_Overcurrent_Detected', 4, 6, 1),
+    BitField('Cam2_3V3_Overcurrent_Detected', 4, 7, 1),
+
+    BitField('Cam2_Sensor_Busy_Error', 5, 0, 1),
+    BitField('Cam2_Sensor_Detection_Error', 5, 1, 1),
+    BitField('Nadir_Sensor_Range_Error', 5, 2, 1),
+    BitField('Rate_Sensor_Range_Error', 5, 3, 1),
+    BitField('Wheel_Speed_Range_Error', 5, 4, 1),
+    BitField('Coarse_Sun_Sensor_Error', 5, 5, 1),
+    BitField('StarTracker_Match_Error', 5, 6, 1),
+    BitField('StarTracker_Overcurrent_Detected', 5, 7, 1),
+])
+
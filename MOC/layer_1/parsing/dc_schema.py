@@ -0,0 +1,555 @@
+ ##############################################################################
+ # @file           : dc_schema.py
+ # @brief          : Registry of every datacache (dc) entry: id, name, field
+ #                   layout, column names and bitfields. The telemetry and
+ #                   beacon decoders are compiled from it.
+ ##############################################################################
+
+
+import hashlib
+import struct
+from collections import namedtuple
+from functools import lru_cache
+from layer_1.parsing.bitfields import ADCS_2_STATE
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# @var TYPE_FORMATS struct format character of every datacache basic type (little endian).
+
+TYPE_FORMATS = {
+    "uint8": "B",
+    "int8": "b",
+    "uint16": "H",
+    "int16": "h",
+    "uint32": "I",
+    "int32": "i",
+    "uint64": "Q",
+    "int64": "q",
+}
+
+
+# @brief One field of a datacache entry.
+#
+# @param name Field name, without the type prefix datacache.py puts in front of it.
+# @param type Basic type, a key of TYPE_FORMATS.
+# @param count Number of elements for arrays, None for scalars. VARIABLE_COUNT for
+#              arrays whose length depends on the OBC configuration (TaskStats).
+# @param columns Names of the array elements once flattened, defaults to name_1, name_2, ...
+# @param key_type Type written in the datacache.py attribute name if it differs from type.
+
+DcField = namedtuple("DcField", ["name", "type", "count", "columns", "key_type"], defaults=(None, None, None))
+
+VARIABLE_COUNT = -1
+
+# @var DECODER_REVISION Bumped when decoding changes in a way the schemas do not show
+#      (e.g. a fix in the generated code), so that cached and stored records are redone.
+
+DECODER_REVISION = 2
+
+
+# @brief Describes one datacache entry and compiles decoders for it.
+#
+# @details Telemetry (TLM) records either keep the datacache.py attribute names
+#          (e.g. 'uint8__opMode', arrays as lists) or, with flatten_tlm, use one
+#          column per element like beacons do. Beacon records always use flat
+#          column names. A field with a bitfield spec is replaced by its bits in
+#          both. Decoders are generated Python functions built around a single
+#          struct.unpack_from and cached, so they are compiled once per layout.
+#
+# @param dc_id The datacache id.
+# @param name The datacache name, e.g. "OBC_0".
+# @param fields List of DcField, in wire order.
+# @param flatten_tlm Use flat columns for TLM records instead of datacache attribute names.
+# @param tlm_columns {field name: column or columns} where TLM names differ from beacon names.
+# @param beacon_columns {field name: column or columns} where beacon names differ from the default.
+# @param bitfields {field name: BitFieldSpec} decoded into their bits in every record.
+# @param tlm_flatten_counts For VARIABLE_COUNT fields, the counts whose TLM records are
+#        flattened (other counts keep the raw array).
+
+class DcSchema:
+    def __init__(self, dc_id: int, name: str, fields, flatten_tlm: bool = False, tlm_columns=None,
+                 beacon_columns=None, bitfields=None, tlm_flatten_counts=()):
+        self.dc_id = dc_id
+        self.name = name
+        self.fields = tuple(fields)
+        self.flatten_tlm = flatten_tlm
+        self.tlm_columns = tlm_columns or {}
+        self.beacon_columns = beacon_columns or {}
+        self.bitfields = bitfields or {}
+        self.tlm_flatten_counts = tlm_flatten_counts
+        self._tlm_decoders = {}
+        self._tlm_decoders_by_length = {}
+        self._beacon_decoders = {}
+
+    # Attribute name of a field in datacache.py, also the key of unflattened TLM records
+    @staticmethod
+    def datacache_key(field: DcField) -> str:
+        key_type = field.key_type or field.type
+        if field.count is None:
+            return f"{key_type}__{field.name}"
+        return f"a__{key_type}__{field.name}"
+
+    def has_variable_count(self) -> bool:
+        return any(field.count == VARIABLE_COUNT for field in self.fields)
+
+    # Returns the element counts of every field for a given variable count
+    def counts(self, variable_count: int = None) -> list:
+        return [variable_count if field.count == VARIABLE_COUNT else field.count for field in self.fields]
+
+    def size(self, variable_count: int = None) -> int:
+        return sum(struct.calcsize(TYPE_FORMATS[field.type]) * (count or 1)
+                   for field, count in zip(self.fields, self.counts(variable_count)))
+
+    # @brief Length of the VARIABLE_COUNT arrays of a TLM message of length bytes.
+    #
+    # @details The OBC build sets the length of these arrays (30 or 36 tasks in TaskStats),
+    #          the messages carry no other sign of it than their size.
+    #
+    # @return The count that fills the message exactly, default if there is none.
+
+    def variable_count_for(self, length: int, default: int = None):
+        fixed = 0
+        per_element = 0
+        for field in self.fields:
+            item_size = struct.calcsize(TYPE_FORMATS[field.type])
+            if field.count == VARIABLE_COUNT:
+                per_element += item_size
+            else:
+                fixed += item_size * (field.count or 1)
+        if per_element == 0 or length < fixed or (length - fixed) % per_element:
+            return default
+        return (length - fixed) // per_element
+
+    # Largest message of this entry, VARIABLE_COUNT arrays as long as their column names allow
+    def max_size(self) -> int:
+        variable_counts = [len(field.columns) for field in self.fields if field.count == VARIABLE_COUNT and field.columns]
+        return self.size(max(variable_counts, default=None))
+
+    def struct_format(self, counts) -> str:
+        return "<" + "".join(f"{count or ''}{TYPE_FORMATS[field.type]}" for field, count in zip(self.fields, counts))
+
+    @staticmethod
+    def _element_columns(field: DcField, columns, count: int) -> list:
+        if isinstance(columns, str):
+            return [columns]
+        if columns is None:
+            columns = field.columns or [f"{field.name}_{i + 1}" for i in range(count)]
+        return list(columns)[:count]
+
+    # @brief Lays out the output of a record.
+    #
+    # @param counts Element count of each field that is decoded, fields past the
+    #        end of counts are not decoded.
+    # @param tlm True for TLM records, False for beacon records.
+    # @return A list of (kind, key, start, stop) where start:stop index the values
+    #         unpacked by struct. kind is "scalar", "list", "columns" (key is then
+    #         a list of column names) or "bits" (key is then a BitFieldSpec).
+
+    def layout(self, counts, tlm: bool) -> list:
+        entries = []
+        pos = 0
+        for field, count in zip(self.fields, counts):
+            n = count or 1
+            if field.name in self.bitfields:
+                entries.append(("bits", self.bitfields[field.name], pos, pos + n))
+            elif tlm and not self._flatten_tlm_field(field, count):
+                kind = "scalar" if count is None else "list"
+                entries.append((kind, DcSchema.datacache_key(field), pos, pos + n))
+            else:
+                overrides = self.tlm_columns if tlm else self.beacon_columns
+                if count is None:
+                    column = overrides.get(field.name, field.name)
+                    entries.append(("scalar", column, pos, pos + 1))
+                else:
+                    columns = DcSchema._element_columns(field, overrides.get(field.name), count)
+                    entries.append(("columns", columns, pos, pos + len(columns)))
+            pos += n
+        return entries
+
+    def _flatten_tlm_field(self, field: DcField, count) -> bool:
+        if field.count == VARIABLE_COUNT:
+            return count in self.tlm_flatten_counts
+        return self.flatten_tlm
+
+    # @brief Generates the source of a decoder for a layout and compiles it.
+
+    def _compile(self, counts, tlm: bool, function_name: str):
+        unpacker = struct.Struct(self.struct_format(counts))
+        namespace = {"unpack_from": unpacker.unpack_from}
+        items = []
+        bit_calls = []
+
+        for kind, key, start, stop in self.layout(counts, tlm):
+            if kind == "scalar":
+                items.append(f"{key!r}: v[{start}]")
+            elif kind == "list":
+                items.append(f"{key!r}: list(v[{start}:{stop}])")
+            elif kind == "columns":
+                items += [f"{column!r}: v[{start + i}]" for i, column in enumerate(key)]
+            else:
+                spec_name = f"bits_{len(bit_calls)}"
+                namespace[spec_name] = key.decode
+                bit_calls.append(f"**{spec_name}(v[{start}:{stop}])")
+
+        body = ", ".join(items + bit_calls)
+        source = f"def {function_name}(data):\n    v = unpack_from(data)\n    return {{{body}}}\n"
+        exec(compile(source, f"<dc_schema {function_name}>", "exec"), namespace)
+        decoder = namespace[function_name]
+        decoder.size = unpacker.size
+        return decoder
+
+    # @brief Returns the TLM record decoder, compiled on first use.
+    #
+    # @param variable_count Length of VARIABLE_COUNT arrays, e.g. NUM_TASKS.
+    # @return decoder(data) -> dict, data must hold at least decoder.size bytes.
+
+    def tlm_decoder(self, variable_count: int = None):
+        decoder = self._tlm_decoders.get(variable_count)
+        if decoder is None:
+            decoder = self._compile(self.counts(variable_count), True, f"decode_tlm_{self.name}")
+            self._tlm_decoders[variable_count] = decoder
+        return decoder
+
+    # @brief Returns the TLM record decoder for a message of length bytes.
+    #
+    # @details VARIABLE_COUNT arrays are sized from the length, see variable_count_for(),
+    #          so messages of different OBC builds decode side by side. One decoder is
+    #          compiled per layout and looked up by length afterwards.
+    #
+    # @param default_count Length of VARIABLE_COUNT arrays if the message length does not tell.
+
+    def tlm_decoder_for(self, length: int, default_count: int = None):
+        decoder = self._tlm_decoders_by_length.get((length, default_count))
+        if decoder is None:
+            decoder = self.tlm_decoder(self.variable_count_for(length, default_count))
+            self._tlm_decoders_by_length[(length, default_count)] = decoder
+        return decoder
+
+    # @brief Returns the beacon record decoder for a message of length bytes.
+    #
+    # @details Beacon messages shorter than the full entry are decoded as far as
+    #          they go: fields that do not fit are left out and arrays are cut
+    #          short. VARIABLE_COUNT arrays take whatever data is left.
+
+    def beacon_decoder(self, length: int):
+        decoder = self._beacon_decoders.get(length)
+        if decoder is None:
+            counts = []
+            remaining = length
+            for field in self.fields:
+                item_size = struct.calcsize(TYPE_FORMATS[field.type])
+                if field.count is None:
+                    if remaining < item_size:
+                        break
+                    counts.append(None)
+                    remaining -= item_size
+                    continue
+
+                count = field.count
+                if count == VARIABLE_COUNT:
+                    count = len(field.columns) if field.columns else remaining // item_size
+                count = min(count, remaining // item_size)
+                if count == 0 or (field.name in self.bitfields and count < field.count):
+                    break
+                counts.append(count)
+                remaining -= count * item_size
+
+            decoder = self._compile(counts, False, f"decode_beacon_{self.name}")
+            self._beacon_decoders[length] = decoder
+        return decoder
+
+    # Everything that shapes the decoded records, see decoder_version()
+    def fingerprint(self) -> str:
+        bitfields = sorted((name, spec.name, spec.fields, spec.size) for name, spec in self.bitfields.items())
+        return repr((self.dc_id, self.name, self.fields, self.flatten_tlm, sorted(self.tlm_columns.items()),
+                     sorted(self.beacon_columns.items()), bitfields, tuple(self.tlm_flatten_counts)))
+
+    def decode_tlm(self, data, variable_count: int = None) -> dict:
+        return self.tlm_decoder(variable_count)(data)
+
+    def decode_beacon(self, data) -> dict:
+        return self.beacon_decoder(len(data))(data)
+
+    # @brief Decodes many TLM payloads of this entry into columns at once.
+    #
+    # @details With NumPy the payloads are read as one structured array, so each
+    #          column is a view into a single buffer. Without NumPy the records
+    #          are decoded one by one and transposed into lists.
+    #
+    # @return {column: values} with the same keys as the TLM records.
+
+    def decode_tlm_batch(self, datas, variable_count: int = None) -> dict:
+        counts = self.counts(variable_count)
+        layout = self.layout(counts, True)
+
+        if np is None:
+            decoder = self.tlm_decoder(variable_count)
+            records = [decoder(bytes(data)) for data in datas]
+            if not records:
+                return {}
+            return {key: [record[key] for record in records] for key in records[0]}
+
+        size = self.size(variable_count)
+        buffer = b"".join(bytes(data[:size]) for data in datas)
+        value_formats = [TYPE_FORMATS[field.type] for field, count in zip(self.fields, counts) for _ in range(count or 1)]
+        dtype = np.dtype([(f"v{i}", "<" + fmt) for i, fmt in enumerate(value_formats)])
+        rows = np.frombuffer(buffer, dtype=dtype)
+
+        columns = {}
+        for kind, key, start, stop in layout:
+            if kind == "scalar":
+                columns[key] = rows[f"v{start}"]
+            elif kind == "list":
+                columns[key] = np.stack([rows[f"v{i}"] for i in range(start, stop)], axis=1)
+            elif kind == "columns":
+                columns.update((column, rows[f"v{start + i}"]) for i, column in enumerate(key))
+            else:
+                raw = np.stack([rows[f"v{i}"] for i in range(start, stop)], axis=1).astype(np.uint8)
+                columns.update(key.decode_batch(raw))
+        return columns
+
+
+TASK_NAMES = (
+    'TASK_MONITOR_TASK', 'TASK_MONITOR_EXEH_PERSISTOR', 'TASK_MONITOR_APP_TASK', 'TASK_MONITOR_SERVICES',
+    'TASK_MONITOR_SD_MANAGER', 'TASK_INSTRUMENTS', 'TASK_MONITOR_S_X_BAND', 'TASK_MONITOR_CUBEADCS',
+    'TASK_MONITOR_CUBEADCS_FHANDL', 'TASK_MONITOR_GNSS', 'TASK_PAYLOAD_SCHEDULER', 'TASK_TELEMETRY',
+    'TASK_TELEMETRY_FILE_SINK', 'TASK_MONITOR_SP', 'TASK_MACDRV_DISPATCHER', 'TASK_MACTL_DISPATCHER',
+    'TASK_FWUPD_HANDLER', 'TASK_ESSA_SP_HANDLER', 'TASK_NVM', 'TASK_DATACACHE', 'TASK_ADCS_TLM',
+    'TASK_CONOPS_PERIODIC_EV', 'TASK_MONITOR_PAYLOAD_CTRL', 'TASK_BEACONS', 'TASK_EPS_CTRL', 'TASK_EPS_I',
+    'TASK_EPS_II', 'TASK_EPS_M', 'TASK_SYS_CLOCK', 'TASK_MONITOR_ES_ADCS', 'TASK_ACTUATOR_CONTROL_SERVICE',
+    'TASK_SDS', 'TASK_AOCS_CNTRL', 'TASK_SXBAND_SCHED', 'TASK_CRYPTO_SRV', 'TASK_MONITOR_TASKS_NUMBER',
+)
+
+XYZ = ('X', 'Y', 'Z')
+
+
+def _axes(name, axes=XYZ):
+    return tuple(f"{name}_{axis}" for axis in axes)
+
+
+def _ssp_fields():
+    return [
+        DcField('sunDataMain', 'uint16'),
+        DcField('sunDataExt', 'uint16'),
+        DcField('tempMCU', 'int16'),
+        DcField('tempMain', 'int16'),
+        DcField('tempExt1', 'int16'),
+        DcField('tempExt2', 'int16'),
+    ]
+
+
+# Beacon names of the SSP temperatures have always had this typo, kept so stored beacons stay comparable
+SSP_BEACON_COLUMNS = {'tempExt2': 'temptExt2'}
+
+
+def _es_adcs_sensor_mag_fields():
+    return [DcField(name, 'int32') for name in ('MAG_X_CURRENT', 'MAG_Y_CURRENT', 'MAG_Z_CURRENT',
+                                                'MAG_X_PREVIOUS', 'MAG_Y_PREVIOUS', 'MAG_Z_PREVIOUS')]
+
+
+def _sensor_mag_fields():
+    return [DcField(name, 'int32') for name in ('MAG_X', 'MAG_Y', 'MAG_Z')]
+
+
+# Beacon names of the raw magnetometer and gyro sensors keep the datacache type prefix
+SENSOR_MAG_BEACON_COLUMNS = {name: f"int32__{name}" for name in ('MAG_X', 'MAG_Y', 'MAG_Z')}
+
+
+# @var SCHEMAS Every datacache entry, in datacache id order.
+
+SCHEMAS = [
+    DcSchema(0x10, "OBC_0", [
+        DcField('opMode', 'uint8'),
+        DcField('upTime', 'uint32'),
+        DcField('totalResetCount', 'uint16'),
+        DcField('resetReasonBitField', 'uint16'),
+        DcField('payloadModesStatus', 'uint16'),
+    ]),
+    DcSchema(0x11, "ADCS_0", [
+        DcField('magFieldVec', 'int16', 3, _axes('magFieldVec')),
+        DcField('coarseSunVec', 'int16', 3, _axes('coarseSunVec')),
+        DcField('fineSunVec', 'int16', 3, _axes('fineSunVec')),
+        DcField('nadirVec', 'int16', 3, _axes('nadirVec')),
+        DcField('angRateVec', 'int16', 3, _axes('angRateVec')),
+        DcField('wheelSpeedArr', 'int16', 3, _axes('wheelSpeedArr')),
+    ], flatten_tlm=True),
+    DcSchema(0x12, "ADCS_1", [
+        # The angular rate has always been stored under estQSet_X/Y/Z
+        DcField('estQSet', 'int16', 3, _axes('estQSet', ('Q1', 'Q2', 'Q3'))),
+        DcField('estAngRateVec', 'int16', 3, _axes('estQSet')),
+    ], flatten_tlm=True),
+    DcSchema(0x13, "ADCS_2", [
+        DcField('adcsState', 'uint8', 6),
+    ], bitfields={'adcsState': ADCS_2_STATE}),
+    DcSchema(0x14, "EPS_0", [
+        DcField('battEnergy', 'int64'),
+        DcField('battCharge', 'int64'),
+        DcField('battChargeCapacity', 'int64'),
+        DcField('battPercent', 'int64'),
+        DcField('battVoltage', 'int32'),
+        DcField('battCurrent', 'int32'),
+        DcField('battTemperature', 'int32'),
+    ]),
+    DcSchema(0x15, "SSP_0", _ssp_fields(), beacon_columns=SSP_BEACON_COLUMNS),
+    DcSchema(0x16, "SSP_1", _ssp_fields(), beacon_columns=SSP_BEACON_COLUMNS),
+    DcSchema(0x17, "SSP_2", _ssp_fields(), beacon_columns=SSP_BEACON_COLUMNS),
+    DcSchema(0x19, "AOCS_CNTRL_TLM", [
+        DcField('adcsErrFlags', 'uint16'),
+        DcField('estAngRateNorm', 'int32'),
+        DcField('estAngRateVec', 'int32', 3, _axes('estAngRateVec')),
+        DcField('estAttAngles', 'int32', 3, _axes('estAttAngles', ('Roll', 'Pitch', 'Yaw'))),
+        DcField('measWheelSpeed', 'int16', 3, _axes('measWheelSpeed')),
+    ], flatten_tlm=True),
+    DcSchema(0x1A, "EPS_1", [
+        DcField('battCapacity', 'int32'),
+        DcField('battVoltage', 'int32'),
+        DcField('battCurrent', 'int32'),
+        DcField('battTemperature', 'int32'),
+    ]),
+    DcSchema(0x1B, "EPS_2", [
+        DcField('VOLT_BRDSUP', 'int16'),
+        DcField('TEMP_MCU', 'int16'),
+        DcField('VIP_INPUT_Voltage', 'int16'),
+        DcField('VIP_INPUT_Current', 'int16'),
+        DcField('VIP_INPUT_Power', 'int16'),
+        DcField('STAT_CH_ON', 'uint16'),
+        DcField('STAT_CH_OCF', 'uint16'),
+    ] + [DcField(f'VIP_{quantity}_VD{channel}', 'int16')
+         for channel in (0, 4, 6, 7, 8, 9, 10, 11) for quantity in ('Voltage', 'Current')]),
+    DcSchema(0x1C, "EPS_3", [
+        DcField('VOLT_BRDSUP', 'int16'),
+        DcField('TEMP_MCU', 'int16'),
+        DcField('VIP_INPUT_Voltage', 'int16'),
+        DcField('VIP_INPUT_Current', 'int16'),
+        DcField('VIP_INPUT_Power', 'int16'),
+        DcField('STAT_BU', 'uint16'),
+        DcField('VIP_BP_INPUT_Voltage', 'int16', 2),
+        DcField('VIP_BP_INPUT_Current', 'int16', 2),
+        DcField('VIP_BP_INPUT_Power', 'int16', 2),
+        DcField('STAT_BP', 'int16', 2),
+        DcField('VOLT_CELL1', 'int16', 2),
+        DcField('VOLT_CELL2', 'int16', 2),
+        DcField('VOLT_CELL3', 'int16', 2),
+        DcField('VOLT_CELL4', 'int16', 2),
+        DcField('BAT_TEMP1', 'int16', 2),
+        DcField('BAT_TEMP2', 'int16', 2),
+        DcField('BAT_TEMP3', 'int16', 2),
+    ], flatten_tlm=True, tlm_columns={
+        'VIP_BP_INPUT_Voltage': ('BP_INPUT_Voltage_1', 'BP_INPUT_Voltage_2'),
+        'VIP_BP_INPUT_Current': ('BP_INPUT_Current_1', 'BP_INPUT_Current_2'),
+        'VIP_BP_INPUT_Power': ('BP_INPUT_Power_1', 'BP_INPUT_Power_2'),
+    }),
+    DcSchema(0x1D, "EPS_4", [
+        DcField('VOLT_BRDSUP', 'int16'),
+        DcField('TEMP_MCU', 'int16'),
+        DcField('VIP_OUTPUT_Voltage', 'int16'),
+        DcField('VIP_OUTPUT_Current', 'int16'),
+        DcField('VIP_OUTPUT_Power', 'int16'),
+        DcField('VIP_CC_OUTPUT_Voltage', 'int16', 4),
+        DcField('VIP_CC_OUTPUT_Current', 'int16', 4),
+        DcField('VIP_CC_OUTPUT_Power', 'int16', 4),
+        DcField('CCx_VOLT_IN_MPPT', 'int16', 4),
+        DcField('CCx_CURR_IN_MPPT', 'int16', 4),
+        DcField('CCx_VOLT_OU_MPPT', 'int16', 4),
+        DcField('CCx_CURR_OU_MPPT', 'int16', 4),
+    ], flatten_tlm=True, tlm_columns={
+        'CCx_VOLT_IN_MPPT': tuple(f'VOLT_IN_MPPT_{i}' for i in range(1, 5)),
+        'CCx_CURR_IN_MPPT': tuple(f'CURR_IN_MPPT_{i}' for i in range(1, 5)),
+        'CCx_VOLT_OU_MPPT': tuple(f'VOLT_OU_MPPT_{i}' for i in range(1, 5)),
+        'CCx_CURR_OU_MPPT': tuple(f'CURR_OU_MPPT_{i}' for i in range(1, 5)),
+    }),
+    DcSchema(0x1E, "EPS_5", [
+        DcField('MODE', 'uint8'),
+        DcField('RESET_CAUSE', 'uint8'),
+        DcField('UPTIME', 'uint32'),
+        DcField('ERROR', 'uint16'),
+        DcField('RC_CNT_PWRON', 'uint16'),
+        DcField('RC_CNT_WDG', 'uint16'),
+        DcField('RC_CNT_CMD', 'uint16'),
+        DcField('RC_CNT_MCU', 'uint16'),
+        DcField('RC_CNT_EMLOPO', 'uint16'),
+        DcField('UNIX_TIME', 'uint32'),
+        DcField('UNIX_YEAR', 'uint32'),
+        DcField('UNIX_MONTH', 'uint32'),
+        DcField('UNIX_DAY', 'uint32'),
+        DcField('UNIX_HOUR', 'uint32'),
+        DcField('UNIX_MINUTE', 'uint32'),
+        DcField('UNIX_SECOND', 'uint32'),
+    ]),
+    DcSchema(0x1F, "EPS_6", [
+        DcField('STAT_CH_ON', 'uint16'),
+        DcField('STAT_CH_OCF', 'uint16'),
+    ] + [DcField(f'OCF_CNT_CH{channel:02d}', 'uint16') for channel in (0, 4, 6, 7, 8, 9, 10, 11)]),
+    DcSchema(0x20, "TaskStats", [
+        DcField('taskStackMaxUnusedSize', 'int16', VARIABLE_COUNT, TASK_NAMES),
+    ], tlm_flatten_counts=(30, 36)),
+    DcSchema(0x21, "SSP_3", _ssp_fields(), beacon_columns=SSP_BEACON_COLUMNS),
+    DcSchema(0x22, "SENSOR_MAG_PRIMARY", _sensor_mag_fields(), beacon_columns=SENSOR_MAG_BEACON_COLUMNS),
+    DcSchema(0x23, "SENSOR_MAG_SECONDARY", _sensor_mag_fields(), beacon_columns=SENSOR_MAG_BEACON_COLUMNS),
+    DcSchema(0x24, "SENSOR_GYRO", [DcField(f'GYRO_{i}', 'int32') for i in (1, 2, 3)],
+             beacon_columns={f'GYRO_{i}': f'int32__GYRO_{i}' for i in (1, 2, 3)}),
+    DcSchema(0x25, "SENSOR_COARSE_SUN", [DcField(f'CSS_PANEL_{i}', 'int32') for i in range(1, 7)]),
+    DcSchema(0x26, "ES_ADCS_SENSOR_MAG_PRIMARY", _es_adcs_sensor_mag_fields()),
+    DcSchema(0x27, "ES_ADCS_SENSOR_MAG_SECONDARY", _es_adcs_sensor_mag_fields()),
+    DcSchema(0x28, "ES_ADCS_SENSOR_GYRO", [DcField(f'GYRO_{axis}', 'int32') for axis in XYZ]),
+    DcSchema(0x29, "ES_ADCS_SENSOR_CSS", [DcField(f'CSS_AXIS_{axis}_{side}', 'int32')
+                                          for side in ('PLUS', 'MINUS') for axis in XYZ]),
+    DcSchema(0x30, "ES_ADCS_ESTIMATES_BDOT", [DcField(f'MAG_FIELD_DERIV_{axis}', 'int32') for axis in XYZ]),
+    DcSchema(0x31, "ES_ADCS_CONTROL_VALUES_MTQ", [DcField(f'MAGTORQUE_VALUE_{axis}', 'int8') for axis in XYZ]),
+    DcSchema(0x32, "ConOpsFlags", [DcField(name, 'uint8', key_type='bool')
+                                   for name in ('PAY_ERR', 'ADCS_ERR', 'DETUMB_COMPLETED')]),
+    DcSchema(0x33, "AOCS_CNTRL_SYS_STATE", [
+        DcField('adcsSysState', 'uint8'),
+        DcField('adcsSysStateStatus', 'uint8'),
+    ]),
+    DcSchema(0x34, "ADCS_3", [DcField(name, 'int16') for name in (
+        'est_roll_angle', 'est_pitch_angle', 'est_yaw_angle',
+        'IGRF_MagField_X', 'IGRF_MagField_Y', 'IGRF_MagField_Z',
+        'Modelled_Sun_V_X', 'Modelled_Sun_V_Y', 'Modelled_Sun_V_Z',
+        'EstGyroBias_X', 'EstGyroBias_Y', 'EstGyroBias_Z',
+        'Innovation_Vec_X', 'Innovation_Vec_Y', 'Innovation_Vec_Z',
+        'Err_Q1', 'Err_Q2', 'Err_Q3',
+        'RMS_Q1', 'RMS_Q2', 'RMS_Q3',
+        'X_AngRate_Cov', 'Y_AngRate_Cov', 'Z_AngRate_Cov',
+        'X_Rate', 'Y_Rate', 'Z_Rate',
+        'Q0', 'Q1', 'Q2',
+    )]),
+    DcSchema(0x35, "ADCS_4", [DcField(name, 'uint16') for name in (
+        'Cubesense1_3V3_Current', 'Cubesense1_SRAM_Current', 'Cubesense2_3V3_Current', 'Cubesense2_SRAM_Current',
+        'CubeControl_3V3_Current', 'CubeControl_5V_Current', 'CubeControl_Vbat_Current',
+        'Wheel_1_Current', 'Wheel_2_Current', 'Wheel_3_Current', 'CubeStar_Current', 'MTQ_Current',
+    )] + [DcField(name, 'int16') for name in (
+        'CubeStar_MCU_Temp', 'ADCS_MCU_Temp', 'MTM_Temp', 'RMTM_Temp',
+        'X_Rate_Sensor_Temp', 'Y_Rate_Sensor_Temp', 'Z_Rate_Sensor_Temp',
+    )]),
+]
+
+# @var DC_SCHEMAS {dc_id: DcSchema}
+# @var DC_NAMES {dc_id: name}, the table every parser translates dc_ids with.
+# @var DC_IDS {name: dc_id}
+# @var SCHEMAS_BY_NAME {name: DcSchema}, beacon messages carry the name once their header is parsed.
+
+DC_SCHEMAS = {schema.dc_id: schema for schema in SCHEMAS}
+DC_NAMES = {schema.dc_id: schema.name for schema in SCHEMAS}
+DC_IDS = {schema.name: schema.dc_id for schema in SCHEMAS}
+SCHEMAS_BY_NAME = {schema.name: schema for schema in SCHEMAS}
+
+
+# @brief Identifies the output of the TLM decoders.
+#
+# @details Changes whenever a schema, DECODER_REVISION or the TaskStats count changes,
+#          so records decoded by different decoders are never mixed up.
+#
+# @param variable_count Length of VARIABLE_COUNT arrays, e.g. NUM_TASKS.
+# @return A string like "1-3f2a9c0d41b7".
+
+@lru_cache(maxsize=None)
+def decoder_version(variable_count: int = None) -> str:
+    digest = hashlib.sha1(repr(variable_count).encode("utf-8"))
+    for schema in SCHEMAS:
+        digest.update(schema.fingerprint().encode("utf-8"))
+    return f"{DECODER_REVISION}-{digest.hexdigest()[:12]}"
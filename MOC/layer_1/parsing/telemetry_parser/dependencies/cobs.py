@@ -17,3 +17,53 @@ def decode(input: bytes) -> bytes:
         output = output[:-1]
 
     return bytes(output)
+
+
+# @brief Decodes one COBS frame, without its 0 delimiter.
+#
+# @details Standard COBS: a code byte of n is followed by n - 1 data bytes and an
+#          implied 0, except for code 0xFF and the last block. Raises ValueError
+#          on a 0 byte or a block running past the end of the frame. decode() above
+#          is what the telemetry files were written for, this one checks the frame.
+
+def decode_strict(data) -> bytes:
+    output = bytearray()
+    pos = 0
+    size = len(data)
+    while pos < size:
+        code = data[pos]
+        if code == 0 or pos + code > size:
+            raise ValueError("Invalid COBS frame")
+        output += data[pos + 1:pos + code]
+        pos += code
+        if code < 0xFF and pos < size:
+            output.append(0)
+    return bytes(output)
+
+
+# @brief Encodes one frame, without the 0 delimiter.
+#
+# @details Runs of 254 non-zero bytes get code 0xFF and no implied 0, which
+#          decode() does not handle. Telemetry messages are far shorter than that.
+
+def encode(data) -> bytes:
+    output = bytearray()
+    data = bytes(data)
+    start = 0
+    while True:
+        zero = data.find(b"\x00", start, start + 0xFE)
+        if zero == -1:
+            block = data[start:start + 0xFE]
+            output.append(len(block) + 1)
+            output += block
+            start += len(block)
+            if len(block) < 0xFE:
+                break
+            if start == len(data):
+                output.append(1)
+                break
+        else:
+            output.append(zero - start + 1)
+            output += data[start:zero]
+            start = zero + 1
+    return bytes(output)
@@ -12,24 +12,44 @@ import datetime
 import os
 from struct import unpack_from
 from rich import print
-from layer_1.parsing.telemetry_parser.dependencies import es_crc, cobs, datacache
+from layer_1.parsing.telemetry_parser.dependencies import es_crc, cobs
+from layer_1.parsing.dc_schema import DC_NAMES, DC_SCHEMAS
 import csv
 import glob
-from itertools import islice
+from functools import lru_cache
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
  
 # @var NUM_TASKS The total number of tasks listed in TaskStats.
-#      Can be either 30 or 36 depending on OBC datacache config.
+#      Can be either 30 or 36 depending on OBC datacache config. Each TLM message is
+#      decoded with the count its length implies, this is only used when it does not
+#      match any count (and by the legacy datacache.py parser).
 
 NUM_TASKS = 36
 
+# @var JSON_BATCH_SIZE Default number of records per batch of Unpacker.iter_json_batches().
+# @var READ_CHUNK_SIZE Bytes read from a .TLM file at a time.
+
+JSON_BATCH_SIZE = 1000
+READ_CHUNK_SIZE = 1 << 16
+
 
 # @brief Converts a Unix timestamp to a human-readable date string.
 # 
+# @details Decoded records keep the raw epoch, this is only called when a record
+#          is displayed or written to CSV. Messages logged in the same second share
+#          a timestamp, so results are cached.
+# 
 # @param unix_timestamp The Unix timestamp to convert.
 # @return A string representing the date in 'YYYY-MM-DD HH:MM:SS' format,
 #         or 'invalid timestamp' if conversion fails.
 
+@lru_cache(maxsize=4096)
 def unixtime_to_readable_date(unix_timestamp: int) -> str:
     date_string = ""
     try:
@@ -40,6 +60,25 @@ def unixtime_to_readable_date(unix_timestamp: int) -> str:
     return date_string
 
 
+# @brief Converts a batch of Unix timestamps to UTC datetimes at once.
+# 
+# @param unix_timestamps Iterable of Unix timestamps, e.g. the "timestamp" column of
+#        the records returned by Unpacker.generate_json_data().
+# @return A numpy datetime64[s] array, or a list of timezone aware UTC datetimes
+#         if NumPy is not installed.
+
+def unixtime_to_datetime64(unix_timestamps):
+    if np is not None:
+        return np.asarray(unix_timestamps, dtype=np.int64).astype("datetime64[s]")
+    return [datetime.datetime.fromtimestamp(t, datetime.timezone.utc) for t in unix_timestamps]
+
+
+# @brief Returns a copy of a decoded record with its timestamp formatted for display.
+
+def readable_record(record: dict) -> dict:
+    return {**record, "timestamp": unixtime_to_readable_date(record["timestamp"])}
+
+
 # @brief Represents the header structure for a telemetry file.
 # 
 # @details This class defines the structure of the header used in telemetry files. Private class
@@ -87,19 +126,24 @@ class TelemetryFileHdr:
 # @brief Represents the structure of individual messages contained within a telemetry file.
 #
 # @details Private class used by TelemetryFile to parse out individual messages.
+#          A file holds hundreds of thousands of them, so attributes live in slots
+#          and the payload is kept as one bytes object rather than a list of ints.
 
 class TelemetryMsg:
     HDR_SIZE = 11
     CRC_SIZE = 2
     MAX_TLM_ROLL_FRAME_CNT = 256
 
+    __slots__ = ("timestamp", "rolling_cntr", "obc_opmode", "msg_type", "tlm_data_status", "data", "data_len",
+                 "crc", "calc_crc", "is_crc_valid", "total_len", "msg_id", "str_from_parsed_dict")
+
     def __init__(self, msg_id: int):
         self.timestamp = ''
         self.rolling_cntr = 0
         self.obc_opmode = 0
         self.msg_type = 0
         self.tlm_data_status = False
-        self.data = []
+        self.data = b""
         self.data_len = 0
         self.crc = 0
         self.calc_crc = 0
@@ -135,16 +179,17 @@ class TelemetryMsg:
             self.data_len,
         ) = unpack_from("<LBBHBH", data)
 
-        for b in data[TelemetryMsg.HDR_SIZE : TelemetryMsg.HDR_SIZE + self.data_len]:
-            self.data.append(b)
+        # One copy of the payload, header and CRC are read through a view
+        view = memoryview(data)
+        self.data = bytes(view[TelemetryMsg.HDR_SIZE : TelemetryMsg.HDR_SIZE + self.data_len])
 
         self.crc = unpack_from(
             "<H",
-            data[TelemetryMsg.HDR_SIZE + self.data_len : TelemetryMsg.HDR_SIZE + self.data_len + TelemetryMsg.CRC_SIZE]
+            view[TelemetryMsg.HDR_SIZE + self.data_len : TelemetryMsg.HDR_SIZE + self.data_len + TelemetryMsg.CRC_SIZE]
         )[0]
 
         # skip CRC bytes...
-        self.calc_crc = es_crc.crc_util.crc16(data[: -TelemetryMsg.CRC_SIZE])
+        self.calc_crc = es_crc.crc_util.crc16(view[: -TelemetryMsg.CRC_SIZE])
         self.is_crc_valid = (self.crc == self.calc_crc)
         self.total_len = TelemetryMsg.HDR_SIZE + self.data_len + TelemetryMsg.CRC_SIZE
 
@@ -175,75 +220,89 @@ class TelemetryMsg:
     #     return str_repr
 
 
+# @brief Groups an iterable into lists of at most size items, lazily.
+
+def batched(iterable, size: int):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
 # @brief Parses telemetry messages into CSV files.
 #
 # @details Public class used to generate CSV files given a message list
 #          and input file. After parsing telemetry files with class TelemetryFile,
 #          the user can use Unpacker by passing the TelemtryFile message list and 
-#          file name.
+#          file name. The JSON records can also be streamed by passing
+#          TelemetryFile.iter_messages() instead of the list and iterating over
+#          iter_json_data() or iter_json_batches(), so only the current batch is
+#          held in memory whatever the size of the file.
 
 class Unpacker:
-    dc_entries_dict = {
-        0x00000010: "OBC_0",
-        0x00000011: "ADCS_0",
-        0x00000012: "ADCS_1",
-        0x00000013: "ADCS_2",
-        0x00000014: "EPS_0",
-        0x00000015: "SSP_0",
-        0x00000016: "SSP_1",
-        0x00000017: "SSP_2",
-        0x00000019: "AOCS_CNTRL_TLM",
-        0x0000001A: "EPS_1",
-        0x0000001B: "EPS_2",
-        0x0000001C: "EPS_3",
-        0x0000001D: "EPS_4",
-        0x0000001E: "EPS_5",
-        0x0000001F: "EPS_6",
-        0x00000020: "TaskStats",
-        0x00000021: "SSP_3",
-        0x00000022: "SENSOR_MAG_PRIMARY",
-        0x00000023: "SENSOR_MAG_SECONDARY",
-        0x00000024: "SENSOR_GYRO",
-        0x00000025: "SENSOR_COARSE_SUN",
-        0x00000026: "ES_ADCS_SENSOR_MAG_PRIMARY",
-        0x00000027: "ES_ADCS_SENSOR_MAG_SECONDARY",
-        0x00000028: "ES_ADCS_SENSOR_GYRO",
-        0x00000029: "ES_ADCS_SENSOR_CSS",
-        0x00000030: "ES_ADCS_ESTIMATES_BDOT",
-        0x00000031: "ES_ADCS_CONTROL_VALUES_MTQ",
-        0x00000032: "ConOpsFlags",
-        0x00000033: "AOCS_CNTRL_SYS_STATE",
-        0x00000034: "ADCS_3",
-        0x00000035: "ADCS_4"
-    }
+    dc_entries_dict = DC_NAMES
 
     def __init__(self, msglist, input_file):
         self.msglist = msglist
+        self.input_file = input_file
 
-        # Uncomment if generating CSV files, this is temporary
-        # self.output_folderpath = Unpacker.generate_output_folderpath(input_file)
+        # Created by generate_csv_files() on first use
+        self.output_folderpath = None
 
     def generate_json_data(self):
-        data_list = []
+        return list(self.iter_json_data())
+
+    # Yields the record of every message with data
+    def iter_json_data(self):
         for msg in self.msglist:
             if len(msg.data) > 0:
-                parsed_data = Unpacker.parse_msg_data(msg)
-                data_list.append(parsed_data)
-        return data_list
-
-    # Public user function
-    def generate_csv_files(self):
+                yield Unpacker.parse_msg_data(msg)
+
+    # Yields the records in lists of at most batch_size
+    def iter_json_batches(self, batch_size: int = JSON_BATCH_SIZE):
+        return batched(self.iter_json_data(), batch_size)
+
+    # Public user function. Returns {dc_id: {column: values}} with one entry per
+    # message, NumPy arrays if available. Timestamps are converted to datetime64.
+    # If messages of an entry come in several layouts (e.g. TaskStats of 30 and 36
+    # tasks), each layout gets its own entry, named "<dc_id>_<count>".
+    def generate_columns(self):
+        by_layout = {}
         for msg in self.msglist:
             if len(msg.data) > 0:
-                parsed_data = Unpacker.parse_msg_data(msg)
-                print(parsed_data, end="\n\n")
-                output_filepath = self.generate_output_filepath(msg)
-                file_exists = os.path.exists(output_filepath)
-
-                if not file_exists:
-                    Unpacker.write_header(parsed_data, output_filepath)
+                count = DC_SCHEMAS[msg.msg_type].variable_count_for(len(msg.data), NUM_TASKS)
+                by_layout.setdefault((msg.msg_type, count), []).append(msg)
+        layouts = Counter(msg_type for msg_type, _ in by_layout)
+
+        columns = {}
+        for (msg_type, count), msgs in by_layout.items():
+            dc_columns = {"timestamp": unixtime_to_datetime64([msg.timestamp for msg in msgs])}
+            dc_columns.update(DC_SCHEMAS[msg_type].decode_tlm_batch([msg.data for msg in msgs], count))
+            name = Unpacker.dc_entries_dict[msg_type]
+            columns[name if layouts[msg_type] == 1 else f"{name}_{count}"] = dc_columns
+
+        return columns
+
+    # Public user function. Pass a CsvSink to write several files into the same CSVs,
+    # otherwise the CSVs go to a new folder named after the input file
+    def generate_csv_files(self, sink=None):
+        own_sink = sink is None
+        if own_sink:
+            if self.output_folderpath is None:
+                self.output_folderpath = Unpacker.generate_output_folderpath(self.input_file)
+            sink = CsvSink(self.output_folderpath)
 
-                Unpacker.append_data(msg, parsed_data, output_filepath)
+        try:
+            for msg in self.msglist:
+                if len(msg.data) > 0:
+                    sink.write(Unpacker.parse_msg_data(msg))
+        finally:
+            if own_sink:
+                sink.close()
 
     # Generates output folderpath given input TLM file name
     @staticmethod
@@ -260,373 +319,26 @@ class Unpacker:
         output_filepath = os.path.join(self.output_folderpath, file_name)
         return output_filepath
     
-    # Parses message data using datacache parser
+    # Decodes message data with the decoder compiled from the dc_schema registry
     @staticmethod
     def parse_msg_data(msg):
-        (data, length) = datacache.dc_parser(NUM_TASKS).parse_by_id(msg.msg_type, msg.data)
-        data_dict = data.__dict__
-        readable_timestamp = unixtime_to_readable_date(msg.timestamp)
-        parsed_data = {"timestamp": readable_timestamp, "dc_id": Unpacker.dc_entries_dict[msg.msg_type]}
-        if Unpacker.dc_entries_dict[msg.msg_type] == "ADCS_0":
-            parsed_data.update(Unpacker.parse_adcs_0_vec(data_dict))
-        elif Unpacker.dc_entries_dict[msg.msg_type] == "ADCS_1":
-            parsed_data.update(Unpacker.parse_adcs_1_vec(data_dict))
-        elif Unpacker.dc_entries_dict[msg.msg_type] == "ADCS_2":
-            parsed_data.update(Unpacker.parse_adcs_2_vec(data_dict))
-        elif Unpacker.dc_entries_dict[msg.msg_type] == "AOCS_CNTRL_TLM":
-            parsed_data.update(Unpacker.parse_aocs_cntrl_tlm_vec(data_dict))
-        elif Unpacker.dc_entries_dict[msg.msg_type] == "EPS_3": # Hasn't been tested, tlm files don't have this right now
-            parsed_data.update(Unpacker.parse_eps_3_vec(data_dict))
-        elif Unpacker.dc_entries_dict[msg.msg_type] == "EPS_4": # Hasn't been tested, tlm files don't have this right now
-            parsed_data.update(Unpacker.parse_eps_4_vec(data_dict))
-        elif Unpacker.dc_entries_dict[msg.msg_type] == "TaskStats":
-            parsed_data.update(Unpacker.parse_taskstats_vec(data_dict))
-        else:
-            parsed_data.update(data_dict)
-
+        parsed_data = {"timestamp": msg.timestamp, "dc_id": Unpacker.dc_entries_dict[msg.msg_type]}
+        parsed_data.update(DC_SCHEMAS[msg.msg_type].tlm_decoder_for(len(msg.data), NUM_TASKS)(bytes(msg.data)))
         return parsed_data
-    
-    @staticmethod
-    def parse_adcs_0_vec(data_dict):
-        new_dict = {}
-        new_keys = []
-        new_values = []
-
-        for key, value in data_dict.items():
-            if key == 'a__int16__magFieldVec':
-                new_keys += ['magFieldVec_X', 'magFieldVec_Y', 'magFieldVec_Z']
-            elif key == 'a__int16__coarseSunVec':
-                new_keys += ['coarseSunVec_X', 'coarseSunVec_Y', 'coarseSunVec_Z']
-            elif key == 'a__int16__fineSunVec':
-                new_keys += ['fineSunVec_X', 'fineSunVec_Y', 'fineSunVec_Z']
-            elif key == 'a__int16__nadirVec':
-                new_keys += ['nadirVec_X', 'nadirVec_Y', 'nadirVec_Z']
-            elif key == 'a__int16__angRateVec':
-                new_keys += ['angRateVec_X', 'angRateVec_Y', 'angRateVec_Z']
-            elif key == 'a__int16__wheelSpeedArr':
-                new_keys += ['wheelSpeedArr_X', 'wheelSpeedArr_Y', 'wheelSpeedArr_Z']
-
-            new_values += [value[0], value[1], value[2]]
-            new_dict.update({key: value for key, value in zip(new_keys, new_values)})
-
-        return new_dict
 
+    # Returns the CSV header row for a parsed message
     @staticmethod
-    def parse_adcs_1_vec(data_dict):
-        new_dict = {}
-        new_keys = []
-        new_values = []
-        for key, value in data_dict.items():
-            if key == 'a__int16__estQSet':
-                new_keys += ['estQSet_Q1', 'estQSet_Q2', 'estQSet_Q3']
-            elif key == 'a__int16__estAngRateVec':
-                new_keys += ['estQSet_X', 'estQSet_Y', 'estQSet_Z']
-
-            new_values += [value[0], value[1], value[2]]
-            new_dict.update({key: value for key, value in zip(new_keys, new_values)})
-
-        return new_dict
-    
-    @staticmethod
-    def parse_adcs_2_vec(data_dict):
-        vector_data = data_dict['a__uint8__adcsState']
-
-        new_dict = {
-            'Attitude_Estimation_Mode': 0,
-            'Control_Mode': 0,
-            'ADCS_Run_Mode': 0,
-            'ASGP4_Mode': 0,
-            'CubeControl_Signal_Enabled': 0,
-            'CubeControl_Motor_Enabled': 0,
-            'CubeSense1_Enabled': 0,
-            'CubeSense2_Enabled': 0,
-            'CubeWheel1_Enabled': 0,
-            'CubeWheel2_Enabled': 0,
-            'CubeWheel3_Enabled': 0,
-            'CubeStar_Enabled': 0,
-            'GPS_Receiver_Enabled': 0,
-            'GPS_LNA_Power_Enabled': 0,
-            'Motor_Driver_Enabled': 0,
-            'Sun_is_Above_Local_Horizon': 0,
-            'CubeSense1_Communications_Error': 0,
-            'CubeSense2_Communications_Error': 0,
-            'CubeControl_Signal_Communications_Error': 0,
-            'CubeControl_Motor_Communications_Error': 0,
-            'CubeWheel1_Communications_Error': 0,
-            'CubeWheel2_Communications_Error': 0,
-            'CubeWheel3_Communications_Error': 0,
-            'CubeStar_Communications_Error': 0,
-            'Magnetometer_Range_Error': 0,
-            'Cam1_SRAM_Overcurrent_Detected': 0,
-            'Cam1_3V3_Overcurrent_Detected': 0,
-            'Cam1_Sensor_Busy_Error': 0,
-            'Cam1_Sensor_Detection_Error': 0,
-            'Sun_Sensor_Range_Error': 0,
-            'Cam2_SRAM_Overcurrent_Detected': 0,
-            'Cam2_3V3_Overcurrent_Detected': 0,
-            'Cam2_Sensor_Busy_Error': 0,
-            'Cam2_Sensor_Detection_Error': 0,
-            'Nadir_Sensor_Range_Error': 0,
-            'Rate_Sensor_Range_Error': 0,
-            'Wheel_Speed_Range_Error': 0,
-            'Coarse_Sun_Sensor_Error': 0,
-            'StarTracker_Match_Error': 0,
-            'StarTracker_Overcurrent_Detected': 0
-        }
-
-        byte_0 = vector_data[0]
-        byte_1 = vector_data[1]
-        byte_2 = vector_data[2]
-        byte_3 = vector_data[3]
-        byte_4 = vector_data[4]
-        byte_5 = vector_data[5]
-
-        new_dict['Attitude_Estimation_Mode'] = byte_0 & 0b1111  
-        new_dict['Control_Mode'] = (byte_0 >> 4) & 0b1111         
-
-        new_dict['ADCS_Run_Mode'] = byte_1 & 0b1                        
-        new_dict['ASGP4_Mode'] = (byte_1 >> 1) & 0b1                    
-        new_dict['CubeControl_Signal_Enabled'] = (byte_1 >> 2) & 0b1    
-        new_dict['CubeControl_Motor_Enabled'] = (byte_1 >> 3) & 0b1     
-        new_dict['CubeSense1_Enabled'] = (byte_1 >> 4) & 0b11           
-        new_dict['CubeSense2_Enabled'] = (byte_1 >> 6) & 0b11           
-
-        new_dict['CubeWheel1_Enabled'] = byte_2 & 0b1                   
-        new_dict['CubeWheel2_Enabled'] = (byte_2 >> 1) & 0b1            
-        new_dict['CubeWheel3_Enabled'] = (byte_2 >> 2) & 0b1            
-        new_dict['CubeStar_Enabled'] = (byte_2 >> 3) & 0b1              
-        new_dict['GPS_Receiver_Enabled'] = (byte_2 >> 4) & 0b1          
-        new_dict['GPS_LNA_Power_Enabled'] = (byte_2 >> 5) & 0b1         
-        new_dict['Motor_Driver_Enabled'] = (byte_2 >> 6) & 0b1          
-        new_dict['Sun_is_Above_Local_Horizon'] = (byte_2 >> 7) & 0b1   
-
-        new_dict['CubeSense1_Communications_Error'] = byte_3 & 0b1                  
-        new_dict['CubeSense2_Communications_Error'] = (byte_3 >> 1) & 0b1          
-        new_dict['CubeControl_Signal_Communications_Error'] = (byte_3 >> 2) & 0b1   
-        new_dict['CubeControl_Motor_Communications_Error'] = (byte_3 >> 3) & 0b1    
-        new_dict['CubeWheel1_Communications_Error'] = (byte_3 >> 4) & 0b1          
-        new_dict['CubeWheel2_Communications_Error'] = (byte_3 >> 5) & 0b1          
-        new_dict['CubeWheel3_Communications_Error'] = (byte_3 >> 6) & 0b1           
-        new_dict['CubeStar_Communications_Error'] = (byte_3 >> 7) & 0b1             
-
-        new_dict['Magnetometer_Range_Error'] = byte_4 & 0b1                 
-        new_dict['Cam1_SRAM_Overcurrent_Detected'] = (byte_4 >> 1) & 0b1    
-        new_dict['Cam1_3V3_Overcurrent_Detected'] = (byte_4 >> 2) & 0b1     
-        new_dict['Cam1_Sensor_Busy_Error'] = (byte_4 >> 3) & 0b1            
-        new_dict['Cam1_Sensor_Detection_Error'] = (byte_4 >> 4) & 0b1       
-        new_dict['Sun_Sensor_Range_Error'] = (byte_4 >> 5) & 0b1            
-        new_dict['Cam2_SRAM_Overcurrent_Detected'] = (byte_4 >> 6) & 0b1   
-        new_dict['Cam2_3V3_Overcurrent_Detected'] = (byte_4 >> 7) & 0b1    
-
-        new_dict['Cam2_Sensor_Busy_Error'] = byte_5 & 0b1                   
-        new_dict['Cam2_Sensor_Detection_Error'] = (byte_5 >> 1) & 0b1     
-        new_dict['Nadir_Sensor_Range_Error'] = (byte_5 >> 2) & 0b1       
-        new_dict['Rate_Sensor_Range_Error'] = (byte_5 >> 3) & 0b1         
-        new_dict['Wheel_Speed_Range_Error'] = (byte_5 >> 4) & 0b1         
-        new_dict['Coarse_Sun_Sensor_Error'] = (byte_5 >> 5) & 0b1       
-        new_dict['StarTracker_Match_Error'] = (byte_5 >> 6) & 0b1        
-        new_dict['StarTracker_Overcurrent_Detected'] = (byte_5 >> 7) & 0b1  
-
-        return new_dict
-
-    @staticmethod
-    def parse_aocs_cntrl_tlm_vec(data_dict):
-        new_dict = {}
-        new_keys = []
-        new_values = []
-        for key, value in data_dict.items():
-            if key == 'uint16__adcsErrFlags':
-                new_keys.append('adcsErrFlags')
-                new_values.append(value)
-            elif key == 'int32__estAngRateNorm':
-                new_keys.append('estAngRateNorm')
-                new_values.append(value)
-            elif key == 'a__int32__estAngRateVec':
-                new_keys += ['estAngRateVec_X', 'estAngRateVec_Y', 'estAngRateVec_Z']
-                new_values += [value[0], value[1], value[2]]
-            elif key == 'a__int32__estAttAngles':
-                new_keys += ['estAttAngles_Roll', 'estAttAngles_Pitch', 'estAttAngles_Yaw']
-                new_values += [value[0], value[1], value[2]]
-            elif key == 'a__int16__measWheelSpeed':
-                new_keys += ['measWheelSpeed_X', 'measWheelSpeed_Y', 'measWheelSpeed_Z']
-                new_values += [value[0], value[1], value[2]]
-
-            new_dict.update({key: value for key, value in zip(new_keys, new_values)})
-        return new_dict
-
-    @staticmethod
-    def parse_eps_3_vec(data_dict):
-        new_dict = {}
-        new_keys = []
-        new_values = []
-        for key, value in data_dict.items():
-            if key == 'int16__VOLT_BRDSUP':
-                new_keys.append('VOLT_BRDSUP')
-                new_values.append(value)
-            elif key == 'int16__TEMP_MCU':
-                new_keys.append('TEMP_MCU')
-                new_values.append(value)
-            elif key == 'int16__VIP_INPUT_Voltage':
-                new_keys.append('VIP_INPUT_Voltage')
-                new_values.append(value)
-            elif key == 'int16__VIP_INPUT_Current':
-                new_keys.append('VIP_INPUT_Current')
-                new_values.append(value)
-            elif key == 'int16__VIP_INPUT_Power':
-                new_keys.append('VIP_INPUT_Power')
-                new_values.append(value)
-            elif key == 'uint16__STAT_BU':
-                new_keys.append('STAT_BU')
-                new_values.append(value)
-            elif key == 'a__int16__VIP_BP_INPUT_Voltage':
-                new_keys += ['BP_INPUT_Voltage_1', 'BP_INPUT_Voltage_2']
-                new_values += [value[0], value[1]]
-            elif key == 'a__int16__VIP_BP_INPUT_Current':
-                new_keys += ['BP_INPUT_Current_1', 'BP_INPUT_Current_2']
-                new_values += [value[0], value[1]]
-            elif key == 'a__int16__VIP_BP_INPUT_Power':
-                new_keys += ['BP_INPUT_Power_1', 'BP_INPUT_Power_2']
-                new_values += [value[0], value[1]]
-            elif key == 'a__int16__STAT_BP':
-                new_keys += ['STAT_BP_1', 'STAT_BP_2']
-                new_values += [value[0], value[1]]
-            elif key == 'a__int16__VOLT_CELL1':
-                new_keys += ['VOLT_CELL1_1', 'VOLT_CELL1_2']
-                new_values += [value[0], value[1]]
-            elif key == 'a__int16__VOLT_CELL2':
-                new_keys += ['VOLT_CELL2_1', 'VOLT_CELL2_2']
-                new_values += [value[0], value[1]]
-            elif key == 'a__int16__VOLT_CELL3':
-                new_keys += ['VOLT_CELL3_1', 'VOLT_CELL3_2']
-                new_values += [value[0], value[1]]
-            elif key == 'a__int16__VOLT_CELL4':
-                new_keys += ['VOLT_CELL4_1', 'VOLT_CELL4_2']
-                new_values += [value[0], value[1]]
-            elif key == 'a__int16__BAT_TEMP1':
-                new_keys += ['BAT_TEMP1_1', 'BAT_TEMP1_2']
-                new_values += [value[0], value[1]]
-            elif key == 'a__int16__BAT_TEMP2':
-                new_keys += ['BAT_TEMP2_1', 'BAT_TEMP2_2']
-                new_values += [value[0], value[1]]
-            elif key == 'a__int16__BAT_TEMP3':
-                new_keys += ['BAT_TEMP3_1', 'BAT_TEMP3_2']
-                new_values += [value[0], value[1]]
-
-            new_dict.update({key: value for key, value in zip(new_keys, new_values)})
-
-        return new_dict
-
-    @staticmethod
-    def parse_eps_4_vec(data_dict):
-        new_dict = {}
-        new_keys = []
-        new_values = []
-        for key, value in data_dict.items():
-            if key == 'int16__VOLT_BRDSUP':
-                new_keys.append('VOLT_BRDSUP')
-                new_values.append(value)
-            elif key == 'int16__TEMP_MCU':
-                new_keys.append('TEMP_MCU')
-                new_values.append(value)
-            elif key == 'int16__VIP_OUTPUT_Voltage':
-                new_keys.append('VIP_OUTPUT_Voltage')
-                new_values.append(value)
-            elif key == 'int16__VIP_OUTPUT_Current':
-                new_keys.append('VIP_OUTPUT_Current')
-                new_values.append(value)
-            elif key == 'int16__VIP_OUTPUT_Power':
-                new_keys.append('VIP_OUTPUT_Power')
-                new_values.append(value)
-            elif key == 'a__int16__VIP_CC_OUTPUT_Voltage':
-                new_keys += ['VIP_CC_OUTPUT_Voltage_1', 'VIP_CC_OUTPUT_Voltage_2', 'VIP_CC_OUTPUT_Voltage_3', 'VIP_CC_OUTPUT_Voltage_4']
-                new_values += [value[0], value[1], value[2], value[3]]
-            elif key == 'a__int16__VIP_CC_OUTPUT_Current':
-                new_keys += ['VIP_CC_OUTPUT_Current_1', 'VIP_CC_OUTPUT_Current_2', 'VIP_CC_OUTPUT_Current_3', 'VIP_CC_OUTPUT_Current_4']
-                new_values += [value[0], value[1], value[2], value[3]]
-            elif key == 'a__int16__VIP_CC_OUTPUT_Power':
-                new_keys += ['VIP_CC_OUTPUT_Power_1', 'VIP_CC_OUTPUT_Power_2', 'VIP_CC_OUTPUT_Power_3', 'VIP_CC_OUTPUT_Power_4']
-                new_values += [value[0], value[1], value[2], value[3]]
-            elif key == 'a__int16__CCx_VOLT_IN_MPPT':
-                new_keys += ['VOLT_IN_MPPT_1', 'VOLT_IN_MPPT_2', 'VOLT_IN_MPPT_3', 'VOLT_IN_MPPT_4']
-                new_values += [value[0], value[1], value[2], value[3]]
-            elif key == 'a__int16__CCx_CURR_IN_MPPT':
-                new_keys += ['CURR_IN_MPPT_1', 'CURR_IN_MPPT_2', 'CURR_IN_MPPT_3', 'CURR_IN_MPPT_4']
-                new_values += [value[0], value[1], value[2], value[3]]
-            elif key == 'a__int16__CCx_VOLT_OU_MPPT':
-                new_keys += ['VOLT_OU_MPPT_1', 'VOLT_OU_MPPT_2', 'VOLT_OU_MPPT_3', 'VOLT_OU_MPPT_4']
-                new_values += [value[0], value[1], value[2], value[3]]
-            elif key == 'a__int16__CCx_CURR_OU_MPPT':
-                new_keys += ['CURR_OU_MPPT_1', 'CURR_OU_MPPT_2', 'CURR_OU_MPPT_3', 'CURR_OU_MPPT_4']
-                new_values += [value[0], value[1], value[2], value[3]]
-
-            new_dict.update({key: value for key, value in zip(new_keys, new_values)})
-
-        return new_dict
-
-    @staticmethod
-    def parse_taskstats_vec(data_dict):
-        new_dict = {
-            'TASK_MONITOR_TASK': 0,
-            'TASK_MONITOR_EXEH_PERSISTOR': 0,
-            'TASK_MONITOR_APP_TASK': 0,
-            'TASK_MONITOR_SERVICES': 0,
-            'TASK_MONITOR_SD_MANAGER': 0,
-            'TASK_INSTRUMENTS': 0,
-            'TASK_MONITOR_S_X_BAND': 0,
-            'TASK_MONITOR_CUBEADCS': 0,
-            'TASK_MONITOR_CUBEADCS_FHANDL': 0,
-            'TASK_MONITOR_GNSS': 0,
-            'TASK_PAYLOAD_SCHEDULER': 0,
-            'TASK_TELEMETRY': 0,
-            'TASK_TELEMETRY_FILE_SINK': 0,
-            'TASK_MONITOR_SP': 0,
-            'TASK_MACDRV_DISPATCHER': 0,
-            'TASK_MACTL_DISPATCHER': 0,
-            'TASK_FWUPD_HANDLER': 0,
-            'TASK_ESSA_SP_HANDLER': 0,
-            'TASK_NVM': 0,
-            'TASK_DATACACHE': 0,
-            'TASK_ADCS_TLM': 0,
-            'TASK_CONOPS_PERIODIC_EV': 0,
-            'TASK_MONITOR_PAYLOAD_CTRL': 0,
-            'TASK_BEACONS': 0,
-            'TASK_EPS_CTRL': 0,
-            'TASK_EPS_I': 0,
-            'TASK_EPS_II': 0,
-            'TASK_EPS_M': 0,
-            'TASK_SYS_CLOCK': 0,
-            'TASK_MONITOR_ES_ADCS': 0,
-            'TASK_ACTUATOR_CONTROL_SERVICE': 0,
-            'TASK_SDS': 0,
-            'TASK_AOCS_CNTRL': 0,
-            'TASK_SXBAND_SCHED': 0,
-            'TASK_CRYPTO_SRV': 0,
-            'TASK_MONITOR_TASKS_NUMBER': 0
-        }
-
-        vector_data = data_dict['a__int16__taskStackMaxUnusedSize']
-
-        if NUM_TASKS == 30:
-            for key, value in zip(islice(new_dict.keys(), NUM_TASKS), vector_data):
-                new_dict[key] = value
-            new_dict = dict(islice(new_dict.items(), NUM_TASKS))
-        elif NUM_TASKS == 36:
-            for key, value in zip(new_dict.keys(), vector_data):
-                new_dict[key] = value
-        else:
-            return data_dict
-        
-        return new_dict
+    def csv_header(parsed_data):
+        header = ['timestamp']
+        header += list(parsed_data.keys())
+        return header
 
     # Creates CSV file and writes the headers
     @staticmethod
     def write_header(parsed_data, output_filepath):
-        header = ['timestamp']
-        header += list(parsed_data.keys())
-
         with open(output_filepath, mode='w', newline='') as file:
             writer = csv.writer(file)
-            writer.writerow(header)
+            writer.writerow(Unpacker.csv_header(parsed_data))
     
     # Appends parsed data to CSV file
     @staticmethod
@@ -641,6 +353,78 @@ class Unpacker:
                     writer.writerow(row)
 
 
+# @brief Writes parsed messages to one CSV file per dc_id.
+#
+# @details Keeps a single open, buffered file per dc_id and writes rows in bulk,
+#          instead of opening the CSV for every message. The files are laid out
+#          exactly like Unpacker.write_header()/append_data() write them: a header
+#          when the file is created, then one row per message with a readable
+#          timestamp. Rows are only guaranteed on disk after flush() or close(),
+#          use it as a context manager to share it between files of a batch.
+#
+# @param output_folderpath Folder the CSV files are written to.
+# @param buffer_rows Number of rows held per dc_id before they are written out.
+
+class CsvSink:
+    FILE_BUFFER_SIZE = 1 << 20
+
+    def __init__(self, output_folderpath, buffer_rows: int = 4096):
+        self.output_folderpath = output_folderpath
+        self.buffer_rows = buffer_rows
+        self.files = {}
+        self.writers = {}
+        self.pending = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def _open(self, parsed_data):
+        dc_id = parsed_data["dc_id"]
+        output_filepath = os.path.join(self.output_folderpath, dc_id + ".csv")
+        file_exists = os.path.exists(output_filepath)
+
+        file = open(output_filepath, mode='a', newline='', buffering=CsvSink.FILE_BUFFER_SIZE)
+        writer = csv.writer(file)
+        if not file_exists:
+            writer.writerow(Unpacker.csv_header(parsed_data))
+
+        self.files[dc_id] = file
+        self.writers[dc_id] = writer
+        self.pending[dc_id] = []
+        return self.pending[dc_id]
+
+    def write(self, parsed_data):
+        rows = self.pending.get(parsed_data["dc_id"])
+        if rows is None:
+            rows = self._open(parsed_data)
+
+        rows.append(list(readable_record(parsed_data).values()))
+        if len(rows) >= self.buffer_rows:
+            self._write_pending(parsed_data["dc_id"])
+
+    def _write_pending(self, dc_id):
+        self.writers[dc_id].writerows(self.pending[dc_id])
+        self.pending[dc_id].clear()
+
+    def flush(self):
+        for dc_id, file in self.files.items():
+            self._write_pending(dc_id)
+            file.flush()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            for file in self.files.values():
+                file.close()
+            self.files.clear()
+            self.writers.clear()
+            self.pending.clear()
+
+
 # @brief Represents the structure of an entire TLM file.
 #
 # @details Public class used to parse an entire TLM file given a file name. This class
@@ -655,56 +439,66 @@ class TelemetryFile:
         self.invalid_msg_cnt = 0
 
     def parse_file(self) -> None:
+        for msg in self.iter_messages():
+            self.msglist.append(msg)
+
+    # @brief Parses the file one message at a time, without keeping the messages.
+    #
+    # @details The file is read in chunks of READ_CHUNK_SIZE bytes and every zero
+    #          terminated COBS frame is decoded into a TelemetryMsg as soon as it is
+    #          complete. Trailing bytes without a terminating zero are ignored.
+    #
+    # @return A generator of TelemetryMsg, in file order.
+
+    def iter_messages(self):
         fhdr = TelemetryFileHdr()
 
-        f = open(self.fname, "rb")
+        with open(self.fname, "rb") as f:
+            fhdr.parse(f.read(TelemetryFileHdr.HDR_SIZE))
 
-        fhdr.parse(f.read(TelemetryFileHdr.HDR_SIZE))
+            print(fhdr)
 
-        print(fhdr)
+            msgdata = b""
+            msg_idx = 0
+            prev_rollling_cntr = 0
+            first_frame = False
 
-        byte = f.read(1)
-        msgdata = []
-        msg_idx = 0
-        prev_rollling_cntr = 0
-        first_frame = False
+            chunk = f.read(READ_CHUNK_SIZE)
+            while chunk:
+                *frames, msgdata = (msgdata + chunk).split(b"\0")
+                for frame in frames:
+                    msg = TelemetryMsg(msg_idx)
+                    msg_idx += 1
 
-        while byte:
-            current_pos = f.tell()
-            if byte[0] != 0:
-                msgdata.append(byte[0])
-            else:
-                msgdata.append(0)
-                msg = TelemetryMsg(msg_idx)
-                msg_idx += 1
+                    try:
+                        msg.parse(cobs.decode(frame + b"\0"))
+                    except Exception as exc:
+                        print(f'Oops: Could not parse record -> {exc}')
 
-                try:
-                    msg.parse(cobs.decode(msgdata))
-                except Exception as exc:
-                    print(f'Oops: Could not parse record -> {exc}')
+                    if not msg.is_crc_valid:
+                        self.invalid_msg_cnt += 1
 
-                if not msg.is_crc_valid:
-                    self.invalid_msg_cnt += 1
+                    if first_frame:
+                        prev_rollling_cntr = msg.rolling_cntr
+                        first_frame = False
+                    else:
+                        if ((prev_rollling_cntr + 1) % TelemetryMsg.MAX_TLM_ROLL_FRAME_CNT) != msg.rolling_cntr:
+                            print('\n...\n:exclamation_mark: [bold red]dropped frames[/bold red]\n...\n')
 
-                if first_frame:
                     prev_rollling_cntr = msg.rolling_cntr
-                    first_frame = False
-                else:
-                    if ((prev_rollling_cntr + 1) % TelemetryMsg.MAX_TLM_ROLL_FRAME_CNT) != msg.rolling_cntr:
-                        print('\n...\n:exclamation_mark: [bold red]dropped frames[/bold red]\n...\n')
 
-                prev_rollling_cntr = msg.rolling_cntr
+                    yield msg
 
-                self.msglist.append(msg)
+                chunk = f.read(READ_CHUNK_SIZE)
 
-                # Deserialize data and append deser data to the list after the message itself
+        print(f'{msg_idx} messages parsed | invalid count: {self.invalid_msg_cnt}')
 
-                msgdata = []
 
-            byte = f.read(1)
+# @brief Streams the JSON records of a .TLM file, decoding one message at a time.
 
-        f.close()
-        print(f'{len(self.msglist)} messages parsed | invalid count: {self.invalid_msg_cnt}')
+def iter_file_records(path: str):
+    tlm_file = TelemetryFile(path)
+    return Unpacker(tlm_file.iter_messages(), tlm_file.fname).iter_json_data()
 
 
 # @brief Script entry point used to parse all TLM files and generate CSV files.
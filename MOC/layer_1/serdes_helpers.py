@@ -0,0 +1,267 @@
+ ##############################################################################
+ # @file           : serdes_helpers.py
+ # @brief          : SerDes runtime shared by the generated EnduroSat code,
+ #                   OBCClientApp.py and datacache.py. Same interface as the
+ #                   generated SerDesHelpers.py it replaces, but every value is
+ #                   read with a precompiled struct.Struct straight from the
+ #                   buffer instead of copying its bytes one by one first.
+ ##############################################################################
+
+from functools import lru_cache
+from struct import Struct, error
+
+# @var INT_FORMATS struct format of every basic type.
+# @var FLOAT_FORMATS struct format of float and double.
+
+INT_FORMATS = {
+    'uint8': 'B',
+    'uint16': 'H',
+    'uint32': 'I',
+    'uint64': 'Q',
+    'int8': 'b',
+    'int16': 'h',
+    'int32': 'i',
+    'int64': 'q',
+    'boolean': 'B',
+}
+FLOAT_FORMATS = {'float': 'f', 'double': 'd'}
+
+BYTE_ORDER_PREFIXES = {'little': '<', 'big': '>'}
+
+# Scalar Structs by byte order and type name
+_INT_STRUCTS = {byteOrder: {name: Struct(prefix + fmt) for name, fmt in INT_FORMATS.items()}
+                for byteOrder, prefix in BYTE_ORDER_PREFIXES.items()}
+_FLOAT_STRUCTS = {byteOrder: {name: Struct(prefix + fmt) for name, fmt in FLOAT_FORMATS.items()}
+                  for byteOrder, prefix in BYTE_ORDER_PREFIXES.items()}
+
+
+# @brief Struct reading formats (e.g. "6h" for an array of 6 int16) in a byte order.
+
+@lru_cache(maxsize=None)
+def layout(byteOrder: str, formats: str) -> Struct:
+    return Struct(BYTE_ORDER_PREFIXES[byteOrder] + formats)
+
+
+# @brief Unpacks a Struct at pos without copying the buffer.
+#
+# @details data may also be a list of ints, as the generated code accepts, then only
+#          the bytes read are copied. Running out of data raises IndexError, like the
+#          generated helpers did.
+
+def unpack_at(struct: Struct, data, pos: int) -> tuple:
+    try:
+        return struct.unpack_from(data, pos)
+    except TypeError:
+        return unpack_at(struct, bytes(data[pos:pos + struct.size]), 0)
+    except error as exc:
+        raise IndexError(f'{struct.size} bytes at {pos}: {exc}') from None
+
+
+# @brief View of byteCount bytes of data from pos, a copy if data is not a buffer.
+
+def view_at(data, pos: int, byteCount: int):
+    try:
+        strip = memoryview(data)[pos:pos + byteCount]
+    except TypeError:
+        strip = bytes(data[pos:pos + byteCount])
+    if len(strip) != byteCount or pos < 0:
+        raise IndexError(f'{byteCount} bytes at {pos}: only {len(strip)} available')
+    return strip
+
+
+# Out of range values raise OverflowError, as int.to_bytes() did in the generated helpers
+def _pack(struct: Struct, *values) -> bytes:
+    try:
+        return struct.pack(*values)
+    except error as exc:
+        if all(isinstance(value, int) for value in values):
+            raise OverflowError(str(exc)) from None
+        raise TypeError(str(exc)) from None
+
+
+def _zero_padded(result: bytearray, total_bytes_size) -> bytearray:
+    if total_bytes_size is not None and len(result) < total_bytes_size:
+        result += bytes(total_bytes_size - len(result))
+    return result
+
+
+class SerDesHelpers:
+    # (size, signed) of every basic type
+    basicTypesDict = {name: (_INT_STRUCTS['little'][name].size, fmt.islower()) for name, fmt in INT_FORMATS.items()}
+
+    class serdesType_Helpers:
+        @staticmethod
+        def extractBytes(data, pos, byteCount):
+            return bytes(view_at(data, pos, byteCount))
+
+    class serdesType_Base:
+        byteOrder = 'little'
+
+        @staticmethod
+        def getPackByteOrderPrefix():
+            return BYTE_ORDER_PREFIXES[SerDesHelpers.serdesType_Base.byteOrder]
+
+    class serdesType_basic:
+        @staticmethod
+        def getStruct(basicTypeName):
+            try:
+                return _INT_STRUCTS[SerDesHelpers.serdesType_Base.byteOrder][basicTypeName]
+            except KeyError:
+                raise TypeError(f'Unknown basic type: "{basicTypeName}"') from None
+
+        @staticmethod
+        def serialize(basicTypeName, val):
+            return _pack(SerDesHelpers.serdesType_basic.getStruct(basicTypeName), val)
+
+        @staticmethod
+        # returns a tuple: (deserialized value, number of bytes processed)
+        def deserialize(basicTypeName, data, pos):
+            struct = SerDesHelpers.serdesType_basic.getStruct(basicTypeName)
+            return (unpack_at(struct, data, pos)[0], struct.size)
+
+    class serdesType_float:
+        @staticmethod
+        def serialize(val):
+            return _FLOAT_STRUCTS[SerDesHelpers.serdesType_Base.byteOrder]['float'].pack(val)
+
+        @staticmethod
+        # returns a tuple: (deserialized value, number of bytes processed)
+        def deserialize(data, pos):
+            return (unpack_at(_FLOAT_STRUCTS[SerDesHelpers.serdesType_Base.byteOrder]['float'], data, pos)[0], 4)
+
+        @staticmethod
+        def getSize():
+            return 4
+
+    class serdesType_double:
+        @staticmethod
+        def serialize(val):
+            return _FLOAT_STRUCTS[SerDesHelpers.serdesType_Base.byteOrder]['double'].pack(val)
+
+        @staticmethod
+        # returns a tuple: (deserialized value, number of bytes processed)
+        def deserialize(data, pos):
+            return (unpack_at(_FLOAT_STRUCTS[SerDesHelpers.serdesType_Base.byteOrder]['double'], data, pos)[0], 8)
+
+        @staticmethod
+        def getSize():
+            return 8
+
+    class serdesType_basicArray:
+        @staticmethod
+        def appendNullToBuff(array, newSize):
+            return array + bytearray(max(0, newSize - len(array)))
+
+        # total_array_size pads the array with zeros, as OBCClientApp expects
+        @staticmethod
+        def serialize(basicTypeName, array, total_array_size=None):
+            SerDesHelpers.serdesType_basic.getStruct(basicTypeName)
+            struct = layout(SerDesHelpers.serdesType_Base.byteOrder, f'{len(array)}{INT_FORMATS[basicTypeName]}')
+            result = bytearray(_pack(struct, *array))
+            if total_array_size is not None:
+                total_array_size *= SerDesHelpers.basicTypesDict[basicTypeName][0]
+            return _zero_padded(result, total_array_size)
+
+        @staticmethod
+        def deserialize(basicTypeName, data, pos, size):
+            SerDesHelpers.serdesType_basic.getStruct(basicTypeName)
+            struct = layout(SerDesHelpers.serdesType_Base.byteOrder, f'{size}{INT_FORMATS[basicTypeName]}')
+            return (list(unpack_at(struct, data, pos)), struct.size)
+
+    class serdesType_floatDoubleArray:
+        @staticmethod
+        def getFormat(serdesType):
+            if serdesType is SerDesHelpers.serdesType_float:
+                return FLOAT_FORMATS['float']
+            if serdesType is SerDesHelpers.serdesType_double:
+                return FLOAT_FORMATS['double']
+            raise TypeError(
+                f'serdesType shall be a reference to either serdesType_float or serdesType_double class: "{str(serdesType)}" provided instead')
+
+        @staticmethod
+        def serialize(serdesType, array, total_array_size=None):
+            fmt = SerDesHelpers.serdesType_floatDoubleArray.getFormat(serdesType)
+            result = bytearray(layout(SerDesHelpers.serdesType_Base.byteOrder, f'{len(array)}{fmt}').pack(*array))
+            if total_array_size is not None:
+                total_array_size *= serdesType.getSize()
+            return _zero_padded(result, total_array_size)
+
+        @staticmethod
+        def deserialize(serdesType, data, pos, size):
+            fmt = SerDesHelpers.serdesType_floatDoubleArray.getFormat(serdesType)
+            struct = layout(SerDesHelpers.serdesType_Base.byteOrder, f'{size}{fmt}')
+            return (list(unpack_at(struct, data, pos)), struct.size)
+
+    class serdesType_customTypeArray:
+        @staticmethod
+        def serialize(array, total_array_size=None):
+            result = bytearray()
+
+            for entry in array:
+                result += entry.serialize()
+
+            if total_array_size is not None:
+                total_array_size *= array[0].getSize()
+            return _zero_padded(result, total_array_size)
+
+        @staticmethod
+        def deserialize(customTypeSerDesType, data, pos, size):
+            result = []
+
+            rawDataStrip = view_at(data, pos, size * customTypeSerDesType.getSize())
+
+            currentPos = 0
+
+            for _ in range(0, size):
+                (val, bytesProcessed) = customTypeSerDesType.deserialize(rawDataStrip, currentPos)
+                result.append(val)
+                currentPos += bytesProcessed
+
+            return (result, size * customTypeSerDesType.getSize())
+
+    class struct_FPHeader:
+        def __init__(self):
+            self.u16ProtoId = 0
+            self.u32FuncId = 0
+            self.u16seqId = 0
+            self.u8ErrCode = 0
+
+        def serialize(self):
+            return bytearray(_pack(layout(SerDesHelpers.serdesType_Base.byteOrder, 'HIHB'),
+                                   self.u16ProtoId, self.u32FuncId, self.u16seqId, self.u8ErrCode))
+
+        @staticmethod
+        def deserialize(data, pos):
+            resultInstance = SerDesHelpers.struct_FPHeader()
+
+            (
+                resultInstance.u16ProtoId,
+                resultInstance.u32FuncId,
+                resultInstance.u16seqId,
+                resultInstance.u8ErrCode
+            ) = unpack_at(layout(SerDesHelpers.serdesType_Base.byteOrder, 'HIHB'), data, pos)
+            # strip-down response bit
+            resultInstance.u32FuncId &= ~(0x80000000)
+
+            return (resultInstance, SerDesHelpers.struct_FPHeader.getSize())
+
+        @staticmethod
+        def getSize():
+            return 9
+
+    class serdesType_string:
+        @staticmethod
+        def appendNullToString(asciiString, newLen):
+            assert newLen >= len(asciiString)
+            return asciiString + ('\0' * (newLen - len(asciiString)))
+
+        # total_string_size pads the string with NULs, as OBCClientApp expects
+        @staticmethod
+        def serialize(asciiString, total_string_size=None):
+            if total_string_size is not None:
+                asciiString = SerDesHelpers.serdesType_string.appendNullToString(asciiString, total_string_size)
+            return asciiString.encode('ascii')
+
+        @staticmethod
+        def deserialize(data, pos, size):
+            return (str(view_at(data, pos, size), 'ascii'), size)
@@ -11,23 +11,21 @@ from layer_1.client_apps.OBCClientApp import FP_API_OBC
 from layer_1.web_socket_api.CommandProtocol import send_command
 from layer_1.web_socket_api.constants import SatelliteId, CommandType, TripType, ModuleMac, RadioConfiguration, EncyptionKey
 from layer_1.web_socket_api.RadioConfiguration import set_radio_address, update_frequency, update_aes_key
-from layer_1.web_socket_client import WebSocketClient
-from layer_1.parsing.beacon_parser.realtime_beacon_parser import Beacon_Parser
-from layer_1.parsing.telemetry_parser.telemetry_parser import Unpacker, TelemetryFile
-import logging
-import re
+from layer_1.beacon_listener import BeaconListener
+from layer_1.command_executor import CommandExecutor, CommandLimit, CommandCancelled, current_token, report_progress, cancellable_sleep
+from layer_1.metrics import REGISTRY
+from layer_1.download_planner import DownloadPlanner, Priority
+from layer_1.dirlist_index import DirlistIndex, KIND_TLM, KIND_INSTRUMENT
+from layer_1.parsing.telemetry_parser.telemetry_parser import iter_file_records
+from layer_1.telemetry_pipeline import TelemetryPipeline
+from layer_1.parse_cache import ParseCache, IngestManifest
 import os
-import random
 import threading
-import base64
-from queue import Queue
 import time
+import uuid
 import glob
+from collections import Counter
 
-BEACON_LISTEN = {
-    "id": random.randint(0, 9999),
-    "type": "BeaconListen"
-}
 BEACON = {
     "ax25Frame": [0] * 256,
     "requestId": 0,
@@ -35,6 +33,38 @@ BEACON = {
 }
 obc_api = FP_API_OBC()
 
+# @var COMMAND_WORKERS Most commands running at once, beacon listening included.
+# @var COMMAND_LIMITS Concurrency and queue length per command, a second start_beacon
+#      is rejected while one is listening, downloads wait for the one running.
+# @var INLINE_COMMANDS Commands that only flip state, run right away on the caller's thread.
+# @var SHUTDOWN_TIMEOUT Seconds shutdown waits for cancelled commands to return.
+
+COMMAND_WORKERS = 4
+COMMAND_LIMITS = {
+    'uptime': CommandLimit(2, 4),
+    'start_beacon': CommandLimit(1, 0),
+    'get_telemetry': CommandLimit(1, 1),
+    'ingest_telemetry': CommandLimit(1, 1),
+    'get_instrument': CommandLimit(1, 1),
+    'get_dirlist': CommandLimit(1, 1),
+    'parse_telemetry': CommandLimit(1, 1)
+}
+INLINE_COMMANDS = ('stop_beacon', 'shutdown')
+SHUTDOWN_TIMEOUT = 10.0
+
+# @var TELEMETRY_PRIORITY, INSTRUMENT_PRIORITY Order files are downloaded in when the pass is
+#      too short for all of them, e.g. Priority(kinds=(KIND_TLM,), dc_ids=(28, 29)) to prefer
+#      files known to be heavy in those datacache entries.
+
+TELEMETRY_PRIORITY = Priority(kinds=(KIND_TLM,))
+INSTRUMENT_PRIORITY = Priority(kinds=(KIND_INSTRUMENT,))
+
+# @var TELEMETRY_FILES, INSTRUMENT_FILES DirlistIndex.files() queries selecting the files
+#      get_telemetry and get_instrument download.
+
+TELEMETRY_FILES = {"kind": KIND_TLM}
+INSTRUMENT_FILES = {"kind": KIND_INSTRUMENT, "numbers": range(0, 49)}
+
 
 # @brief Downloads a file from the onboard computer.
 # 
@@ -47,8 +77,7 @@ obc_api = FP_API_OBC()
 def download_file(file_name: str):
     status = 1
     file_format = "{0}\0".format(file_name).encode("utf-8")
-    serialized_request = [0, 0, 0, 0, 0]
-    serialized_request.extend(file_format)
+    serialized_request = bytes(5) + file_format
     serialized_response = send_command(SatelliteId.DEFAULT_ID, CommandType.OBC_FILE_DOWNLOAD, TripType.WAIT_FOR_RESPONSE, ModuleMac.OBC_MAC_ADDRESS, payload=serialized_request, add_payload_length=False)
 
     if serialized_response is None:
@@ -76,24 +105,6 @@ def init_radio():
     update_aes_key(EncyptionKey.AES_IV, EncyptionKey.AES_KEY)
 
 
-# @brief Retrieves a list of filenames matching the specified pattern.
-# 
-# @details This function reads the DIRLIST.TXT file from the "downloaded_files" directory, searches for
-#          filenames that match the regex pattern, and returns a list of those filenames.
-# 
-# @return A list of filenames matching the pattern.
-
-def get_filenames(pattern):
-    filenames = []
-    
-    root_dir = os.path.dirname(__file__)
-    dirlist_filepath = os.path.join(root_dir, "downloaded_files", "DIRLIST.TXT")
-    with open(dirlist_filepath, 'r', encoding='ISO-8859-1') as file:
-        dirlist_content = file.read()
-    filenames = re.findall(pattern, dirlist_content)
-    return filenames
-
-
 # @brief Initializes the SPACECOMMS_INTERFACE_API class.
 # 
 # @details Sets up the response queue, command mappings, and initializes internal
@@ -109,8 +120,8 @@ class SPACECOMMS_INTERFACE_API:
 # @brief Initializes the SPACECOMMS_INTERFACE_API class with command mappings and internal state.
 # 
 # @details Sets up the response queue, maps accepted commands to their corresponding handler methods,
-#          and initializes variables for beacon listening and managing threads. This sets the initial state
-#          for handling various space communication tasks.
+#          and initializes the beacon listening event and the CommandExecutor the commands run on. This
+#          sets the initial state for handling various space communication tasks.
 # 
 # @param resp_queue Queue for receiving and processing responses.
 
@@ -121,67 +132,106 @@ class SPACECOMMS_INTERFACE_API:
             'start_beacon': self.start_beacon_listening,
             'stop_beacon': self.stop_beacon_listening,
             'get_telemetry': self.download_telemetry_files,
+            'ingest_telemetry': self.ingest_telemetry_files,
             'get_instrument': self.download_instrument_files,
             'get_dirlist': self.download_dirlist,
             'parse_telemetry': self.parse_telemetry,
             'shutdown': self.cleanup
         }
         self.listening_for_beacons = threading.Event()
-        self.threads = {}
+        self.executor = CommandExecutor(max_workers=COMMAND_WORKERS, limits=COMMAND_LIMITS)
+        self.beacon_listener = None
+        self.download_planner = DownloadPlanner()
+        self.dirlist_index = DirlistIndex()
+        self.parse_cache = ParseCache()
+        self.ingest_manifest = IngestManifest()
+        self.pending_files = {}
+        REGISTRY.set_gauge("commands_running", self.executor.running_count)
+        REGISTRY.set_gauge("commands_queued", self.executor.queued_count)
         init_radio()
 
 
 # @brief Enqueues a response to the response queue.
 # 
 # @details Creates a response dictionary with the specified type and data, then
-#          adds it to the response queue for further processing.
+#          adds it to the response queue for further processing. The response is
+#          stamped with the monotonic time it was enqueued (and, for beacons, the
+#          time its frame was received) so the consumer can time the queue wait.
 # 
 # @param type The type of the response (e.g., 'telemetry').
 # @param data The data associated with the response.
+# @param received_at Optional monotonic time the data came off the socket.
+# @param on_stored Optional callback the consumer runs once the data is in the database,
+#        given False if it could not be stored.
 
-    def enqueue_response(self, type, data):
+    def enqueue_response(self, type, data, received_at=None, on_stored=None):
         response = {
             "type": type,
-            "data": data
+            "data": data,
+            "enqueued_at": time.monotonic()
         }
+        if received_at is not None:
+            response["received_at"] = received_at
+        if on_stored is not None:
+            response["on_stored"] = on_stored
         self.resp_queue.put(response)
 
 
 # @brief Handles incoming commands and initiates the corresponding actions.
 # 
 # @details Checks if the received command is in the accepted commands list. If it is,
-#          it starts a new thread to handle the command. If the command is "shutdown",
-#          it calls the cleanup method. If the command is not recognized, an error response
-#          is enqueued with an "unknown command" message.
+#          it is submitted to the command executor, which runs it on a pooled worker
+#          within its COMMAND_LIMITS. "stop_beacon" and "shutdown" run right away. If
+#          the command fails, is rejected or is not recognized, an error response is
+#          enqueued.
 # 
-# @param command The command to be processed.
+# @param command The command to be processed, optionally followed by its arguments
+#        separated by spaces (e.g. "get_telemetry 600").
+# @return The CommandFuture of the command, None for inline and unknown commands.
 
     def command_handler(self, command):
-        if command in self.accepted_commands:
-            print(f"Received Command {command}")
-            if command == "shutdown":
-                self.cleanup()
-            else:
-                command_thread = threading.Thread(target=self.accepted_commands[command])
-                self.threads[command] = command_thread
-                command_thread.start()
-        else:
+        command, *args = command.split() or [""]
+        if command not in self.accepted_commands:
             self.enqueue_response(type="error", data={"error message": "unkown command"})
+            return None
+
+        print(f"Received Command {command}")
+        if command in INLINE_COMMANDS:
+            self.accepted_commands[command]()
+            return None
+
+        future = self.executor.submit(command, self.accepted_commands[command], *args)
+        future.add_done_callback(self.command_done)
+        return future
+
+
+# @brief Reports how a command ended, enqueueing an error response if it failed.
+
+    def command_done(self, future):
+        if future.cancelled():
+            print(f"{future.command} cancelled before it started")
+            return
+        exc = future.exception()
+        if isinstance(exc, CommandCancelled):
+            print(f"{future.command} cancelled")
+        elif exc is not None:
+            print(f"{future.command} failed: {exc!r}")
+            self.enqueue_response(type="error", data={"error message": str(exc), "command": future.command})
 
 
 # @brief Cleans up resources and shuts down all running tasks.
 # 
-# @details Clears the beacon listening event, waits for all threads to complete,
-#          and prints a shutdown message for each command. Clears the threads dictionary
-#          after all tasks are shut down and prints a final shutdown message.
+# @details Clears the beacon listening event and shuts the command executor down:
+#          queued commands are cancelled and running ones have their websockets aborted.
+#          Waits at most timeout seconds, then reports any command that did not return.
+#
+# @param timeout Seconds to wait for the running commands.
 
-    def cleanup(self):
+    def cleanup(self, timeout: float = SHUTDOWN_TIMEOUT):
         self.listening_for_beacons.clear()
-        for command, thread in self.threads.items():
-            thread.join()
-            print(f"{command} has been gracefully shut down")
-        
-        self.threads.clear()
+        stuck = self.executor.shutdown(timeout)
+        for future in stuck:
+            print(f"{future.command} did not shut down within {timeout} seconds")
         print("All tasks shut down")
 
 
@@ -192,53 +242,43 @@ class SPACECOMMS_INTERFACE_API:
 #          is extracted from the parsed response and sent as an "uptime" type.
 
     def get_uptime(self):
-        serialized_request = list(obc_api.req_getUptime())
+        serialized_request = bytes(obc_api.req_getUptime())
 
         serialized_response = send_command(SatelliteId.DEFAULT_ID, CommandType.OBC_FP_GATEWAY, TripType.WAIT_FOR_RESPONSE, ModuleMac.OBC_MAC_ADDRESS, payload=serialized_request)
         
         
         parsed_response = obc_api.resp_getUptime(serialized_response)
 
-        self.enqueue_response(type="uptime", data=vars(parsed_response["s__upTime"]))
+        uptime = vars(parsed_response["s__upTime"])
+        self.enqueue_response(type="uptime", data=uptime)
 
         #print(parsed_response)
         print("GET_UPTIME stopped")
+        return uptime
 
 
 # @brief Starts listening for beacons from the WebSocket client.
 # 
-# @details Initializes the beacon listening process by setting up a WebSocket client,
-#          sending a beacon listen message, and continuously reading responses. When a
-#          beacon response is received, it decodes the AX.25 frame and parses the beacon data.
-#          The parsed beacons are enqueued for further processing. If an error response is received,
-#          the process is terminated. The listening process continues until the beacon listening flag is cleared.
+# @details Runs a BeaconListener until the beacon listening flag is cleared. The listener
+#          sends a beacon listen message, decodes the AX.25 frame of every beacon response
+#          and parses the beacon data, enqueueing each parsed beacon for further processing.
+#          If the connection drops or an error response is received, it reconnects with
+#          backoff and listens again instead of giving up on the pass. Cancelling the
+#          command stops listening as stop_beacon does. Gap and latency statistics are
+#          printed once listening stops.
 
     def start_beacon_listening(self):
         self.listening_for_beacons.set()
-        beacon_queue = Queue()
-        beacon_parser = Beacon_Parser(beacon_queue)
-        message = BEACON_LISTEN
-        listen_id = message["id"]
-        client = WebSocketClient.WebSocketClient(enableSSL=False)
-        client.send(payload_dict=message)
-        while self.listening_for_beacons.is_set():
-            response = {}
-            response = client.readResponse()
-            if response.get("type") == "Beacon":
-                if listen_id != response.get("requestId"):
-                    print("Mismatched ID's for beacon request")
-                frame = response["ax25Frame"]
-                decoded_frame = base64.b64decode(frame)
-                beacon_parser.parse_beacon(decoded_frame)
-                while not beacon_queue.empty():
-                    parsed_beacon = beacon_queue.get()
-                    self.enqueue_response(type="beacon", data=parsed_beacon)
-                    
-            elif response.get("type") == "Error":
-                logging.error("%s", response)
-                exit(0)
-        client.close()
+        token = current_token()
+        if token is not None:
+            token.add_callback(self.listening_for_beacons.clear)
+        listener = BeaconListener(self.listening_for_beacons,
+                                  on_message=lambda parsed_beacon, received_at: self.enqueue_response(type="beacon", data=parsed_beacon, received_at=received_at))
+        self.beacon_listener = listener
+        listener.run()
+        print(listener.stats)
         print("START_BEACON_LISTENING stopped")
+        return listener.stats
 
 
 # @brief Stops the beacon listening process.
@@ -253,111 +293,260 @@ class SPACECOMMS_INTERFACE_API:
 
 # @brief Downloads telemetry files from the server.
 # 
-# @details Downloads the directory listing file (DIRLIST.TXT), retrieves the filenames
-#          matching the telemetry file pattern, and attempts to download each file.
-#          If a download fails, it retries up to 10 times with a 5-second delay between attempts.
-#          It tracks the number of files successfully downloaded and logs any missed files.
+# @details Downloads the directory listing file (DIRLIST.TXT) and the telemetry files it
+#          lists, newest first, as many as the download planner expects to fit in the
+#          budget. See download_planned().
 # 
-# @note The total time taken for the download process is also recorded and displayed.
+# @param budget Optional seconds left in the pass, given as "get_telemetry 600".
 
-    def download_telemetry_files(self):
-        print("Downloading dirlist...")
-        download_file("DIRLIST.TXT")
-        regex_pattern = "\d{5}.TLM"
-        filenames = get_filenames(regex_pattern)
-        number_of_files = len(filenames)
-        current_file_number = 1
-        missed_files = []
-        total_time_start = time.perf_counter()
-        for file in filenames:
-            start_time = time.perf_counter()
-            print(f"[{current_file_number}/{number_of_files}] Downloading {file}...")
-            status = download_file(file)
-            retries = 0
-            while retries < 10 and status == 0:
-                retries += 1
-                print(f"Problem downloading file, retry #{retries}")
-                time.sleep(5)
-                status = download_file(file)
-            if status == 0:
-                missed_files.append(file)
-            current_file_number += 1
-            end_time = time.perf_counter()
-            elapsed_time = round(end_time - start_time)
-            print(f"Process took {elapsed_time} seconds.")
-        total_time_end = time.perf_counter()
-        total_elapsed_time = round(total_time_end - total_time_start)
-        print(f"Downloaded {number_of_files - len(missed_files)} of {number_of_files} files in {total_elapsed_time} seconds.")
-        print("Missed files: ", end="")
-        print(', '.join(missed_files))
+    def download_telemetry_files(self, budget=None):
+        return self.download_planned(TELEMETRY_PRIORITY, TELEMETRY_FILES, budget)
+
+
+# @brief Downloads telemetry files and stores their data while the pass goes on.
+# 
+# @details Downloads the telemetry files as get_telemetry does, but hands every file to a
+#          TelemetryPipeline as soon as it is on disk: it is parsed while the next file
+#          downloads and its records are enqueued in batches, each batch counting against
+#          the pipeline's in-flight limit until the backend has inserted it. When parsing or
+#          the database falls behind, the next download waits for them. Files already
+#          ingested with the same contents are not stored again.
+# 
+# @param budget Optional seconds left in the pass, given as "ingest_telemetry 600".
+# @return The download_planned() dict with the PipelineStats under "pipeline".
+
+    def ingest_telemetry_files(self, budget=None):
+        with self.telemetry_pipeline() as pipeline:
+            result = self.download_planned(TELEMETRY_PRIORITY, TELEMETRY_FILES, budget,
+                                           on_downloaded=lambda path: self.submit_telemetry_file(pipeline, path))
+        self.download_planner.save()
+        print(pipeline.stats)
+        result["pipeline"] = pipeline.stats
+        return result
+
+
+# @brief Streams the JSON records of a telemetry file.
+# 
+# @details Files decoded before with the same decoder are served from the parse cache.
+#          Otherwise messages are read and decoded one at a time, so the file is never held
+#          in memory as a whole, and the result is cached. Once the file is exhausted, the
+#          number of messages per dc_id in it is given to the download planner. Records
+#          are tagged with their file and decoder version, see layer_2.backfill.
+# 
+# @param path Path of the .TLM file.
+# @param key Parse cache key of the file if already known.
+# @param ingest_id Optional id tagged on the records, see telemetry_file_stored().
+# @return A generator of records.
+
+    def parse_telemetry_file(self, path, key=None, ingest_id=None):
+        tags = {"source_file": os.path.basename(path), "decoder_version": self.parse_cache.version}
+        if ingest_id is not None:
+            tags["ingest_id"] = ingest_id
+        dc_counts = Counter()
+        for record in self.parse_cache.records(path, iter_file_records, key):
+            dc_counts[record["dc_id"]] += 1
+            record.update(tags)
+            yield record
+        self.download_planner.record_contents(os.path.basename(path), dc_counts)
+
+
+# @brief Creates the TelemetryPipeline parse_telemetry and ingest_telemetry stream files through.
+
+    def telemetry_pipeline(self):
+        return TelemetryPipeline(lambda path: self.parse_telemetry_file(path, *self.pending_files.get(path, ())),
+                                 self.store_telemetry_batch, on_file_stored=self.telemetry_file_stored,
+                                 on_file_failed=self.telemetry_file_failed)
+
+
+# @brief Hands a telemetry file to a pipeline unless it is already in the database.
+# 
+# @param pipeline The TelemetryPipeline.
+# @param path Path of the .TLM file.
+# @param force Store the file even if the ingest manifest has it.
+# @return True if the file was submitted.
+
+    def submit_telemetry_file(self, pipeline, path, force=False):
+        key = self.parse_cache.key_for(path)
+        if not force and self.ingest_manifest.is_ingested(os.path.basename(path), key):
+            print(f"{os.path.basename(path)} already ingested, skipping")
+            return False
+        self.pending_files[path] = (key, uuid.uuid4().hex)
+        pipeline.submit(path)
+        return True
+
+
+# @brief Has the backend delete the records stored from earlier versions of a file whose
+#        records were all inserted, then records it in the ingest manifest.
+# 
+# @details Earlier versions of the file (before it grew, or with another decoder) are the
+#          records that do not carry its ingest_id. If they cannot be deleted the file is
+#          not marked, so the next run stores it again.
+
+    def telemetry_file_stored(self, path):
+        if path not in self.pending_files:
+            return
+        key, ingest_id = self.pending_files.pop(path)
+
+        def on_superseded(ok=True):
+            if ok:
+                self.ingest_manifest.mark(os.path.basename(path), key)
+
+        self.enqueue_response(type="superseded", data={"source_file": os.path.basename(path), "ingest_id": ingest_id},
+                              on_stored=on_superseded)
+
+
+# @brief Forgets a file that failed to parse or store, so the next run stores it again.
+# 
+# @details The file is not marked in the ingest manifest and its older records are kept.
+#          The records it did store are superseded when it is stored in full.
+
+    def telemetry_file_failed(self, path):
+        self.pending_files.pop(path, None)
+        print(f"{os.path.basename(path)} could not be stored in full, it will be retried next time")
+
+
+# @brief Enqueues a batch of telemetry records for the backend to insert.
+# 
+# @param batch List of records.
+# @param on_stored Callback the backend runs once the batch is inserted, given False if it failed.
+
+    def store_telemetry_batch(self, batch, on_stored):
+        self.enqueue_response(type="telemetry", data=batch, on_stored=on_stored)
 
 
 # @brief Parses telemetry files and generates JSON data.
 # 
-# @details Retrieves all telemetry files in the "downloaded_files" directory, parses
-#          each file, and generates JSON data from the parsed telemetry messages. 
-#          The resulting JSON data is enqueued for further processing.
+# @details Retrieves all telemetry files in the "downloaded_files" directory and streams
+#          them through a TelemetryPipeline: records are decoded as the file is read and
+#          enqueued in batches, with only a few batches waiting for the backend at once,
+#          so memory stays flat whatever the size of the files. The number of messages
+#          per dc_id in each file is given to the download planner. Files already
+#          ingested with the same contents and decoder are skipped, so running it again
+#          after a crash only redoes the files that were not fully stored.
+# 
+# @param force Given as "parse_telemetry force", stores every file again.
 
-    def parse_telemetry(self):
+    def parse_telemetry(self, force=None):
         root_dir = os.path.dirname(__file__)
         tlm_file_list = glob.glob(f"{root_dir}/downloaded_files/*.TLM")
-        for file in tlm_file_list:
-            tlm_file = TelemetryFile(file)
-            tlm_file.parse_file()
-            file_handler = Unpacker(tlm_file.msglist, tlm_file.fname)
-            json_data = file_handler.generate_json_data()
-            self.enqueue_response(type="telemetry", data=json_data)
+        with self.telemetry_pipeline() as pipeline:
+            for file_number, file in enumerate(tlm_file_list):
+                report_progress(file_number, len(tlm_file_list), file)
+                token = current_token()
+                if token is not None:
+                    token.check()
+                self.submit_telemetry_file(pipeline, file, force=force == "force")
+        self.download_planner.save()
+        print(pipeline.stats)
+        print(f"Parse cache: {self.parse_cache.hits} hits, {self.parse_cache.misses} misses")
+        report_progress(len(tlm_file_list), len(tlm_file_list))
+        return pipeline.stats
+
+
+# @brief Downloads instrument-related files.
+# 
+# @details Downloads the directory listing (DIRLIST.TXT) and the instrument files (IHK, PMT,
+#          ERP) numbered 0 to 48 it lists, as many as fit in the budget. See download_planned().
+# 
+# @param budget Optional seconds left in the pass, given as "get_instrument 600".
+
+    def download_instrument_files(self, budget=None):
+        return self.download_planned(INSTRUMENT_PRIORITY, INSTRUMENT_FILES, budget)
 
 
-# @brief Downloads instrument-related files based on a specific pattern.
+# @brief Downloads the files the download planner picks for the time left in the pass.
 # 
-# @details Downloads the directory listing (DIRLIST.TXT) and retrieves filenames matching
-#          a regex pattern for instrument files (IHK, PMT, ERP). Each file is downloaded,
-#          with up to 10 retries in case of failure. The number of successfully downloaded files
-#          and any missed files are tracked and displayed along with the time taken for the process.
+# @details Refreshes the DIRLIST index and plans the files the query selects: files already
+#          downloaded at their listed size are skipped, the rest are ordered by priority
+#          and taken while their estimated transfer time fits the budget. Files that do
+#          not fit, or that could not be downloaded, are kept in the planner's backlog for
+#          the next pass. If a download fails, it retries up to 10 times with a 5-second
+#          delay between attempts, cut short if the command is cancelled or the budget runs
+#          out. Every download updates the planner's throughput estimate. Progress is
+#          reported per file.
+# 
+# @param priority Priority of the files.
+# @param query Keyword arguments of DirlistIndex.files() selecting the files.
+# @param budget Seconds left in the pass, None for no limit.
+# @param on_downloaded Optional callback given the local path of every downloaded file.
+# @return Dict of the number of files downloaded and the missed and deferred files.
+# 
+# @note The total time taken for the download process is also recorded and displayed.
 
-    def download_instrument_files(self):
-        # Get 0 to 48
-        regex_pattern = "(?:000(?:(?:0[0-9])|(?:1[0-9])|(?:2[0-9])|(?:3[0-9])|(?:4[0-8]))).(?:(?:IHK)|(?:PMT)|(?:ERP))"
-        print("Downloading dirlist...")
-        download_file("DIRLIST.TXT")
-        filenames = get_filenames(regex_pattern)
-        print(filenames)
-        number_of_files = len(filenames)
-        current_file_number = 1
-        missed_files = []
+    def download_planned(self, priority, query, budget=None, on_downloaded=None):
         total_time_start = time.perf_counter()
-        for file in filenames:
+        deadline = total_time_start + float(budget) if budget is not None else None
+        planner = self.download_planner
+        self.download_dirlist()
+        entries = self.dirlist_index.files(**query)
+        if deadline is not None:
+            budget = deadline - time.perf_counter()
+
+        plan = planner.plan(entries, budget, priority)
+        print(plan)
+        number_of_files = len(plan.selected)
+        missed_files = []
+        deferred_files = [entry.name for entry in plan.deferred]
+        for current_file_number, entry in enumerate(plan.selected, 1):
+            if deadline is not None and time.perf_counter() + plan.estimates[entry.name] > deadline:
+                deferred_files += [entry.name for entry in plan.selected[current_file_number - 1:]]
+                print(f"Out of time, deferring {len(plan.selected) - current_file_number + 1} files to the next pass")
+                break
+
+            print(f"[{current_file_number}/{number_of_files}] Downloading {entry.name} ({entry.size} B, ~{plan.estimates[entry.name]:.0f} s)...")
+            report_progress(current_file_number - 1, number_of_files, entry.name)
             start_time = time.perf_counter()
-            print(f"[{current_file_number}/{number_of_files}] Downloading {file}...")
-            status = download_file(file)
+            status = download_file(entry.name)
             retries = 0
-
             while retries < 10 and status == 0:
+                if deadline is not None and time.perf_counter() + 5 > deadline:
+                    break
                 retries += 1
                 print(f"Problem downloading file, retry #{retries}")
-                time.sleep(5)
-                status = download_file(file)
-
+                cancellable_sleep(5)
+                start_time = time.perf_counter()
+                status = download_file(entry.name)
+            elapsed_time = time.perf_counter() - start_time
+            planner.record_transfer(entry.name, entry.size, elapsed_time, ok=status == 1)
             if status == 0:
-                missed_files.append(file)
-
-            current_file_number += 1
-            end_time = time.perf_counter()
-            elapsed_time = round(end_time - start_time)
-            print(f"Process took {elapsed_time} seconds.")
-        total_time_end = time.perf_counter()
-        total_elapsed_time = round(total_time_end - total_time_start)
-        print(f"Downloaded {number_of_files - len(missed_files)} of {number_of_files} files in {total_elapsed_time} seconds.")
+                missed_files.append(entry.name)
+            elif on_downloaded is not None:
+                on_downloaded(os.path.join(os.path.dirname(__file__), "downloaded_files", entry.name))
+            print(f"Process took {round(elapsed_time)} seconds.")
+
+        planner.defer(missed_files + deferred_files)
+        planner.save()
+        downloaded = number_of_files - len(missed_files) - (len(deferred_files) - len(plan.deferred))
+        total_elapsed_time = round(time.perf_counter() - total_time_start)
+        print(f"Downloaded {downloaded} of {number_of_files} files in {total_elapsed_time} seconds, "
+              f"throughput ~{planner.throughput:.0f} B/s.")
         print("Missed files: ", end="")
         print(', '.join(missed_files))
+        print(f"Deferred to the next pass: {len(deferred_files)} files")
+        report_progress(number_of_files, number_of_files)
+        return {"downloaded": downloaded, "missed": missed_files, "deferred": deferred_files}
 
 
 # @brief Downloads the directory listing file (DIRLIST.TXT).
 # 
-# @details Initiates the download of the DIRLIST.TXT file and logs the download status.
+# @details Initiates the download of the DIRLIST.TXT file, indexes it and prints the files
+#          that are new or changed size since the previous listing. The download time feeds
+#          the planner's throughput estimate. If the download fails, the previous index is kept.
+# 
+# @return The DirlistDiff, None if the download failed.
 
     def download_dirlist(self):
         print("Downloading dirlist...")
-        download_file("DIRLIST.TXT")
-        print("Downloaded Dirlist", end="\n\n")
+        start_time = time.perf_counter()
+        if not download_file("DIRLIST.TXT"):
+            print(f"Could not download the dirlist, using the one from {time.ctime(self.dirlist_index.updated or 0)}")
+            return None
+        dirlist_filepath = os.path.join(os.path.dirname(__file__), "downloaded_files", "DIRLIST.TXT")
+        self.download_planner.record_sample(os.path.getsize(dirlist_filepath), time.perf_counter() - start_time)
+
+        diff = self.dirlist_index.update_from_file(dirlist_filepath)
+        print(f"Downloaded Dirlist, {len(self.dirlist_index)} files. {diff}")
+        for entry in diff.changed:
+            print(f"  {entry.name} {entry.size} B")
+        print()
+        return diff
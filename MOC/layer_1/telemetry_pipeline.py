@@ -0,0 +1,268 @@
+ ##############################################################################
+ # @file           : telemetry_pipeline.py
+ # @brief          : Staged download -> parse -> store pipeline for .TLM files.
+ #                   Files are parsed as soon as they are downloaded and their
+ #                   records are stored in batches while the next download is
+ #                   still running, with bounded queues between the stages.
+ ##############################################################################
+
+import logging
+import threading
+import time
+from queue import Queue, Full
+from layer_1.metrics import REGISTRY
+from layer_1.parsing.telemetry_parser.telemetry_parser import batched
+
+# @var PARSE_QUEUE_SIZE Downloaded files waiting for a parse worker before submit() blocks.
+# @var STORE_QUEUE_SIZE Parsed batches waiting for the store stage before the parse workers block.
+# @var MAX_IN_FLIGHT Batches handed to store() but not yet acknowledged as stored.
+# @var BATCH_SIZE Records per stored batch.
+# @var CLOSE_TIMEOUT Seconds close() waits for the queued files by default before aborting them.
+
+PARSE_QUEUE_SIZE = 4
+STORE_QUEUE_SIZE = 8
+MAX_IN_FLIGHT = 4
+BATCH_SIZE = 1000
+CLOSE_TIMEOUT = 600.0
+
+# Marks the end of a queue
+_DONE = object()
+
+
+# @brief Counters describing a pipeline run.
+
+class PipelineStats:
+    def __init__(self):
+        self.files_submitted = 0
+        self.files_parsed = 0
+        self.files_stored = 0
+        self.parse_errors = 0
+        self.store_errors = 0
+        self.records = 0
+        self.batches = 0
+        self.max_file_to_store = 0.0
+
+    def __str__(self):
+        return (f'PipelineStats> files: {self.files_submitted} submitted, {self.files_parsed} parsed, '
+                f'{self.files_stored} stored | parse errors: {self.parse_errors} | store errors: {self.store_errors} | records: {self.records} | '
+                f'batches: {self.batches} | max download to stored: {self.max_file_to_store:.2f} s')
+
+
+# @brief Parses and stores files handed over one by one, overlapping with their producer.
+#
+# @details submit() puts a file on a bounded queue read by parse_workers threads,
+#          blocking the downloader when parsing falls behind. The records of every file
+#          are cut into batches of batch_size as they are parsed and put on a second
+#          bounded queue, so a file is never held in memory as a whole. It is read by
+#          a single store thread that calls store(batch, on_stored). store() must call
+#          on_stored() once the batch is in the database, or on_stored(False) if it could
+#          not be stored. At most max_in_flight batches may be waiting for that, so a slow
+#          database holds back the parse workers and in turn the downloads instead of
+#          filling up memory. A file that fails to parse or to store is never reported
+#          as stored, its batches already stored stay in the database.
+#
+# @param parse Callable returning the records of a file path, preferably a generator.
+# @param store Callable taking a list of records and the callback to run once they are stored.
+# @param on_file_stored Optional callback given the path of every file whose records are all stored.
+# @param on_file_failed Optional callback given the path of every file that failed to parse or store.
+
+class TelemetryPipeline:
+    def __init__(self, parse, store, parse_workers: int = 1, parse_queue_size: int = PARSE_QUEUE_SIZE,
+                 store_queue_size: int = STORE_QUEUE_SIZE, max_in_flight: int = MAX_IN_FLIGHT,
+                 batch_size: int = BATCH_SIZE, metrics=REGISTRY, on_file_stored=None, on_file_failed=None):
+        self.parse = parse
+        self.store = store
+        self.on_file_stored = on_file_stored
+        self.on_file_failed = on_file_failed
+        self.failed_files = set()
+        self.batch_size = batch_size
+        self.metrics = metrics
+        self.parse_queue = Queue(maxsize=parse_queue_size)
+        self.store_queue = Queue(maxsize=store_queue_size)
+        self.max_in_flight = max_in_flight
+        self.in_flight = threading.BoundedSemaphore(max_in_flight)
+        self.stats = PipelineStats()
+        self.stats_lock = threading.Lock()
+        self.aborted = threading.Event()
+        self.parse_threads = [threading.Thread(target=self._parse_worker, name=f"tlm-parse-{i}", daemon=True)
+                              for i in range(parse_workers)]
+        self.store_thread = threading.Thread(target=self._store_worker, name="tlm-store", daemon=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, type, value, traceback):
+        if type is not None:
+            self.abort()
+        self.close()
+
+    def start(self):
+        for thread in self.parse_threads:
+            thread.start()
+        self.store_thread.start()
+        return self
+
+    # @brief Hands a downloaded file to the parse workers, blocks while they are behind.
+    def submit(self, path: str):
+        self._count("files_submitted")
+        with self.stats_lock:
+            self.failed_files.discard(path)
+        self._put(self.parse_queue, (path, time.monotonic()))
+
+    # @brief Waits for every submitted file to be parsed and stored.
+    #
+    # @details Whatever is not stored once the timeout is up is aborted.
+    #
+    # @param timeout Seconds to wait, None for no limit.
+    # @return The PipelineStats.
+
+    def close(self, timeout: float = CLOSE_TIMEOUT) -> PipelineStats:
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        def remaining():
+            return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+        for _ in self.parse_threads:
+            self._put(self.parse_queue, _DONE)
+        for thread in self.parse_threads:
+            thread.join(remaining())
+        self._put(self.store_queue, _DONE)
+        self.store_thread.join(remaining())
+
+        # Every permit back means every batch handed to store() is in the database
+        acquired = 0
+        while acquired < self.max_in_flight and self._acquire(remaining()):
+            acquired += 1
+        for _ in range(acquired):
+            self.in_flight.release()
+        workers_alive = any(thread.is_alive() for thread in self.parse_threads + [self.store_thread])
+        if (acquired < self.max_in_flight or workers_alive) and not self.aborted.is_set():
+            logging.warning("Telemetry pipeline not done after %s s, aborting it", timeout)
+            self.abort()
+        return self.stats
+
+    # @brief Drops the queued work, workers stop after their current file or batch.
+    def abort(self):
+        self.aborted.set()
+        for queue in (self.parse_queue, self.store_queue):
+            while not queue.empty():
+                queue.get_nowait()
+
+    # Puts unless aborted, the end marker always goes through as the workers skip what is queued
+    def _put(self, queue, item):
+        while True:
+            if self.aborted.is_set() and item is not _DONE:
+                return
+            try:
+                queue.put(item, timeout=0.1)
+                return
+            except Full:
+                pass
+
+    # Takes an in-flight permit unless aborted or out of time
+    def _acquire(self, timeout: float = None) -> bool:
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while not self.aborted.is_set():
+            wait = 0.1 if deadline is None else min(0.1, deadline - time.monotonic())
+            if wait <= 0:
+                return False
+            if self.in_flight.acquire(timeout=wait):
+                return True
+        return False
+
+    def _count(self, name: str, amount: int = 1):
+        with self.stats_lock:
+            setattr(self.stats, name, getattr(self.stats, name) + amount)
+
+    def _parse_worker(self):
+        while True:
+            item = self.parse_queue.get()
+            if item is _DONE:
+                return
+            if self.aborted.is_set():
+                continue
+            path, downloaded_at = item
+
+            # A batch is held back until the next one is parsed to know which is the last
+            previous = None
+            completed = False
+            try:
+                for batch in batched(self.parse(path), self.batch_size):
+                    if self.aborted.is_set():
+                        break
+                    if previous is not None:
+                        self._put(self.store_queue, (path, downloaded_at, previous, False))
+                    previous = batch
+                else:
+                    completed = True
+            except Exception:
+                logging.exception("Could not parse %s", path)
+                self._count("parse_errors")
+                self._file_failed(path)
+                last = False
+            else:
+                if not completed:
+                    # Aborted partway through, the file was not read to the end
+                    self._file_failed(path)
+                    continue
+                self._count("files_parsed")
+                self.metrics.observe_since("tlm_download_to_parsed", downloaded_at)
+                if previous is None:
+                    self._file_stored(path)
+                last = True
+            if previous is not None:
+                self._put(self.store_queue, (path, downloaded_at, previous, last))
+
+    def _store_worker(self):
+        while True:
+            item = self.store_queue.get()
+            if item is _DONE:
+                return
+            if self.aborted.is_set():
+                continue
+            path, downloaded_at, batch, last = item
+
+            if not self._acquire():
+                continue
+            self._count("batches")
+            self._count("records", len(batch))
+            try:
+                self.store(batch, self._stored_callback(path, downloaded_at, last))
+            except Exception:
+                self.in_flight.release()
+                logging.exception("Could not store a batch of %s", path)
+                self._count("store_errors")
+                self._file_failed(path)
+
+    def _stored_callback(self, path: str, downloaded_at: float, last: bool):
+        def on_stored(ok: bool = True):
+            self.in_flight.release()
+            if not ok:
+                self._count("store_errors")
+                self._file_failed(path)
+            elif last and path not in self.failed_files:
+                elapsed = self.metrics.observe_since("tlm_download_to_stored", downloaded_at) - downloaded_at
+                with self.stats_lock:
+                    self.stats.max_file_to_store = max(self.stats.max_file_to_store, elapsed)
+                self._file_stored(path)
+        return on_stored
+
+    # Reports a file as failed once, the batches still queued for it are stored regardless
+    def _file_failed(self, path: str):
+        with self.stats_lock:
+            if path in self.failed_files:
+                return
+            self.failed_files.add(path)
+        if self.on_file_failed is not None:
+            try:
+                self.on_file_failed(path)
+            except Exception:
+                logging.exception("on_file_failed failed for %s", path)
+
+    def _file_stored(self, path: str):
+        self._count("files_stored")
+        if self.on_file_stored is not None:
+            try:
+                self.on_file_stored(path)
+            except Exception:
+                logging.exception("on_file_stored failed for %s", path)
@@ -1,12 +1,18 @@
 import base64
+import itertools
 import logging
 import random
+import threading
+from types import MappingProxyType
+from layer_1.web_socket_api.constants import PayloadEncoding
 from layer_1.web_socket_client import WebSocketClient
 
 # JSON Message CPCommand
-CP = {
-    "id": random.randint(0, 9999),
-    "cmdId": random.randint(0, 9999),
+# Read-only template, build_command copies it for every command so concurrent
+# commands never share (and overwrite) the same message dict.
+CP = MappingProxyType({
+    "id": 0,
+    "cmdId": 0,
     "satId": "0",
     "moduleMac": 0,
     "payload": [0],
@@ -16,28 +22,83 @@ CP = {
     "cmdType": 9999,
     "tripType": 1,
     "type": "CPCommand"
-}  
+})
 
-def send_command(satId: int, commandType: int, tripType: int, moduleMac: int, payload: list, add_payload_length: bool = True):
-    message = CP
-    message["satId"] = satId
-    message["cmdType"] = commandType
-    message["tripType"] = tripType
-    message["moduleMac"] = moduleMac
+# @var DEFAULT_PAYLOAD_ENCODING How command payloads are put on the wire.
+#      PayloadEncoding.BASE64 is far smaller for large payloads, but only use it
+#      against GS service builds that accept base64 payloads.
 
+DEFAULT_PAYLOAD_ENCODING = PayloadEncoding.INT_LIST
+
+_message_ids = itertools.count(random.randint(0, 9999))
+_message_ids_lock = threading.Lock()
+
+
+# @brief Returns a message id that is unique for the lifetime of the process.
+
+def next_message_id() -> int:
+    with _message_ids_lock:
+        return next(_message_ids)
+
+
+# @brief Encodes a payload for the "payload" field of a CPCommand message.
+#
+# @param payload The raw payload bytes.
+# @param payload_encoding One of PayloadEncoding.
+# @return A list of ints or a base64 string, depending on the encoding.
+
+def encode_payload(payload: bytes, payload_encoding: str = DEFAULT_PAYLOAD_ENCODING):
+    if payload_encoding == PayloadEncoding.BASE64:
+        return base64.b64encode(payload).decode("ascii")
+    elif payload_encoding == PayloadEncoding.INT_LIST:
+        return list(payload)
+    else:
+        raise ValueError(f"Unknown payload encoding: {payload_encoding}")
+
+
+# @brief Builds a new CPCommand message.
+#
+# @details Every call returns a fresh dict with its own id/cmdId, so it is safe to
+#          build and send commands from several threads at once. The payload is
+#          carried as bytes and only converted to its wire format here.
+#
+# @return The CPCommand message dict, ready to be sent.
+
+def build_command(satId: str, commandType: int, tripType: int, moduleMac: int, payload: bytes,
+                  add_payload_length: bool = True, payload_encoding: str = DEFAULT_PAYLOAD_ENCODING) -> dict:
+    payload = bytes(payload)
     if add_payload_length:
-        payload = [len(payload)] + payload
-    message["payload"] = payload
-
-    client = WebSocketClient.WebSocketClient(enableSSL=False)
-    client.send(payload_dict=message)
-    response = {}
-    while response.get("type") != "CPCommandResult":         # Continue reading from the websocket until CPCommandResult message arrives
-        response = client.readResponse()
-        if response.get("type") == "Error":
-            logging.error("%s", response)
-            response = None
-            return response
+        if len(payload) > 0xFF:
+            raise ValueError(f"Payload of {len(payload)} bytes does not fit a one byte length prefix")
+        payload = bytes((len(payload),)) + payload
+
+    message_id = next_message_id()
+    return {
+        **CP,
+        "id": message_id,
+        "cmdId": message_id,
+        "satId": satId,
+        "cmdType": commandType,
+        "tripType": tripType,
+        "moduleMac": moduleMac,
+        "payload": encode_payload(payload, payload_encoding),
+    }
+
+
+def send_command(satId: str, commandType: int, tripType: int, moduleMac: int, payload: bytes,
+                 add_payload_length: bool = True, payload_encoding: str = DEFAULT_PAYLOAD_ENCODING):
+    message = build_command(satId, commandType, tripType, moduleMac, payload,
+                            add_payload_length=add_payload_length, payload_encoding=payload_encoding)
+
+    with WebSocketClient.WebSocketClient(enableSSL=False) as client:
+        client.send(payload_dict=message)
+        response = {}
+        while response.get("type") != "CPCommandResult":         # Continue reading from the websocket until CPCommandResult message arrives
+            response = client.readResponse()
+            if response.get("type") == "Error":
+                logging.error("%s", response)
+                response = None
+                return response
 
     response = base64.b64decode(response["payload"].encode("ascii"))
     return response
@@ -36,4 +36,8 @@ class RadioConfiguration():
     SBAND_UPLINK_FREQUENCY = 2102500000
     SBAND_DOWNLINK_FREQUENCY = 2277500000
     UHF_UPLINK_FREQUENCY = 436000000
-    UHF_DOWNLINK_FREQUENCY = 435000000
\ No newline at end of file
+    UHF_DOWNLINK_FREQUENCY = 435000000
+
+class PayloadEncoding():
+    INT_LIST = "list"
+    BASE64 = "base64"
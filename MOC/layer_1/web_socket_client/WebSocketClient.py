@@ -1,43 +1,97 @@
+import json
 import logging
-from json import dumps, loads
-from traceback import print_exc
+from layer_1.command_executor import current_token
+
+# websocket-client opcodes for data frames (text and binary)
+DATA_OPCODES = (0x1, 0x2)
+
+
+class WebSocketConnectionError(Exception):
+    """The connection to GSService could not be opened or was lost"""
+
+
+class WebSocketTimeout(Exception):
+    """No frame arrived from GSService within the socket timeout"""
+
+
+class JsonCodec:
+    """Serializer used for the JSON messages exchanged with GSService"""
+
+    def __init__(self, name, dumps, loads):
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+
+
+def load_default_codec():
+    """Returns the fastest JSON codec available: orjson, then ujson, then the stdlib"""
+    try:
+        import orjson
+        return JsonCodec("orjson", orjson.dumps, orjson.loads)
+    except ImportError:
+        pass
+
+    try:
+        import ujson
+        return JsonCodec("ujson", ujson.dumps, ujson.loads)
+    except ImportError:
+        pass
+
+    return JsonCodec("json", json.dumps, json.loads)
+
+
+DEFAULT_CODEC = load_default_codec()
 
 
 class WebSocketClient:
     """Websocket client implementation for GSService interface tests"""
 
-    def __init__(self, enableSSL=True):
+    def __init__(self, enableSSL=True, codec=None, timeout=60):
         import ssl
         from configparser import ConfigParser
 
         import websocket
 
-        if enableSSL:
-
-            SERVER_IP = "127.0.0.1"
-            SERVER_PORT = "6660"
-
-            # websocket.enableTrace(True)
-            URL = "wss://%s:%s" % (SERVER_IP, SERVER_PORT)
-
-            self.connection = websocket.create_connection(
-                URL,
-                timeout=60,
-                sslopt={
-                    "check_hostname": False,
-                    "ca_certs": "/gs/certificates/CA/rootcert.pem",
-                    "certfile": "/gs/certificates/client/clientcert.pem",
-                    "keyfile": "/gs/certificates/client/clientkey.pem",
-                    "cert_reqs": ssl.CERT_REQUIRED.value,
-                },
-            )
-        # self.connection.settimeout(10.0)
-        else:
-
-            URL = "ws://127.0.0.1:6660"
-            logging.debug("Attempting connection")
-            self.connection = websocket.create_connection(URL, timeout=60)
-            logging.debug("Connection established")
+        self.websocket = websocket
+        self.codec = codec if codec is not None else DEFAULT_CODEC
+        self.connection = None
+        self.token = None
+
+        try:
+            if enableSSL:
+
+                SERVER_IP = "127.0.0.1"
+                SERVER_PORT = "6660"
+
+                # websocket.enableTrace(True)
+                URL = "wss://%s:%s" % (SERVER_IP, SERVER_PORT)
+
+                self.connection = websocket.create_connection(
+                    URL,
+                    timeout=timeout,
+                    sslopt={
+                        "check_hostname": False,
+                        "ca_certs": "/gs/certificates/CA/rootcert.pem",
+                        "certfile": "/gs/certificates/client/clientcert.pem",
+                        "keyfile": "/gs/certificates/client/clientkey.pem",
+                        "cert_reqs": ssl.CERT_REQUIRED.value,
+                    },
+                )
+            # self.connection.settimeout(10.0)
+            else:
+
+                URL = "ws://127.0.0.1:6660"
+                logging.debug("Attempting connection")
+                self.connection = websocket.create_connection(URL, timeout=timeout)
+                logging.debug("Connection established")
+
+        except (OSError, websocket.WebSocketException) as exc:
+            raise WebSocketConnectionError(f"Could not connect to GSService: {exc}") from exc
+
+        # A command cancelled while this client is open aborts it, waking up recv
+        self.token = current_token()
+        if self.token is not None:
+            self.token.attach(self)
 
     def __enter__(self):
         return self
@@ -46,31 +100,49 @@ class WebSocketClient:
         self.close()
 
     def close(self):
+        if self.token is not None:
+            self.token.detach(self)
         if self.connection:
             self.connection.close()
             self.connection = None
             logging.debug("CONNECTION CLOSED")
 
+    # Shuts the socket down from any thread, a recv blocked on it raises WebSocketConnectionError
+    def abort(self):
+        connection = self.connection
+        if connection:
+            connection.abort()
+
     def send(self, payload_dict: dict):
         try:
-            logging.debug("To Docker: %s", payload_dict)
-            self.connection.send(dumps(payload_dict))
+            if logging.root.isEnabledFor(logging.DEBUG):
+                logging.debug("To Docker: %s", payload_dict)
+            self.connection.send(self.codec.dumps(payload_dict))
 
-        except ConnectionResetError:
-            print_exc()
-            assert False, "ConnectionResetError"
-        except BrokenPipeError:
-            print_exc()
-            assert False, "BrokenPipeError"
+        except (OSError, self.websocket.WebSocketConnectionClosedException) as exc:
+            raise WebSocketConnectionError(f"{type(exc).__name__}: {exc}") from exc
 
-    def readResponse(self):
+    # Returns the raw bytes of the next data frame, without decoding them to str
+    def recvFrame(self) -> bytes:
         try:
-            response = self.connection.recv()
-            response = loads(response)
-            logging.debug("From Docker: %s", response)
+            opcode, frame = self.connection.recv_data()
 
-        except ConnectionResetError:
-            print_exc()
-            assert False, "ConnectionResetError"
+        except self.websocket.WebSocketTimeoutException as exc:
+            raise WebSocketTimeout(str(exc)) from exc
+        except (OSError, self.websocket.WebSocketConnectionClosedException) as exc:
+            raise WebSocketConnectionError(f"{type(exc).__name__}: {exc}") from exc
+
+        if opcode not in DATA_OPCODES:
+            raise WebSocketConnectionError("Connection closed by GSService")
+
+        return frame
+
+    def decode(self, frame: bytes) -> dict:
+        response = self.codec.loads(frame)
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug("From Docker: %s", response)
 
         return response
+
+    def readResponse(self):
+        return self.decode(self.recvFrame())
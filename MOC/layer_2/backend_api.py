@@ -1,33 +1,83 @@
 from layer_1.spacecomms_interface import SPACECOMMS_INTERFACE_API
+from layer_1.metrics import REGISTRY
 from queue import Queue, Empty
+import logging
 import threading
-from pymongo import MongoClient
+import time
+from pymongo import MongoClient, ASCENDING
 
 resp_queue = Queue()
+REGISTRY.set_gauge("resp_queue_depth", resp_queue.qsize)
 spacecomms_interface_api = SPACECOMMS_INTERFACE_API(resp_queue)
+
+# @var INSERT_BATCH_SIZE Most telemetry documents sent to MongoDB in one insert_many.
+
+INSERT_BATCH_SIZE = 1000
+
 client = MongoClient("mongodb://localhost:27017/")
 database = client["data"]
 
+# Telemetry records carry their Unix timestamp as an int, index it for range queries
+database["telemetry"].create_index([("dc_id", ASCENDING), ("timestamp", ASCENDING)])
+database["telemetry"].create_index("timestamp")
+# Superseded records are found by file and decoder version, see layer_2.backfill
+database["telemetry"].create_index([("source_file", ASCENDING), ("decoder_version", ASCENDING)])
+
 
 # @brief Handles responses from the response queue and inserts them into the database.
 # 
 # @details Continuously retrieves responses from the queue, processes them based on
 #          their type, and inserts the corresponding data into the appropriate database
-#          collection. If the response type is "telemetry", it inserts multiple documents,
-#          otherwise, a single document is inserted.
+#          collection. If the response type is "telemetry", it inserts its documents in
+#          chunks of INSERT_BATCH_SIZE, otherwise, a single document is inserted. Time
+#          spent waiting in the queue, inserting, and from socket to database (beacons)
+#          is recorded per response. A "superseded" response deletes the telemetry records
+#          of a file that were not stored by its latest ingestion.
+#          Responses carrying an on_stored callback have it run once they are inserted,
+#          or with False if the database raised, the handler then goes on with the next
+#          response.
 
 def command_resp_handler():
     while True:
         resp = resp_queue.get()
-        # print(resp, end="\n\n", flush=True)
-        collection = database[resp["type"]]
-        document = resp["data"]
-        if resp["type"] == "telemetry":
-            print(f"\n\nDocument to insert: {document}")
-            insertion_result = collection.insert_many(document)
-        else:
-            insertion_result = collection.insert_one(document)
-        print(f"Insertion result: {insertion_result}")
+        try:
+            store_resp(resp)
+            stored = True
+        except Exception:
+            logging.exception("Could not store a %s response", resp.get("type"))
+            REGISTRY.increment("store_errors")
+            stored = False
+        if "on_stored" in resp:
+            try:
+                resp["on_stored"](stored)
+            except Exception:
+                logging.exception("on_stored failed for a %s response", resp.get("type"))
+
+
+def store_resp(resp):
+    dequeued_at = time.monotonic()
+    if "enqueued_at" in resp:
+        REGISTRY.observe("resp_queue_wait", dequeued_at - resp["enqueued_at"])
+    # print(resp, end="\n\n", flush=True)
+    collection = database[resp["type"]]
+    document = resp["data"]
+    if resp["type"] == "telemetry":
+        print(f"\n\nInserting {len(document)} telemetry documents")
+        insertion_result = None
+        for start in range(0, len(document), INSERT_BATCH_SIZE):
+            insertion_result = collection.insert_many(document[start:start + INSERT_BATCH_SIZE])
+            REGISTRY.increment("documents_inserted", len(insertion_result.inserted_ids))
+    elif resp["type"] == "superseded":
+        insertion_result = database["telemetry"].delete_many({"source_file": document["source_file"],
+                                                              "ingest_id": {"$ne": document["ingest_id"]}})
+        REGISTRY.increment("documents_superseded", insertion_result.deleted_count)
+    else:
+        insertion_result = collection.insert_one(document)
+        REGISTRY.increment("documents_inserted")
+    inserted_at = REGISTRY.observe_since("mongo_insert", dequeued_at)
+    if "received_at" in resp:
+        REGISTRY.observe("socket_to_db", inserted_at - resp["received_at"])
+    print(f"Insertion result: {insertion_result}")
 
 
 # @brief Handles user input for sending commands to the spacecomms interface.
@@ -53,10 +103,15 @@ def backend_req_handler():
 # 
 # @details Creates a new thread to handle command responses and starts the
 #          backend request handler. The reader thread is set as a daemon thread
-#          to run in the background.
+#          to run in the background. Logging goes to the terminal from INFO up, so the
+#          pipeline metrics line logged every minute is shown. Metrics are also served
+#          as Prometheus text on http://127.0.0.1:METRICS_PORT/metrics.
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
     print("Starting backend API...")
+    REGISTRY.start_periodic_log()
+    REGISTRY.start_http_server()
     reader_thread = threading.Thread(target=command_resp_handler)
     reader_thread.daemon = True
     reader_thread.start()
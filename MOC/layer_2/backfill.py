@@ -0,0 +1,242 @@
+ ##############################################################################
+ # @file           : backfill.py
+ # @brief          : Re-decodes every .TLM file of an archive with the current
+ #                   decoders and replaces their records in the database.
+ #                   Decoding runs on a process pool, progress is checkpointed
+ #                   so an interrupted run resumes where it stopped, and the
+ #                   records of a file are replaced in one go.
+ #
+ #                   Run from the MOC directory:
+ #                   python3 -m layer_2.backfill ARCHIVE_DIR
+ ##############################################################################
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pymongo import MongoClient, ASCENDING
+from layer_1.parse_cache import ParseCache, file_hash, DEFAULT_CACHE_DIR
+from layer_1.parsing.telemetry_parser.telemetry_parser import iter_file_records, batched
+
+# @var DEFAULT_CHECKPOINT_PATH Where the files already backfilled are recorded.
+# @var INSERT_BATCH_SIZE Most documents sent to MongoDB in one insert_many.
+
+DEFAULT_CHECKPOINT_PATH = os.path.join(os.path.dirname(__file__), "backfill_checkpoint.json")
+DEFAULT_MONGO_URL = "mongodb://localhost:27017/"
+INSERT_BATCH_SIZE = 1000
+
+
+# @brief Files already backfilled with a decoder version, by source name and content hash.
+#
+# @details A checkpoint written with another decoder version is ignored, so changing a
+#          decoder starts the archive over. Saved after every file.
+
+class BackfillCheckpoint:
+    def __init__(self, path: str, decoder_version: str):
+        self.path = path
+        self.decoder_version = decoder_version
+        self.files = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    state = json.load(f)
+            except (OSError, ValueError) as exc:
+                logging.warning("Could not read backfill checkpoint %s: %s", path, exc)
+                return
+            if state.get("decoder_version") == decoder_version:
+                self.files = state.get("files", {})
+
+    def is_done(self, source_file: str, digest: str) -> bool:
+        return self.files.get(source_file) == digest
+
+    def mark(self, source_file: str, digest: str):
+        self.files[source_file] = digest
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"decoder_version": self.decoder_version, "files": self.files}, f, indent=1)
+        os.replace(temp_path, self.path)
+
+
+# @brief Lists the .TLM files of an archive with the name their records are stored under.
+#
+# @details Records are stored under the file name, as parse_telemetry does, unless the
+#          same name appears more than once in the archive, then under the path relative
+#          to the archive.
+#
+# @return A sorted list of (path, source_file).
+
+def find_archive_files(archive_dir: str) -> list:
+    paths = []
+    for root, _, names in os.walk(archive_dir):
+        paths += [os.path.join(root, name) for name in names if name.upper().endswith(".TLM")]
+    paths.sort()
+
+    names = [os.path.basename(path) for path in paths]
+    name_counts = Counter(names)
+    files = []
+    for path, name in zip(paths, names):
+        if name_counts[name] > 1:
+            name = os.path.relpath(path, archive_dir)
+        files.append((path, name))
+    return files
+
+
+# @brief Decodes a file into the parse cache, runs on the process pool.
+#
+# @return (path, content hash, number of records).
+
+def decode_file(path: str, cache_dir: str, max_bytes: int) -> tuple:
+    cache = ParseCache(cache_dir, max_bytes)
+    digest = file_hash(path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        count = sum(1 for _ in cache.records(path, iter_file_records, cache.key(digest)))
+    return path, digest, count
+
+
+def supports_transactions(client) -> bool:
+    hello = client.admin.command("hello")
+    return "setName" in hello or hello.get("msg") == "isdbgrid"
+
+
+# @brief Replaces every record of a file with new ones.
+#
+# @details The new records are inserted tagged with a fresh ingest_id, then every other
+#          record of the file (older decoder versions, records from parse_telemetry, or
+#          the part of an interrupted backfill) is deleted. In a transaction when the
+#          server has them, so readers switch from the old records to the new ones at once.
+#          Otherwise readers may briefly see both, never neither.
+#
+# @param collection The telemetry collection.
+# @param records Iterable of records.
+# @param tags Fields added to every record, source_file and decoder_version.
+# @param session Optional pymongo session with transactions.
+# @return (records inserted, records deleted).
+
+def replace_file_records(collection, records, tags: dict, session=None) -> tuple:
+    ingest_id = uuid.uuid4().hex
+
+    def write(session):
+        inserted = 0
+        for batch in batched(records, INSERT_BATCH_SIZE):
+            for record in batch:
+                record.update(tags, ingest_id=ingest_id)
+            collection.insert_many(batch, session=session)
+            inserted += len(batch)
+        deleted = collection.delete_many({"source_file": tags["source_file"], "ingest_id": {"$ne": ingest_id}},
+                                         session=session)
+        return inserted, deleted.deleted_count
+
+    if session is None:
+        return write(None)
+    # The transaction may be retried, the records must survive the first attempt
+    records = list(records)
+    return session.with_transaction(write)
+
+
+# @brief Decodes and stores every file of an archive not done yet.
+#
+# @param files List of (path, source_file), see find_archive_files().
+# @param collection The telemetry collection, None to only decode into the cache.
+# @param cache ParseCache the workers decode into.
+# @param checkpoint BackfillCheckpoint.
+# @param workers Processes decoding files.
+# @param client MongoClient, used for transactions when the server supports them.
+# @return Dict of files done, skipped and failed, records inserted and deleted.
+
+def run_backfill(files, collection, cache: ParseCache, checkpoint: BackfillCheckpoint, workers: int = None,
+                 client=None) -> dict:
+    summary = {"done": 0, "skipped": 0, "failed": 0, "inserted": 0, "deleted": 0}
+    source_files = dict(files)
+    pending = []
+    for path, source_file in files:
+        if checkpoint.is_done(source_file, file_hash(path)):
+            summary["skipped"] += 1
+        else:
+            pending.append(path)
+    print(f"{len(files)} files in the archive, {summary['skipped']} already done, {len(pending)} to backfill "
+          f"with decoder {cache.version}")
+
+    use_transactions = client is not None and collection is not None and supports_transactions(client)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(decode_file, path, cache.directory, cache.max_bytes) for path in pending]
+        try:
+            for number, future in enumerate(as_completed(futures), 1):
+                try:
+                    path, digest, count = future.result()
+                except Exception as exc:
+                    summary["failed"] += 1
+                    print(f"[{number}/{len(pending)}] Could not decode a file: {exc!r}")
+                    continue
+
+                source_file = source_files[path]
+                if collection is not None:
+                    records = cache.get(cache.key(digest))
+                    if records is None:
+                        # Evicted by another worker in the meantime
+                        with contextlib.redirect_stdout(io.StringIO()):
+                            records = list(iter_file_records(path))
+                    tags = {"source_file": source_file, "decoder_version": cache.version}
+                    if use_transactions:
+                        with client.start_session() as session:
+                            inserted, deleted = replace_file_records(collection, records, tags, session)
+                    else:
+                        inserted, deleted = replace_file_records(collection, records, tags)
+                    summary["inserted"] += inserted
+                    summary["deleted"] += deleted
+
+                checkpoint.mark(source_file, digest)
+                summary["done"] += 1
+                print(f"[{number}/{len(pending)}] {source_file}: {count} records, "
+                      f"{time.perf_counter() - start:.0f} s elapsed")
+        except KeyboardInterrupt:
+            for future in futures:
+                future.cancel()
+            print("Interrupted, run again to resume")
+            raise
+    return summary
+
+
+def main(argv=None) -> int:
+    arg_parser = argparse.ArgumentParser(description="Re-decode an archive of .TLM files and replace their records")
+    arg_parser.add_argument("archive", help="directory searched for .TLM files, recursively")
+    arg_parser.add_argument("--workers", type=int, help="decoding processes, one per CPU by default")
+    arg_parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT_PATH, help="file progress is kept in")
+    arg_parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and redo every file")
+    arg_parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="parse cache the files are decoded into")
+    arg_parser.add_argument("--cache-size", type=int, default=1 << 30, help="parse cache size in bytes")
+    arg_parser.add_argument("--mongo", default=DEFAULT_MONGO_URL, help="MongoDB URL")
+    arg_parser.add_argument("--dry-run", action="store_true", help="only decode into the cache, store nothing")
+    args = arg_parser.parse_args(argv)
+
+    cache = ParseCache(args.cache_dir, args.cache_size)
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    checkpoint = BackfillCheckpoint(args.checkpoint, cache.version)
+    files = find_archive_files(args.archive)
+
+    client = None
+    collection = None
+    if not args.dry_run:
+        client = MongoClient(args.mongo)
+        collection = client["data"]["telemetry"]
+        collection.create_index([("source_file", ASCENDING), ("decoder_version", ASCENDING)])
+
+    try:
+        summary = run_backfill(files, collection, cache, checkpoint, args.workers, client)
+    except KeyboardInterrupt:
+        return 130
+    print(f"Backfill done: {summary['done']} files, {summary['skipped']} skipped, {summary['failed']} failed, "
+          f"{summary['inserted']} records inserted, {summary['deleted']} superseded records deleted")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,478 @@
+ ##############################################################################
+ # @file           : gs_service.py
+ # @brief          : Local stand-in for the GS service (SpaceComms). Answers
+ #                   CPCommand, BeaconListen, UpdateRadio, UpdateAESKey and
+ #                   RadioConn on ws://127.0.0.1:6660 from synthetic OBC files
+ #                   and beacons, with configurable RTT, bandwidth, loss and
+ #                   injected errors, so the whole stack can be load and
+ #                   latency tested without a pass.
+ #
+ #                   Run from the MOC directory:
+ #                   python3 -m simulator.gs_service
+ ##############################################################################
+
+
+import argparse
+import base64
+import json
+import os
+import random
+import socketserver
+import struct
+import sys
+import threading
+import time
+from benchmarks import synthetic
+from layer_1.parsing.beacon_parser.realtime_beacon_parser import BinaryFrameReader, FRAMING_LENGTH
+from layer_1.web_socket_api.constants import CommandType, TripType
+from simulator.websocket_server import WebSocketConnection, WebSocketClosed, handshake
+
+# @var DEFAULT_HOST, DEFAULT_PORT Where WebSocketClient expects the GS service.
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 6660
+
+FP_GATEWAYS = {CommandType.OBC_FP_GATEWAY, CommandType.UHF_FP_GATEWAY}
+FP_HEADER = struct.Struct("<HIHB")
+FP_RESPONSE_BIT = 0x80000000
+OBC_PROTOCOL_ID = 14
+FP_GET_UPTIME = 0x18
+UPTIME_INFO = struct.Struct("<IBBB")
+
+# File download requests are 5 reserved bytes followed by the 0 terminated name
+FILE_REQUEST_NAME_OFFSET = 5
+
+
+class SimulatedError(Exception):
+    """Turned into an Error response, like the GS service reports failed commands"""
+
+
+# @brief Link conditions applied to everything the simulator sends.
+#
+# @param rtt Seconds between a request and its response.
+# @param bandwidth Bytes per second of the radio link, shared by all transfers. None for unlimited.
+#        Applies to the payload of command results, not to the JSON around it.
+# @param loss Probability that a command gets no response (an Error follows after the
+#        command timeout, as from the GS service) or that a beacon is dropped.
+# @param error_rate Probability that a message is answered with an Error right away.
+# @param disconnect_rate Probability that the connection is dropped instead of answering.
+# @param seed Seed of the random generator, for reproducible runs.
+
+class Impairments:
+    def __init__(self, rtt: float = 0.0, bandwidth: float = None, loss: float = 0.0,
+                 error_rate: float = 0.0, disconnect_rate: float = 0.0, seed=None):
+        self.rtt = rtt
+        self.bandwidth = bandwidth
+        self.loss = loss
+        self.error_rate = error_rate
+        self.disconnect_rate = disconnect_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.link_free_at = 0.0
+
+    def roll(self, probability: float) -> bool:
+        if probability <= 0:
+            return False
+        with self.lock:
+            return self.rng.random() < probability
+
+    # Blocks for the time nbytes take over the link, queued behind transfers already on it
+    def transmit(self, nbytes: int):
+        if not self.bandwidth:
+            return
+        with self.lock:
+            start = max(time.monotonic(), self.link_free_at)
+            self.link_free_at = start + nbytes / self.bandwidth
+            done_at = self.link_free_at
+        time.sleep(max(0.0, done_at - time.monotonic()))
+
+    def __str__(self):
+        bandwidth = f"{self.bandwidth:.0f} B/s" if self.bandwidth else "unlimited"
+        return (f'Impairments> rtt: {self.rtt * 1000:.0f} ms | bandwidth: {bandwidth} | loss: {self.loss:.1%} | '
+                f'errors: {self.error_rate:.1%} | disconnects: {self.disconnect_rate:.1%}')
+
+
+# @brief Files the simulated OBC serves, DIRLIST.TXT is generated from them.
+
+class ObcFiles:
+    def __init__(self, files: dict):
+        self.files = dict(files)
+
+    # @brief Generates .TLM files the telemetry parser accepts and random instrument files.
+    #
+    # @param tlm_files Number of NNNNN.TLM files.
+    # @param messages_per_file Telemetry messages in every .TLM file.
+    # @param instrument_files Number of 000NN.IHK/.PMT/.ERP files of each kind.
+
+    @classmethod
+    def synthetic(cls, tlm_files: int = 10, messages_per_file: int = 200, instrument_files: int = 3,
+                  instrument_size: int = 4096, seed: int = 0):
+        rng = random.Random(seed)
+        files = {}
+        for i in range(tlm_files):
+            start_time = 1735689600 + i * messages_per_file * 10
+            files[f"{i:05d}.TLM"] = synthetic.tlm_file(messages_per_file, seed=seed + i, start_time=start_time)
+        for i in range(instrument_files):
+            for extension in ("IHK", "PMT", "ERP"):
+                files[f"{i:05d}.{extension}"] = bytes(rng.getrandbits(8) for _ in range(instrument_size))
+        return cls(files)
+
+    # @brief Serves the files of a directory, e.g. a copy of downloaded_files.
+    @classmethod
+    def from_directory(cls, path: str):
+        files = {}
+        for name in sorted(os.listdir(path)):
+            file_path = os.path.join(path, name)
+            if os.path.isfile(file_path) and name != "DIRLIST.TXT":
+                with open(file_path, "rb") as f:
+                    files[name] = f.read()
+        return cls(files)
+
+    # @brief Renders the listing the way the OBC's FATFS writes DIRLIST.TXT.
+    def dirlist(self) -> bytes:
+        lines = ["----- FATFS RevID.86604 -----", "--- Name ---    --- size ---", f"{'DIRLIST.TXT':>12}    0 B"]
+        for name, data in self.files.items():
+            lines.append(f"{name:>12}    {len(data)} B")
+        return ("\r\n".join(lines) + "\r\n").encode("ISO-8859-1")
+
+    def get(self, name: str):
+        if name == "DIRLIST.TXT":
+            return self.dirlist()
+        return self.files.get(name)
+
+
+# @brief Endless supply of beacons with a running consecutive number.
+#
+# @details The beacons are cycled, their consecutive number is rewritten so it
+#          keeps counting across the cycles like the satellite's does.
+
+class BeaconSource:
+    def __init__(self, beacons: list):
+        if not beacons:
+            raise ValueError("No beacons to send")
+        self.beacons = beacons
+        self.lock = threading.Lock()
+        self.index = 0
+
+    @classmethod
+    def synthetic(cls, num_messages: int = 2000, seed: int = 0):
+        return cls(synthetic.beacon_stream(num_messages, seed=seed))
+
+    # @brief Replays a capture of length prefixed beacons, as written by encode_frames().
+    @classmethod
+    def from_capture(cls, path: str):
+        with open(path, "rb") as f:
+            return cls(list(BinaryFrameReader(f, FRAMING_LENGTH).frames()))
+
+    def next(self) -> bytes:
+        with self.lock:
+            beacon = bytearray(self.beacons[self.index % len(self.beacons)])
+            beacon[0] = self.index % 256
+            self.index += 1
+        return bytes(beacon)
+
+
+# @brief Counters of everything the simulator did.
+
+class SimulatorStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+
+    def increment(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def get(self, name: str) -> int:
+        return self.counters.get(name, 0)
+
+    def __str__(self):
+        with self.lock:
+            counters = sorted(self.counters.items())
+        return "SimulatorStats> " + " | ".join(f"{name}: {value}" for name, value in counters)
+
+
+def decode_payload(payload) -> bytes:
+    if isinstance(payload, str):
+        return base64.b64decode(payload)
+    return bytes(payload)
+
+
+class GsServiceHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        simulator = self.server.simulator
+        try:
+            handshake(self.rfile, self.connection)
+        except (WebSocketClosed, OSError):
+            return
+
+        connection = WebSocketConnection(self.connection, self.rfile)
+        stop = threading.Event()
+        simulator.opened(connection)
+        try:
+            while not simulator.stopping.is_set():
+                opcode, data = connection.recv_message()
+                try:
+                    message = json.loads(data)
+                except ValueError:
+                    simulator.reply_error(connection, None, "Message is not valid JSON")
+                    continue
+                simulator.handle_message(connection, message, stop)
+        except (WebSocketClosed, OSError):
+            pass
+        finally:
+            stop.set()
+            simulator.closed(connection)
+
+
+class GsServiceServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+# @brief The simulated GS service.
+#
+# @details Every connection is served on its own thread. CPCommand is answered
+#          with a CPCommandResult: file downloads from the ObcFiles, FP gateway
+#          requests with an FP header echo (plus an UptimeInfo for getUptime).
+#          BeaconListen streams Beacon messages every beacon_interval seconds until
+#          the connection closes, 0 sends them as fast as possible. Impairments
+#          apply to every response.
+#
+# @param files ObcFiles to serve, synthetic ones by default.
+# @param beacons BeaconSource to stream, synthetic beacons by default.
+# @param beacon_interval Seconds between beacons.
+# @param impairments Impairments of the link, none by default.
+# @param command_timeout Seconds before a lost command is reported with an Error.
+
+class GsServiceSimulator:
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, files: ObcFiles = None,
+                 beacons: BeaconSource = None, beacon_interval: float = 1.0, impairments: Impairments = None,
+                 command_timeout: float = 5.0):
+        self.host = host
+        self.port = port
+        self.files = files if files is not None else ObcFiles.synthetic()
+        self.beacons = beacons if beacons is not None else BeaconSource.synthetic()
+        self.beacon_interval = beacon_interval
+        self.impairments = impairments if impairments is not None else Impairments()
+        self.command_timeout = command_timeout
+        self.stats = SimulatorStats()
+        self.radio = {}
+        self.started_at = time.monotonic()
+        self.stopping = threading.Event()
+        self.connections = set()
+        self.connections_lock = threading.Lock()
+        self.server = None
+        self.thread = None
+        self.handlers = {
+            "CPCommand": self.on_cp_command,
+            "BeaconListen": self.on_beacon_listen,
+            "UpdateRadio": self.on_update_radio,
+            "UpdateAESKey": self.on_update_aes_key,
+            "RadioConn": self.on_radio_conn,
+        }
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, type, value, traceback):
+        self.stop()
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}"
+
+    # @brief Starts serving on a background thread, returns the simulator.
+    def start(self):
+        self.server = GsServiceServer((self.host, self.port), GsServiceHandler)
+        self.server.simulator = self
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name="gs-simulator", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopping.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        with self.connections_lock:
+            connections = list(self.connections)
+        for connection in connections:
+            connection.abort()
+
+    def opened(self, connection):
+        self.stats.increment("connections")
+        with self.connections_lock:
+            self.connections.add(connection)
+
+    def closed(self, connection):
+        with self.connections_lock:
+            self.connections.discard(connection)
+
+    def reply(self, connection, message: dict):
+        connection.send(json.dumps(message))
+
+    def reply_error(self, connection, message_id, error: str):
+        self.stats.increment("errors")
+        self.reply(connection, {"type": "Error", "id": message_id, "message": error})
+
+    # @brief Applies the impairments that can hit any message, then dispatches it.
+    def handle_message(self, connection, message: dict, stop):
+        message_type = message.get("type")
+        self.stats.increment(f"received_{message_type}")
+        handler = self.handlers.get(message_type)
+        if handler is None:
+            self.reply_error(connection, message.get("id"), f"Unknown message type {message_type}")
+            return
+
+        if self.impairments.roll(self.impairments.disconnect_rate):
+            self.stats.increment("disconnects_injected")
+            connection.abort()
+            raise WebSocketClosed("Disconnect injected")
+        if self.impairments.roll(self.impairments.error_rate):
+            self.stats.increment("errors_injected")
+            time.sleep(self.impairments.rtt)
+            self.reply_error(connection, message.get("id"), "Injected error")
+            return
+        handler(connection, message, stop)
+
+    def on_cp_command(self, connection, message: dict, stop):
+        message_id = message.get("id")
+        try:
+            payload = decode_payload(message.get("payload", []))
+            response = self.run_command(message.get("cmdType"), payload)
+        except (SimulatedError, ValueError, struct.error) as exc:
+            time.sleep(self.impairments.rtt)
+            self.reply_error(connection, message_id, str(exc))
+            return
+
+        if message.get("tripType") == TripType.NO_WAIT_FOR_RESPONSE:
+            response = b""
+        elif self.impairments.roll(self.impairments.loss):
+            self.stats.increment("commands_lost")
+            if not stop.wait(self.command_timeout):
+                self.reply_error(connection, message_id, "No response from the satellite")
+            return
+
+        time.sleep(self.impairments.rtt)
+        self.impairments.transmit(len(response))
+        self.stats.increment("command_bytes", len(response))
+        self.reply(connection, {
+            "type": "CPCommandResult",
+            "id": message_id,
+            "cmdId": message.get("cmdId", message_id),
+            "payload": base64.b64encode(response).decode("ascii"),
+        })
+
+    # @brief Returns the response payload of a command, as the satellite would send it.
+    def run_command(self, command_type: int, payload: bytes) -> bytes:
+        if command_type == CommandType.OBC_FILE_DOWNLOAD:
+            name = payload[FILE_REQUEST_NAME_OFFSET:].split(b"\0", 1)[0].decode("utf-8", "replace")
+            data = self.files.get(name)
+            if data is None:
+                raise SimulatedError(f"File {name} not found")
+            self.stats.increment("files_served")
+            return data
+
+        if command_type in FP_GATEWAYS:
+            # FP requests carry a one byte length prefix
+            proto_id, func_id, seq_id, _ = FP_HEADER.unpack_from(payload, 1)
+            body = b""
+            if proto_id == OBC_PROTOCOL_ID and func_id == FP_GET_UPTIME:
+                seconds = int(time.monotonic() - self.started_at)
+                body = UPTIME_INFO.pack(seconds // 86400, seconds // 3600 % 24, seconds // 60 % 60, seconds % 60)
+            return FP_HEADER.pack(proto_id, func_id | FP_RESPONSE_BIT, seq_id, 0) + body
+
+        return b""
+
+    def on_beacon_listen(self, connection, message: dict, stop):
+        thread = threading.Thread(target=self.stream_beacons, args=(connection, message.get("id"), stop),
+                                  name="gs-simulator-beacons", daemon=True)
+        thread.start()
+
+    def stream_beacons(self, connection, request_id, stop):
+        next_at = time.monotonic() + self.impairments.rtt
+        try:
+            while not stop.is_set() and not self.stopping.is_set():
+                if self.beacon_interval:
+                    if stop.wait(max(0.0, next_at - time.monotonic())):
+                        break
+                    next_at += self.beacon_interval
+                beacon = self.beacons.next()
+
+                if self.impairments.roll(self.impairments.loss):
+                    self.stats.increment("beacons_lost")
+                elif self.impairments.roll(self.impairments.disconnect_rate):
+                    self.stats.increment("disconnects_injected")
+                    connection.abort()
+                    return
+                elif self.impairments.roll(self.impairments.error_rate):
+                    self.stats.increment("errors_injected")
+                    self.reply_error(connection, request_id, "Injected error")
+                else:
+                    self.reply(connection, {"type": "Beacon", "requestId": request_id,
+                                            "ax25Frame": base64.b64encode(beacon).decode("ascii")})
+                    self.stats.increment("beacons_sent")
+        except WebSocketClosed:
+            pass
+
+    def on_update_radio(self, connection, message: dict, stop):
+        self.radio["uplinkFrequency"] = message.get("uplinkFrequency")
+        self.radio["downlinkFrequency"] = message.get("downlinkFrequency")
+        time.sleep(self.impairments.rtt)
+        self.reply(connection, {"type": "RadioResult", "id": message.get("id")})
+
+    def on_update_aes_key(self, connection, message: dict, stop):
+        self.radio["aesIV"] = message.get("aesIV")
+        self.radio["aesKey"] = message.get("aesKey")
+        time.sleep(self.impairments.rtt)
+        self.reply(connection, {"type": "RadioResult", "id": message.get("id")})
+
+    def on_radio_conn(self, connection, message: dict, stop):
+        self.radio["remoteRadioMac"] = message.get("remoteRadioMac")
+        time.sleep(self.impairments.rtt)
+        self.reply(connection, {"type": "RadioConnResult", "id": message.get("id")})
+
+
+def main(argv=None) -> int:
+    arg_parser = argparse.ArgumentParser(description="Simulate the GS service on a local WebSocket")
+    arg_parser.add_argument("--host", default=DEFAULT_HOST)
+    arg_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    arg_parser.add_argument("--rtt", type=float, default=0.0, help="round trip time in seconds")
+    arg_parser.add_argument("--bandwidth", type=float, help="link bandwidth in bytes per second")
+    arg_parser.add_argument("--loss", type=float, default=0.0, help="probability a command or beacon is lost")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="probability of an Error response")
+    arg_parser.add_argument("--disconnect-rate", type=float, default=0.0, help="probability of dropping the connection")
+    arg_parser.add_argument("--seed", type=int, help="seed for reproducible impairments")
+    arg_parser.add_argument("--command-timeout", type=float, default=5.0, help="seconds before a lost command errors")
+    arg_parser.add_argument("--beacon-interval", type=float, default=1.0, help="seconds between beacons, 0 for no pause")
+    arg_parser.add_argument("--beacons", help="length framed beacon capture to replay instead of synthetic beacons")
+    arg_parser.add_argument("--files", help="directory of files to serve instead of synthetic ones")
+    arg_parser.add_argument("--tlm-files", type=int, default=10, help="synthetic .TLM files")
+    arg_parser.add_argument("--tlm-messages", type=int, default=200, help="messages per synthetic .TLM file")
+    args = arg_parser.parse_args(argv)
+
+    files = ObcFiles.from_directory(args.files) if args.files else ObcFiles.synthetic(args.tlm_files, args.tlm_messages)
+    beacons = BeaconSource.from_capture(args.beacons) if args.beacons else BeaconSource.synthetic()
+    impairments = Impairments(args.rtt, args.bandwidth, args.loss, args.error_rate, args.disconnect_rate, args.seed)
+    simulator = GsServiceSimulator(args.host, args.port, files=files, beacons=beacons,
+                                   beacon_interval=args.beacon_interval, impairments=impairments,
+                                   command_timeout=args.command_timeout)
+
+    simulator.start()
+    print(f"GS service simulator on {simulator.url} serving {len(files.files)} files")
+    print(impairments)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+        print(simulator.stats)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
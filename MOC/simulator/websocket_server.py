@@ -0,0 +1,180 @@
+ ##############################################################################
+ # @file           : websocket_server.py
+ # @brief          : Minimal RFC 6455 WebSocket server side, standard library
+ #                   only. Enough of the protocol for the GS service simulator:
+ #                   the opening handshake, masked client frames, fragmented
+ #                   messages, ping/pong and the closing handshake.
+ ##############################################################################
+
+import base64
+import hashlib
+import socket
+import struct
+import threading
+
+# GUID appended to Sec-WebSocket-Key to build Sec-WebSocket-Accept
+HANDSHAKE_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OPCODE_CONTINUATION = 0x0
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+# @var MAX_MESSAGE_SIZE Largest message accepted from a client, bigger ones close the connection.
+
+MAX_MESSAGE_SIZE = 16 << 20
+
+MAX_HEADER_SIZE = 16 << 10
+
+
+class WebSocketClosed(Exception):
+    """The peer closed the connection, or it was lost"""
+
+
+def accept_key(key: str) -> str:
+    digest = hashlib.sha1((key + HANDSHAKE_GUID).encode("ascii")).digest()
+    return base64.b64encode(digest).decode("ascii")
+
+
+# @brief Reads the HTTP upgrade request from rfile and answers it.
+#
+# @return The request headers, lower case names.
+# @throws WebSocketClosed If the request is not a WebSocket upgrade.
+
+def handshake(rfile, sock) -> dict:
+    request_line = rfile.readline(MAX_HEADER_SIZE)
+    headers = {}
+    size = len(request_line)
+    while True:
+        line = rfile.readline(MAX_HEADER_SIZE)
+        size += len(line)
+        if not line or size > MAX_HEADER_SIZE:
+            raise WebSocketClosed("Incomplete handshake")
+        if line in (b"\r\n", b"\n"):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    key = headers.get("sec-websocket-key")
+    if not request_line.startswith(b"GET ") or headers.get("upgrade", "").lower() != "websocket" or not key:
+        sock.sendall(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+        raise WebSocketClosed("Not a WebSocket upgrade request")
+
+    sock.sendall(("HTTP/1.1 101 Switching Protocols\r\n"
+                  "Upgrade: websocket\r\n"
+                  "Connection: Upgrade\r\n"
+                  f"Sec-WebSocket-Accept: {accept_key(key)}\r\n\r\n").encode("ascii"))
+    return headers
+
+
+# @brief Builds an unmasked (server to client) frame.
+
+def encode_frame(opcode: int, payload: bytes, fin: bool = True) -> bytes:
+    first = (0x80 if fin else 0) | opcode
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", first, length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", first, 126, length)
+    else:
+        header = struct.pack("!BBQ", first, 127, length)
+    return header + payload
+
+
+# @brief Server side of one WebSocket connection.
+#
+# @details recv_message() returns whole data messages, answering pings and
+#          closes on the way. send() may be called from several threads, frames
+#          are written under a lock.
+
+class WebSocketConnection:
+    def __init__(self, sock, rfile):
+        self.sock = sock
+        self.rfile = rfile
+        self.send_lock = threading.Lock()
+        self.closed = False
+
+    def _read_exact(self, size: int) -> bytes:
+        data = self.rfile.read(size)
+        if data is None or len(data) < size:
+            raise WebSocketClosed("Connection lost")
+        return data
+
+    def _read_frame(self):
+        first, second = self._read_exact(2)
+        fin = bool(first & 0x80)
+        opcode = first & 0x0F
+        length = second & 0x7F
+        if length == 126:
+            (length,) = struct.unpack("!H", self._read_exact(2))
+        elif length == 127:
+            (length,) = struct.unpack("!Q", self._read_exact(8))
+        if length > MAX_MESSAGE_SIZE:
+            self.close(1009)
+            raise WebSocketClosed(f"Frame of {length} bytes is too large")
+
+        # Client frames are always masked
+        mask = self._read_exact(4) if second & 0x80 else None
+        payload = self._read_exact(length)
+        if mask is not None and length:
+            key = int.from_bytes((mask * (length // 4 + 1))[:length], "big")
+            payload = (int.from_bytes(payload, "big") ^ key).to_bytes(length, "big")
+        return fin, opcode, payload
+
+    # @brief Returns the next data message as (opcode, payload).
+    #
+    # @throws WebSocketClosed Once the connection is closed by either side.
+
+    def recv_message(self):
+        fragments = []
+        message_opcode = None
+        while True:
+            fin, opcode, payload = self._read_frame()
+            if opcode == OPCODE_PING:
+                self.send(payload, OPCODE_PONG)
+                continue
+            if opcode == OPCODE_PONG:
+                continue
+            if opcode == OPCODE_CLOSE:
+                self.close(1000)
+                raise WebSocketClosed("Closed by client")
+
+            if opcode != OPCODE_CONTINUATION:
+                message_opcode = opcode
+            fragments.append(payload)
+            if fin:
+                return message_opcode, b"".join(fragments)
+
+    def send(self, data, opcode: int = OPCODE_TEXT):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        frame = encode_frame(opcode, data)
+        with self.send_lock:
+            if self.closed:
+                raise WebSocketClosed("Connection closed")
+            try:
+                self.sock.sendall(frame)
+            except OSError as exc:
+                self.closed = True
+                raise WebSocketClosed(str(exc)) from exc
+
+    def close(self, code: int = 1000):
+        with self.send_lock:
+            if self.closed:
+                return
+            self.closed = True
+            try:
+                self.sock.sendall(encode_frame(OPCODE_CLOSE, struct.pack("!H", code)))
+            except OSError:
+                pass
+
+    # Drops the TCP connection without a closing handshake, like a lost link
+    def abort(self):
+        with self.send_lock:
+            self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass